@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 
-import requests
 import os
 import argparse
 import json
 import re
-import yt_dlp
-from moviepy.editor import VideoFileClip
 import subprocess
 import sys
 import logging
+from video_ids import canonical_video_id
+import chapter_parser
+import downloaders
+import encoder_profiles
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -39,8 +40,9 @@ def manually_parse_duration(duration_str):
 
 def get_video_info(api_key, video_url):
     try:
-        video_id = video_url.split("=")[-1]
+        video_id = canonical_video_id(video_url)
         url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails&id={video_id}&key={api_key}"
+        import requests
         response = requests.get(url)
         response_json = response.json()
 
@@ -66,24 +68,16 @@ def load_intervals_from_file(file_path):
         print(f"Error reading intervals file: {e}")
     return None
 
-def download_video(url, output_dir='.'):
-    print(f"Starting to download video from {url}")
-    ydl_opts = {
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-        'outtmpl': os.path.join(output_dir, 'downloaded_video.%(ext)s'),
-        'merge_output_format': 'mp4'
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
-    return os.path.join(output_dir, 'downloaded_video.mp4')
-
 def convert_time_str_to_seconds(time_str):
     if time_str == 'end':
         return None
-    h, m, s = [int(part) for part in time_str.split(':')]
+    parts = [float(part) for part in time_str.split(':')]
+    if len(parts) == 2:
+        parts.insert(0, 0)
+    h, m, s = parts
     return h * 3600 + m * 60 + s
 
-def trim_video(source_file, start_time, end_time, output_filename, output_dir, video_duration):
+def trim_video(source_file, start_time, end_time, output_filename, output_dir, video_duration, profile=None):
     output_path = os.path.join(output_dir, output_filename)
 
     if os.path.exists(output_path):
@@ -94,9 +88,10 @@ def trim_video(source_file, start_time, end_time, output_filename, output_dir, v
         start_seconds = convert_time_str_to_seconds(start_time)
         end_seconds = convert_time_str_to_seconds(end_time) if end_time else video_duration
 
+        from moviepy.editor import VideoFileClip
         with VideoFileClip(source_file) as video:
             trimmed_video = video.subclip(start_seconds, end_seconds)
-            trimmed_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            trimmed_video.write_videofile(output_path, **encoder_profiles.moviepy_kwargs(profile or encoder_profiles.get_profile()))
             print(f"Video trimmed successfully: {output_filename}")
     except Exception as e:
         print(f"Error in trimming video: {e}")
@@ -108,15 +103,13 @@ def extract_segments(api_key, url):
         print("No description available for video.")
         return None, None, None
 
-    # Regex to find timestamps and titles in the description
-    pattern = re.compile(r'(\d{1,2}:\d{2})\s*-?\s*(.*?)\s*(?=\d{1,2}:\d{2}|\Z)')
-    matches = pattern.findall(description)
+    # Find timestamped chapter lines in the description
+    chapters = chapter_parser.parse_chapters(description, video_duration)
 
-    # If matches are found in the description, use them
-    if matches:
-        timestamps = [match[0] for match in matches]
-        titles = [match[1] for match in matches]
-        intervals = [(timestamps[i], timestamps[i+1] if i+1 < len(timestamps) else "end", titles[i]) for i in range(len(timestamps))]
+    # If chapters are found in the description, use them
+    if chapters:
+        intervals = chapter_parser.chapters_to_intervals(chapters)
+        titles = [title for _, _, title in chapters]
         return intervals, titles, video_title, video_duration
     else:
         print("No chapters found in description. Attempting to extract chapters using Selenium.")
@@ -155,8 +148,8 @@ def setup_output_directory(video_title):
         os.makedirs(output_directory)
     return output_directory
 
-def process_videos(source, intervals, output_dir, video_duration, use_local=False, titles=None):
-    source_file = source if use_local else download_video(source, output_dir)
+def process_videos(source, intervals, output_dir, video_duration, use_local=False, titles=None, profile=None):
+    source_file = source if use_local else downloaders.download(source, output_dir)
     if not source_file:
         print("Source video could not be retrieved.")
         return
@@ -168,7 +161,7 @@ def process_videos(source, intervals, output_dir, video_duration, use_local=Fals
         start, end, _ = interval
         title = sanitize_filename(interval[2])  # Use the third element of the interval as the title
         output_filename = f"{title}.mp4"
-        trim_video(source_file, start, end, output_filename, output_dir, video_duration)
+        trim_video(source_file, start, end, output_filename, output_dir, video_duration, profile=profile)
 
     if not use_local:
         print(f"Removing original downloaded file: {source_file}")
@@ -179,6 +172,8 @@ def main():
     parser = argparse.ArgumentParser(description='Download and segment YouTube videos based on descriptions or chapters.')
     parser.add_argument('-url', type=str, help='URL of the YouTube video', required=True)
     parser.add_argument('-api_key', type=str, help='YouTube Data API key', required=True)
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile trading speed against quality and size')
+    parser.add_argument('-threads', type=int, default=None, help='Encoder threads (defaults to the profile setting)')
     args = parser.parse_args()
 
     video_description, video_title, video_duration = get_video_info(args.api_key, args.url)
@@ -192,7 +187,7 @@ def main():
         return
 
     output_directory = setup_output_directory(video_title)
-    process_videos(args.url, intervals, output_directory, video_duration, use_local=False, titles=titles)
+    process_videos(args.url, intervals, output_directory, video_duration, use_local=False, titles=titles, profile=encoder_profiles.get_profile(args.profile, args.threads))
 
 if __name__ == "__main__":
     main()
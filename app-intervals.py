@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 
-import requests
 import os
 import argparse
 import json
 import re
-import yt_dlp
-from moviepy.editor import VideoFileClip
+from video_ids import canonical_video_id
+import chapter_parser
+import downloaders
+import encoder_profiles
+import planner
 
 def sanitize_filename(name):
     return re.sub(r'[^\w\-_\. ]', '_', name)
@@ -28,8 +30,9 @@ def manually_parse_duration(duration_str):
 
 def get_video_info(api_key, video_url):
     try:
-        video_id = video_url.split("=")[-1]
+        video_id = canonical_video_id(video_url)
         url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails&id={video_id}&key={api_key}"
+        import requests
         response = requests.get(url)
         response_json = response.json()
 
@@ -51,17 +54,6 @@ def load_intervals_from_file(file_path):
         print(f"Error reading intervals file: {e}")
     return None
 
-def download_video(url, output_dir='.'):
-    print(f"Starting to download video from {url}")
-    ydl_opts = {
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-        'outtmpl': os.path.join(output_dir, 'downloaded_video.%(ext)s'),
-        'merge_output_format': 'mp4'
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
-    return os.path.join(output_dir, 'downloaded_video.mp4')
-
 def convert_time_str_to_seconds(time_str):
     parts = time_str.split(':')
     try:
@@ -71,7 +63,7 @@ def convert_time_str_to_seconds(time_str):
             h, m, s = 0, parts[0], parts[1]
         else:
             raise ValueError("Invalid time format")
-        seconds = int(h) * 3600 + int(m) * 60 + int(s)
+        seconds = int(h) * 3600 + int(m) * 60 + float(s)
         return seconds
     except ValueError as e:
         print(f"Error converting time string '{time_str}' to seconds: {e}")
@@ -79,7 +71,7 @@ def convert_time_str_to_seconds(time_str):
 
 
 
-def trim_video(source_file, start_time, end_time, output_filename, output_dir, video_duration):
+def trim_video(source_file, start_time, end_time, output_filename, output_dir, video_duration, profile=None):
     output_path = os.path.join(output_dir, output_filename)
 
     if os.path.exists(output_path):
@@ -90,9 +82,10 @@ def trim_video(source_file, start_time, end_time, output_filename, output_dir, v
         start_seconds = convert_time_str_to_seconds(start_time)
         end_seconds = convert_time_str_to_seconds(end_time) if end_time else video_duration
 
+        from moviepy.editor import VideoFileClip
         with VideoFileClip(source_file) as video:
             trimmed_video = video.subclip(start_seconds, end_seconds)
-            trimmed_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            trimmed_video.write_videofile(output_path, **encoder_profiles.moviepy_kwargs(profile or encoder_profiles.get_profile()))
             print(f"Video trimmed successfully: {output_filename}")
     except Exception as e:
         print(f"Error in trimming video for interval {start_time} to {end_time} ({output_filename}): {e}")
@@ -116,22 +109,23 @@ def load_intervals_from_json(file_path):
         print(f"Error reading intervals JSON file: {e}")
         return []
 
-def setup_output_directory(video_title, custom_output_dir=None):
+def setup_output_directory(video_title, custom_output_dir=None, output_root=None):
     if custom_output_dir:
         output_directory = os.path.abspath(custom_output_dir)
     else:
+        output_root = output_root or os.getcwd()
         sanitized_title = sanitize_filename(video_title)
-        output_directory = os.path.join(os.getcwd(), sanitized_title)
+        output_directory = os.path.join(output_root, sanitized_title)
         counter = 1
         while os.path.exists(output_directory):
-            output_directory = os.path.join(os.getcwd(), f"{sanitized_title}_{counter}")
+            output_directory = os.path.join(output_root, f"{sanitized_title}_{counter}")
             counter += 1
 
     os.makedirs(output_directory, exist_ok=True)
     return output_directory
 
-def process_videos(source, intervals, output_dir, video_duration, use_local=False, titles=None):
-    source_file = source if use_local else download_video(source, output_dir)
+def process_videos(source, intervals, output_dir, video_duration, use_local=False, titles=None, profile=None):
+    source_file = source if use_local else downloaders.download(source, output_dir)
     if not source_file:
         print("Source video could not be retrieved.")
         return
@@ -148,7 +142,7 @@ def process_videos(source, intervals, output_dir, video_duration, use_local=Fals
         start, end, title = interval
         sanitized_title = sanitize_filename(title)
         output_filename = f"{sanitized_title}.mp4"
-        trim_video(source_file, start, end, output_filename, output_dir, video_duration)
+        trim_video(source_file, start, end, output_filename, output_dir, video_duration, profile=profile)
 
 
     if not use_local:
@@ -162,13 +156,20 @@ def main():
     parser.add_argument('-local_video', type=str, help='Path to the local video file', required=False)
     parser.add_argument('-intervals_file', type=str, help='Path to the intervals JSON file', required=False)
     parser.add_argument('-output_dir', type=str, help='Path for the output directory', required=False, default=None)
+    parser.add_argument('-intervals_path', type=str, help='Path to the JSON file containing time intervals', required=False)
+    parser.add_argument('-download_only', action='store_true', help='Only download the video without trimming it')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile trading speed against quality and size')
+    parser.add_argument('-threads', type=int, default=None, help='Encoder threads (defaults to the profile setting)')
     args = parser.parse_args()
 
     # Check if local video processing is requested
     if args.local_video and args.intervals_file:
-        intervals = load_intervals_from_json(args.intervals_file)
+        plan = planner.plan_job("Local_Video", load_intervals_from_json(args.intervals_file), None)
+        for issue in plan['issues']:
+            print(f"Interval issue: {issue}")
+        intervals = chapter_parser.chapters_to_intervals(plan['intervals'], open_end=None)
         output_directory = setup_output_directory("Local_Video", custom_output_dir=args.output_dir)
-        process_videos(args.local_video, intervals, output_directory, None, use_local=True)
+        process_videos(args.local_video, intervals, output_directory, None, use_local=True, profile=encoder_profiles.get_profile(args.profile, args.threads))
     elif args.url and args.api_key:
         video_description, video_title, video_duration = get_video_info(args.api_key, args.url)
         if video_duration is None:
@@ -178,7 +179,7 @@ def main():
         output_directory = setup_output_directory(video_title, custom_output_dir=args.output_dir)
 
         if args.download_only:
-            download_video(args.url, output_directory)
+            downloaders.download(args.url, output_directory)
             print(f"Video downloaded to {output_directory}")
         else:
             if args.intervals_path:
@@ -186,7 +187,7 @@ def main():
                 if not intervals:
                     print("Error loading intervals. Exiting.")
                     return
-                process_videos(args.url, intervals, output_directory, video_duration, use_local=False, titles=None)
+                process_videos(args.url, intervals, output_directory, video_duration, use_local=False, titles=None, profile=encoder_profiles.get_profile(args.profile, args.threads))
             else:
                 print("No intervals path provided. Exiting.")
                 return
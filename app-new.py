@@ -1,40 +1,29 @@
 #!/usr/bin/env python3
 
-from pytube import YouTube
-from moviepy.editor import VideoFileClip
 import os
 import argparse
 import json
+import downloaders
+import encoder_profiles
 
-def download_video(url):
-    print(f"Starting to download video from {url}")
-    try:
-        yt = YouTube(url)
-        stream = yt.streams.get_highest_resolution()
-        stream.download(filename='downloaded_video.mp4')
-        print("Video downloaded successfully.")
-        return 'downloaded_video.mp4'
-    except Exception as e:
-        print(f"Error in downloading video: {e}")
-        raise
-
-def trim_video(source_file, start_time, end_time, output_filename):
+def trim_video(source_file, start_time, end_time, output_filename, profile=None):
     print(f"Trimming video from {start_time} to {end_time}, saving as {output_filename}")
     try:
+        from moviepy.editor import VideoFileClip
         with VideoFileClip(source_file) as video:
             trimmed_video = video.subclip(start_time, end_time)
-            trimmed_video.write_videofile(output_filename)
+            trimmed_video.write_videofile(output_filename, **encoder_profiles.moviepy_kwargs(profile or encoder_profiles.get_profile()))
         print(f"Video trimmed successfully: {output_filename}")
     except Exception as e:
         print(f"Error in trimming video: {e}")
         raise
 
-def process_videos(source, intervals, use_local=False):
-    source_file = source if use_local else download_video(source)
+def process_videos(source, intervals, use_local=False, profile=None):
+    source_file = source if use_local else downloaders.download(source)
 
     for i, (start, end) in enumerate(intervals):
         output_filename = f'trimmed_video_{i}.mp4'
-        trim_video(source_file, start, end, output_filename)
+        trim_video(source_file, start, end, output_filename, profile=profile)
 
     if not use_local:
         print(f"Removing original downloaded file: {source_file}")
@@ -45,6 +34,8 @@ def main():
     parser = argparse.ArgumentParser(description='Download and trim YouTube videos.')
     parser.add_argument('-intervals', type=str, help='Path to the JSON file containing time intervals')
     parser.add_argument('-url', type=str, help='URL of the YouTube video')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile trading speed against quality and size')
+    parser.add_argument('-threads', type=int, default=None, help='Encoder threads (defaults to the profile setting)')
     args = parser.parse_args()
 
     if args.intervals:
@@ -60,7 +51,7 @@ def main():
         raise ValueError("Intervals file is required.")
 
     if args.url:
-        process_videos(args.url, intervals)
+        process_videos(args.url, intervals, profile=encoder_profiles.get_profile(args.profile, args.threads))
     else:
         print("URL is required.")
         raise ValueError("URL is required.")
@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 
-import requests
 import os
 import argparse
 import json
 import re
-from moviepy.editor import VideoFileClip
-from pytube import YouTube
-from pytube.exceptions import AgeRestrictedError
+from video_ids import canonical_video_id
+import chapter_parser
+import downloaders
+import encoder_profiles
 
 def sanitize_filename(name):
     return re.sub(r'[^\w\-_\. ]', '_', name)
@@ -28,7 +28,8 @@ def manually_parse_duration(duration_str):
         return None
 
 def get_video_description(api_key, video_url):
-    video_id = video_url.split("=")[-1]
+    import requests
+    video_id = canonical_video_id(video_url)
     url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails&id={video_id}&key={api_key}"
     response = requests.get(url)
     response_json = response.json()
@@ -42,38 +43,7 @@ def get_video_description(api_key, video_url):
         print("No items found in API response.")
         return None, None, None
 
-def download_video(url, resolution=None, output_dir='.'):
-    print(f"Starting to download video from {url}")
-
-    try:
-        yt = YouTube(url)
-        stream = None
-
-        if resolution:
-            # Filter for streams that include both video and audio
-            stream = yt.streams.filter(progressive=True, file_extension='mp4', res=resolution).first()
-
-        # If the specific resolution is not found, try the best resolution available
-        if not stream:
-            stream = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
-
-        if not stream:
-            raise Exception("No suitable stream found.")
-
-        output_path = os.path.join(output_dir, 'downloaded_video.mp4')
-        stream.download(filename=output_path)
-        print(f"Video downloaded successfully at resolution {stream.resolution}.")
-        return output_path
-    except AgeRestrictedError:
-        print(f"Video {url} is age restricted, skipping.")
-        return None
-    except Exception as e:
-        print(f"Error in downloading video: {e}")
-        raise
-
-
-
-def trim_video(source_file, start_time, end_time, output_filename, output_dir):
+def trim_video(source_file, start_time, end_time, output_filename, output_dir, profile=None):
     output_path = os.path.join(output_dir, output_filename)
 
     if os.path.exists(output_path):
@@ -81,23 +51,24 @@ def trim_video(source_file, start_time, end_time, output_filename, output_dir):
         return
 
     try:
+        from moviepy.editor import VideoFileClip
         with VideoFileClip(source_file) as video:
             trimmed_video = video.subclip(start_time, end_time)
             # Ensure audio is included in the output
-            trimmed_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            trimmed_video.write_videofile(output_path, **encoder_profiles.moviepy_kwargs(profile or encoder_profiles.get_profile()))
             print(f"Video trimmed successfully: {output_filename}")
     except Exception as e:
         print(f"Error in trimming video: {e}")
 
 
-def process_videos(source, intervals, resolution, output_dir, total_duration, use_local=False, titles=None):
-    source_file = source if use_local else download_video(source, resolution, output_dir)
+def process_videos(source, intervals, resolution, output_dir, total_duration, use_local=False, titles=None, profile=None):
+    source_file = source if use_local else downloaders.download(source, output_dir, resolution=resolution)
     for i, interval in enumerate(intervals):
         start, end = interval[:2]
         title = titles[i] if titles else f'trimmed_video_{i}'
         output_filename = f"{sanitize_filename(title)}.mp4"
         # Removed total_duration from the function call
-        trim_video(source_file, start, end, output_filename, output_dir)
+        trim_video(source_file, start, end, output_filename, output_dir, profile=profile)
     if not use_local:
         print(f"Removing original downloaded file: {source_file}")
         os.remove(source_file)
@@ -110,22 +81,15 @@ def extract_segments(api_key, url):
         print("No description available for video.")
         return None, None, None
 
-    pattern = re.compile(r'(\d{1,2}:\d{2})\s*-?\s*(.*?)\s*(?=\d{1,2}:\d{2}|\Z)')
-    matches = pattern.findall(description)
+    chapters = chapter_parser.parse_chapters(description, video_duration)
 
-    if not matches:
+    if not chapters:
         print("No segments found in the description.")
         return None, None, None
 
-    timestamps = [match[0] for match in matches]
-    titles = [match[1] for match in matches]
+    titles = [title for _, _, title in chapters]
 
-    intervals = []
-    for i in range(len(timestamps)):
-        start_time = timestamps[i]
-        end_time = None if i + 1 == len(timestamps) else timestamps[i + 1]
-        title = titles[i]
-        intervals.append((start_time, end_time, title))
+    intervals = chapter_parser.chapters_to_intervals(chapters, open_end=None)
 
     return intervals, titles, video_title, video_duration
 
@@ -136,6 +100,8 @@ def main():
     parser.add_argument('-api_key', type=str, help='YouTube Data API key', required=True)
     parser.add_argument('-resolution', type=str, default=None, help='Resolution of the video (e.g., 720p, 1080p). If not specified, defaults to 720p, then 480p.')
     parser.add_argument('-extract_segments', action='store_true', help='Extract video segments from the video description and use them as intervals.')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile trading speed against quality and size')
+    parser.add_argument('-threads', type=int, default=None, help='Encoder threads (defaults to the profile setting)')
     args = parser.parse_args()
 
     titles = None
@@ -163,7 +129,7 @@ def main():
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    process_videos(args.url, intervals, args.resolution, output_directory, video_duration, titles=titles)
+    process_videos(args.url, intervals, args.resolution, output_directory, video_duration, titles=titles, profile=encoder_profiles.get_profile(args.profile, args.threads))
 
 if __name__ == "__main__":
     main()
@@ -1,45 +1,37 @@
 #!/usr/bin/env python3
 
-import requests
 import os
 import argparse
 import json
 import re
-import yt_dlp
-from moviepy.editor import VideoFileClip
 import subprocess
 import sys
+import youtube_api
+import captions
+import chapter_parser
+import chunked_encode
+import downloaders
+import encoder_profiles
+import fingerprint
+import media
+import planner
+import previews
+import scratch
+import storage
+import verify
+from processed_index import ProcessedIndex
+from video_ids import canonical_video_id, canonical_url
+
 
 def sanitize_filename(name):
     return re.sub(r'[^\w\-_\. ]', '_', name)
 
-def manually_parse_duration(duration_str):
-    try:
-        match = re.match(r'PT(\d+H)?(\d+M)?(\d+S)?', duration_str)
-        hours, minutes, seconds = 0, 0, 0
-        if match.group(1):
-            hours = int(match.group(1)[:-1])
-        if match.group(2):
-            minutes = int(match.group(2)[:-1])
-        if match.group(3):
-            seconds = int(match.group(3)[:-1])
-        return hours * 3600 + minutes * 60 + seconds
-    except Exception as e:
-        print(f"Error in manually parsing duration: {e}")
-        return None
-
 def get_video_info(api_key, video_url):
     try:
-        video_id = video_url.split("=")[-1]
-        url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails&id={video_id}&key={api_key}"
-        response = requests.get(url)
-        response_json = response.json()
-
-        if "items" in response_json and response_json["items"]:
-            video_description = response_json["items"][0]["snippet"]["description"]
-            video_title = response_json["items"][0]["snippet"]["title"]
-            video_duration = manually_parse_duration(response_json["items"][0]["contentDetails"]["duration"])
-            return video_description, video_title, video_duration
+        video_id = canonical_video_id(video_url)
+        details = youtube_api.get_videos_details(api_key, [video_id])
+        if video_id in details:
+            return details[video_id]
     except Exception as e:
         print(f"Error retrieving video info: {e}")
     return None, None, None
@@ -53,55 +45,117 @@ def load_intervals_from_file(file_path):
         print(f"Error reading intervals file: {e}")
     return None
 
-def download_video(url, output_dir='.'):
-    print(f"Starting to download video from {url}")
-    ydl_opts = {
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-        'outtmpl': os.path.join(output_dir, 'downloaded_video.%(ext)s'),
-        'merge_output_format': 'mp4'
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
-    return os.path.join(output_dir, 'downloaded_video.mp4')
-
 def convert_time_str_to_seconds(time_str):
     if time_str == 'end':
         return None
-    h, m, s = [int(part) for part in time_str.split(':')]
+    parts = [float(part) for part in time_str.split(':')]
+    if len(parts) == 2:
+        parts.insert(0, 0)
+    h, m, s = parts
     return h * 3600 + m * 60 + s
 
-def trim_video(source_file, start_time, end_time, output_filename, output_dir, video_duration):
+def trim_video(source_file, start_time, end_time, output_filename, output_dir, video_duration, profile=None,
+               preview_mode=None, verify_output=True, chunk_workers=1, work_dir=None):
+    # Returns the verification result of the output, or None when verification is off. With
+    # chunk_workers > 1, a long interval is split at keyframes and its chunks are encoded in parallel.
+    # Temporary files go to work_dir (the job's scratch directory) when given.
     output_path = os.path.join(output_dir, output_filename)
+    store = storage.get_storage()
 
-    if os.path.exists(output_path):
-        print(f"File '{output_path}' already exists. Skipping.")
-        return
+    if store.exists(output_path):
+        if not verify_output:
+            print(f"File '{output_path}' already exists. Skipping.")
+            return None
+        # Held to the interval's duration and the source's streams, like a fresh cut, so a truncated
+        # or silent leftover is cut again
+        start_seconds = convert_time_str_to_seconds(start_time)
+        end_seconds = convert_time_str_to_seconds(end_time) if end_time else video_duration
+        if end_seconds is None:
+            end_seconds = media.get_duration(source_file)
+        has_audio = media.stream_signature(source_file)['audio'] is not None
+        result = verify.verify_output(store.reader(output_path), end_seconds - start_seconds, expect_audio=has_audio,
+                                      name=output_filename)
+        if result['ok']:
+            print(f"File '{output_path}' already exists. Skipping.")
+            return result
+        print(f"Existing output failed verification ({verify.describe_failure(result)}); cutting it again.")
+        store.remove(output_path)
 
     try:
         start_seconds = convert_time_str_to_seconds(start_time)
         end_seconds = convert_time_str_to_seconds(end_time) if end_time else video_duration
+        profile = profile or encoder_profiles.get_profile()
+        sampler = None
+        # The pass-sampled previews need the frames moviepy decodes, so they keep the single-pass encode
+        chunked = chunk_workers > 1 and preview_mode != 'pass'
+        if chunked and end_seconds is None:
+            end_seconds = media.get_duration(source_file)
+        chunked = chunked and end_seconds - start_seconds >= chunked_encode.MIN_CHUNKED_SECONDS
 
-        with VideoFileClip(source_file) as video:
-            trimmed_video = video.subclip(start_seconds, end_seconds)
-            trimmed_video.write_videofile(output_path, codec='libx264', audio_codec='aac')
-            print(f"Video trimmed successfully: {output_filename}")
+        if chunked:
+            expected_duration = end_seconds - start_seconds
+            has_audio = media.stream_signature(source_file)['audio'] is not None
+            with store.writer(output_path) as write_path:
+                chunks = chunked_encode.encode_interval(source_file, start_seconds, end_seconds, write_path, profile,
+                                                        chunk_workers, ffmpeg_params=store.ffmpeg_params,
+                                                        work_dir=work_dir or output_dir)
+            print(f"Encoded {output_filename} in {chunks} chunks")
+        else:
+            from moviepy.editor import VideoFileClip
+            with VideoFileClip(source_file) as video:
+                trimmed_video = video.subclip(start_seconds, end_seconds)
+                expected_duration = trimmed_video.duration
+                has_audio = video.audio is not None
+                if preview_mode == 'pass':
+                    sampler = previews.FrameSampler(trimmed_video.duration)
+                    trimmed_video = trimmed_video.fl(sampler)
+                write_kwargs = encoder_profiles.moviepy_kwargs(profile)
+                write_kwargs['ffmpeg_params'] = write_kwargs['ffmpeg_params'] + store.ffmpeg_params
+                if work_dir:
+                    write_kwargs['temp_audiofile'] = os.path.join(work_dir, os.path.splitext(output_filename)[0] + '_audio.m4a')
+                with store.writer(output_path) as write_path:
+                    trimmed_video.write_videofile(write_path, **write_kwargs)
     except Exception as e:
         print(f"Error in trimming video: {e}")
+        return verify.failed_result(output_path, f"trimming failed: {e}")
+    return finish_trim(source_file, output_path, output_filename, output_dir, start_seconds, end_seconds,
+                       expected_duration, has_audio, sampler, preview_mode, verify_output)
+
+def finish_trim(source_file, output_path, output_filename, output_dir, start_seconds, end_seconds, expected_duration,
+                has_audio, sampler, preview_mode, verify_output):
+    # Verification and previews of a written output
+    store = storage.get_storage()
+    result = None
+    if verify_output:
+        result = verify.verify_output(store.reader(output_path), expected_duration, expect_audio=has_audio,
+                                      name=output_filename)
+        if not result['ok']:
+            print(f"Output failed verification: {verify.describe_failure(result)}")
+            return result
+    print(f"Video trimmed successfully: {output_filename}")
+
+    try:
+        stem = os.path.splitext(output_filename)[0]
+        if sampler is not None:
+            sampler.write(output_dir, stem)
+        elif preview_mode == 'keyframes':
+            previews.keyframe_previews(source_file, start_seconds, end_seconds, output_dir, stem)
+    except Exception as e:
+        print(f"Error in writing previews for {output_filename}: {e}")
+    return result
 
-def extract_segments(api_key, url):
-    description, video_title, video_duration = get_video_info(api_key, url)
+def extract_segments(api_key, url, video_info=None):
+    description, video_title, video_duration = video_info or get_video_info(api_key, url)
     
     if not description:
         print("No description available for video.")
-        return None, None, None
+        return None, None, None, None
 
-    pattern = re.compile(r'(\d{1,2}:\d{2})\s*-?\s*(.*?)\s*(?=\d{1,2}:\d{2}|\Z)')
-    matches = pattern.findall(description)
+    chapters = chapter_parser.parse_chapters(description, video_duration)
 
-    if matches:
-        timestamps = [match[0] for match in matches]
-        titles = [match[1] for match in matches]
-        intervals = [(timestamps[i], timestamps[i+1] if i+1 < len(timestamps) else "end", titles[i]) for i in range(len(timestamps))]
+    if chapters:
+        intervals = chapter_parser.chapters_to_intervals(chapters)
+        titles = [title for _, _, title in chapters]
         return intervals, titles, video_title, video_duration
     else:
         print("No chapters found in description. Attempting to extract chapters using Selenium.")
@@ -113,66 +167,244 @@ def extract_segments(api_key, url):
             return intervals, [chap['title'] for chap in chapters_json], video_title, video_duration
         except subprocess.CalledProcessError as e:
             print(f"Error extracting chapters using Selenium: {e}")
-            return None, None, None
+            return None, None, None, None
         except FileNotFoundError:
             print("Chapters file not found.")
-            return None, None, None
+            return None, None, None, None
 
 def setup_output_directory(video_title):
-    sanitized_title = sanitize_filename(video_title)
-    output_directory = os.path.join(os.getcwd(), sanitized_title)
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
-    return output_directory
-
-def process_videos(source, intervals, output_dir, video_duration, use_local=False, titles=None):
-    source_file = source if use_local else download_video(source, output_dir)
-    if not source_file:
-        print("Source video could not be retrieved.")
-        return
+    # A directory in the current one, or a local spool directory when outputs go to object storage
+    return storage.get_storage().output_directory(sanitize_filename(video_title))
 
-    for interval in intervals:
+def process_videos(source, intervals, output_dir, video_duration, use_local=False, titles=None, profile=None,
+                   progress=None, preview_mode=None, verify_output=True, chunk_workers=1, work_dir=None):
+    # Returns where the outputs were stored. progress, when given, is called as
+    # progress(stage, done, total) from each stage. A download is admitted by the scratch-space
+    # manager and lands in the job's scratch directory; work_dir is that directory when the caller
+    # downloaded the source itself.
+    if use_local:
+        return cut_intervals(source, intervals, output_dir, video_duration, profile, progress, preview_mode,
+                             verify_output, chunk_workers, work_dir)
+
+    profile = profile or encoder_profiles.get_profile()
+    need = scratch.estimate_disk_need(intervals, video_duration, output_kbps=profile['output_kbps'],
+                                      remote_output=storage.get_storage().remote)
+    with scratch.get_scratch().admit(canonical_video_id(source) or source, need, output_dir) as job_dir:
+        source_file = downloaders.download(source, job_dir, progress=progress)
+        if not source_file:
+            print("Source video could not be retrieved.")
+            return
+        return cut_intervals(source_file, intervals, output_dir, video_duration, profile, progress, preview_mode,
+                             verify_output, chunk_workers, job_dir, remove_source=True)
+
+def cut_intervals(source_file, intervals, output_dir, video_duration, profile, progress, preview_mode, verify_output,
+                  chunk_workers, work_dir, remove_source=False):
+    failures = []
+    for i, interval in enumerate(intervals):
+        if progress:
+            progress('trim', i, len(intervals))
         if len(interval) != 3:
             print(f"Invalid interval format: {interval}")
             continue
         start, end, _ = interval
         title = sanitize_filename(interval[2])  # Use the third element of the interval as the title
         output_filename = f"{title}.mp4"
-        trim_video(source_file, start, end, output_filename, output_dir, video_duration)
+        result = trim_video(source_file, start, end, output_filename, output_dir, video_duration, profile=profile,
+                            preview_mode=preview_mode, verify_output=verify_output, chunk_workers=chunk_workers,
+                            work_dir=work_dir)
+        if work_dir:
+            # Whatever the cut left behind goes now, not when the whole job is done
+            scratch.clean_job_dir(work_dir, keep=(source_file,))
+        if result:
+            verify.record_manifest(output_dir, result)
+            if not result['ok']:
+                failures.append(verify.describe_failure(result))
+    if progress:
+        progress('trim', len(intervals), len(intervals))
 
-    if not use_local:
+    if remove_source:
         print(f"Removing original downloaded file: {source_file}")
         os.remove(source_file)
+    location = storage.get_storage().publish(output_dir, exclude=(source_file,))
+    if failures:
+        raise verify.VerificationError('; '.join(failures))
+    return location
 
+def job_intervals_key(args):
+    # What identifies the interval set of a job before any metadata has been fetched
+    if args.extract_segments:
+        return 'description_chapters'
+    if args.intervals_path:
+        return load_intervals_from_file(args.intervals_path)
+    if args.search:
+        return ['caption_search', args.search, args.search_context]
+    return None
 
-def main():
-    print("Script started.")
-    parser = argparse.ArgumentParser(description='Download and trim YouTube videos.')
-    parser.add_argument('-url', type=str, help='URL of the YouTube video', required=True)
-    parser.add_argument('-api_key', type=str, help='YouTube Data API key', required=True)
-    parser.add_argument('-extract_segments', action='store_true', help='Extract video segments from the video description and use them as intervals.')
-    parser.add_argument('-intervals_path', type=str, help='Path to the JSON file containing time intervals')
-    args = parser.parse_args()
-
-    video_description, video_title, video_duration = get_video_info(args.api_key, args.url)
-    if video_duration is None:
-        print("Video duration not available. Exiting.")
-        return
+def job_profile(args):
+    return encoder_profiles.get_profile(args.profile, args.threads)
 
+def resolve_job_intervals(args, url, video_description, video_title, video_duration):
     intervals, titles = None, None
     if args.extract_segments:
-        intervals, titles, _, _ = extract_segments(args.api_key, args.url)
+        intervals, titles, _, _ = extract_segments(args.api_key, url, (video_description, video_title, video_duration))
         if not intervals:
             print("No valid intervals extracted. Exiting the script.")
-            return
     elif args.intervals_path:
         intervals = load_intervals_from_file(args.intervals_path)
         if not intervals:
             print("Error loading intervals. Exiting.")
-            return
+    elif args.search:
+        intervals = caption_search_intervals(args, canonical_video_id(url))
+        if not intervals:
+            print(f"No indexed captions of {url} mention '{args.search}'.")
+    return intervals, titles
+
+def caption_search_intervals(args, video_id):
+    # The chapters whose captions mention the phrase, or windows around each mention with -search_context
+    context_ms = int(args.search_context * 1000) if args.search_context is not None else None
+    return chapter_parser.chapters_to_intervals(captions.get_index().matching_intervals(args.search, video_id, context_ms))
+
+def plan_video_job(args, url, video_description, video_title, video_duration):
+    intervals, _ = resolve_job_intervals(args, url, video_description, video_title, video_duration)
+    if not intervals:
+        return None
+    source_kbps = planner.probe_format_kbps(url) if args.probe_formats else None
+    profile = job_profile(args)
+    plan = planner.plan_job(video_title, intervals, video_duration, merge_overlaps=args.merge_overlaps,
+                            source_kbps=source_kbps, output_kbps=profile['output_kbps'],
+                            cpu_seconds_per_second=profile['cpu_seconds_per_second'])
+    for issue in plan['issues']:
+        print(f"Interval issue in '{video_title}': {issue}")
+    return plan
+
+def process_video_job(args, url, video_description, video_title, video_duration):
+    if video_duration is None:
+        print("Video duration not available. Exiting.")
+        return None
+
+    # Intervals are validated and normalized before anything is downloaded
+    plan = plan_video_job(args, url, video_description, video_title, video_duration)
+    if not plan:
+        return None
+    if not plan['intervals']:
+        print("No valid intervals left after validation. Exiting.")
+        return None
+    intervals = chapter_parser.chapters_to_intervals(plan['intervals'])
+    if args.captions and not args.search:
+        captions.index_video(captions.get_index(), url, video_title, plan['intervals'])
 
     output_directory = setup_output_directory(video_title)
-    process_videos(args.url, intervals, output_directory, video_duration, use_local=False, titles=titles)
+    source_fingerprint = None
+    if args.dedupe:
+        # A re-upload of content already cut with the same intervals and settings reuses those
+        # outputs instead of being downloaded and cut again
+        settings = encoder_profiles.settings_key(job_profile(args))
+        duplicate, source_fingerprint = fingerprint.find_duplicate(fingerprint.get_index(), canonical_video_id(url), url,
+                                                                   video_duration, plan['intervals'], settings)
+        if duplicate:
+            location = fingerprint.reuse_outputs(fingerprint.get_index(), storage.get_storage(), duplicate, output_directory)
+            if location:
+                return location
+    try:
+        location = process_videos(url, intervals, output_directory, video_duration, use_local=False, profile=job_profile(args),
+                                  preview_mode=args.previews, verify_output=not args.no_verify,
+                                  chunk_workers=args.chunk_workers)
+    except verify.VerificationError as e:
+        print(f"Job failed verification: {e}")
+        return None
+    if location and source_fingerprint:
+        fingerprint.get_index().add(canonical_video_id(url), video_duration, source_fingerprint, plan['intervals'],
+                                    settings, location)
+    return location
+
+def run_video_job(args, index, video_id, url, video_info=None, plans=None):
+    intervals_key = job_intervals_key(args)
+    settings = encoder_profiles.settings_key(job_profile(args))
+    if index.contains(video_id, intervals_key, settings):
+        print(f"Video {video_id} was already processed with these intervals and settings. Skipping.")
+        return
+    video_description, video_title, video_duration = video_info or get_video_info(args.api_key, url)
+    if args.dry_run:
+        plan = plan_video_job(args, canonical_url(video_id), video_description, video_title, video_duration)
+        if plan:
+            plans.append(plan)
+        return
+    output_directory = process_video_job(args, canonical_url(video_id), video_description, video_title, video_duration)
+    if output_directory:
+        index.add(video_id, intervals_key, settings, output_directory)
+
+def main():
+    print("Script started.")
+    parser = argparse.ArgumentParser(description='Download and trim YouTube videos.')
+    parser.add_argument('-url', type=str, help='URL of the YouTube video')
+    parser.add_argument('-playlist', type=str, help='Playlist ID or URL; every video in it is processed')
+    parser.add_argument('-channel', type=str, help='Channel ID, @handle or URL; every upload is processed')
+    parser.add_argument('-api_key', type=str, help='YouTube Data API key', required=True)
+    parser.add_argument('-extract_segments', action='store_true', help='Extract video segments from the video description and use them as intervals.')
+    parser.add_argument('-intervals_path', type=str, help='Path to the JSON file containing time intervals')
+    parser.add_argument('-search', type=str, help='Cut the chapters whose indexed captions mention this phrase (every matching video when no -url, -playlist or -channel is given)')
+    parser.add_argument('-search_context', type=float, default=None, help='With -search, cut this many seconds around each mention instead of the whole chapter')
+    parser.add_argument('-captions', action='store_true', help='Fetch the captions and index them by the planned intervals for -search')
+    parser.add_argument('-merge_overlaps', action='store_true', help='Merge overlapping intervals instead of only reporting them')
+    parser.add_argument('-dry_run', action='store_true', help='Print the validated plan with download, encode and output estimates without processing')
+    parser.add_argument('-probe_formats', action='store_true', help='Look up the real format bitrate for the dry-run estimates')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile trading speed against quality and size')
+    parser.add_argument('-threads', type=int, default=None, help='Encoder threads (defaults to the profile setting)')
+    parser.add_argument('-chunk_workers', type=int, default=os.cpu_count() or 1, help=f'Encoder processes for one interval; intervals of {chunked_encode.MIN_CHUNKED_SECONDS} s or more are split at keyframes and encoded in parallel (1 disables)')
+    parser.add_argument('-previews', type=str, choices=previews.PREVIEW_MODES, default=None, help="Write a poster, sprite sheets and a WebVTT map per chapter, sampled from the cutting pass ('pass') or from the source keyframes ('keyframes')")
+    parser.add_argument('-no_verify', action='store_true', help='Skip the probe and sampled decode of every output')
+    parser.add_argument('-dedupe', action='store_true', help='Fingerprint the start of each video and reuse the outputs of an already processed upload of the same content cut the same way')
+    parser.add_argument('-downloaders', type=str, nargs='+', default=None, help='Download backends to use, e.g. yt_dlp pytube (default: every registered one, the fastest healthy one first)')
+    parser.add_argument('-scratch_dir', type=str, default=scratch.SCRATCH_DIR, help='Volume for downloads and temporary files, e.g. a tmpfs or NVMe mount (default: EXTRACTOR_SCRATCH or the output directory)')
+    parser.add_argument('-disk_reserve_gb', type=float, default=scratch.DEFAULT_RESERVE_BYTES / 1024 ** 3, help='Free space left untouched on each volume; jobs wait until their estimated need fits above it')
+    parser.add_argument('-storage', type=str, default=storage.STORAGE_URL, help='Output location: a directory or s3://bucket/prefix (default: EXTRACTOR_STORAGE or the current directory)')
+    parser.add_argument('-upload_concurrency', type=int, default=storage.DEFAULT_UPLOAD_CONCURRENCY, help='Parts uploaded at the same time per output (s3 storage)')
+    parser.add_argument('-part_size_mb', type=int, default=storage.DEFAULT_PART_SIZE // 1048576, help='Multipart upload part size in MiB (s3 storage, at least 5)')
+    args = parser.parse_args()
+
+    storage.configure(args.storage, part_size=args.part_size_mb * 1048576, concurrency=args.upload_concurrency)
+    scratch.configure(args.scratch_dir, int(args.disk_reserve_gb * 1024 ** 3))
+    try:
+        downloaders.configure(args.downloaders)
+    except ValueError as e:
+        parser.error(str(e))
+    index = ProcessedIndex()
+    plans = []
+    if args.playlist or args.channel:
+        if args.playlist:
+            jobs = youtube_api.iter_playlist_videos(args.api_key, youtube_api.parse_playlist_id(args.playlist))
+        else:
+            jobs = youtube_api.iter_channel_videos(args.api_key, args.channel)
+        seen = set()
+        for url, video_description, video_title, video_duration in jobs:
+            video_id = canonical_video_id(url)
+            if video_id in seen:
+                continue
+            seen.add(video_id)
+            print(f"Processing {url}")
+            try:
+                run_video_job(args, index, video_id, url, (video_description, video_title, video_duration), plans)
+            except Exception as e:
+                print(f"Error processing {url}: {e}")
+    elif args.url:
+        video_id = canonical_video_id(args.url)
+        if not video_id:
+            print(f"Could not determine the video ID of {args.url}. Exiting.")
+            return
+        run_video_job(args, index, video_id, args.url, plans=plans)
+    elif args.search:
+        video_ids = captions.get_index().matching_videos(args.search)
+        print(f"{len(video_ids)} indexed videos mention '{args.search}'")
+        for video_id in video_ids:
+            try:
+                run_video_job(args, index, video_id, canonical_url(video_id), plans=plans)
+            except Exception as e:
+                print(f"Error processing {video_id}: {e}")
+    else:
+        parser.error("one of -url, -playlist, -channel or -search is required")
+
+    if args.dry_run:
+        planner.print_plan(plans)
 
 if __name__ == "__main__":
     main()
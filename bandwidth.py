@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONNECTIONS_PER_FILE = 4
+DEFAULT_MAX_CONNECTIONS = 64
+RANGE_CHUNK_SIZE = 1024 * 1024
+HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+BURST_SECONDS = 0.5
+ACTIVE_WINDOW_SECONDS = 2.0
+WAITING_BOOST = 4.0
+
+class _JobState:
+    def __init__(self, weight):
+        self.weight = weight
+        self.waiting = False
+        self.tokens = 0.0
+        self.last_active = 0.0
+        self.downloaded = {}
+
+class BandwidthScheduler:
+    # Shared by every download of a batch. Caps the total transfer rate and the number of open
+    # connections; the cap is split between the jobs that are currently transferring in proportion
+    # to their weight, and jobs whose cutters are waiting for them get WAITING_BOOST times more.
+
+    def __init__(self, total_rate=None, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.total_rate = total_rate
+        self.max_connections = max_connections
+        self.connections_in_use = 0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.jobs = {}
+        self.cond = threading.Condition()
+
+    def register(self, job_id, weight=1.0):
+        with self.cond:
+            self.jobs.setdefault(job_id, _JobState(weight)).weight = weight
+
+    def unregister(self, job_id):
+        with self.cond:
+            self.jobs.pop(job_id, None)
+            self.cond.notify_all()
+
+    def set_waiting(self, job_id, waiting=True):
+        with self.cond:
+            if job_id in self.jobs:
+                self.jobs[job_id].waiting = waiting
+                self.cond.notify_all()
+
+    def _effective_weight(self, state):
+        return state.weight * (WAITING_BOOST if state.waiting else 1.0)
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.total_rate * BURST_SECONDS, self.tokens + elapsed * self.total_rate)
+        active = [state for state in self.jobs.values() if now - state.last_active < ACTIVE_WINDOW_SECONDS]
+        total_weight = sum(self._effective_weight(state) for state in active) or 1.0
+        for state in active:
+            share = self.total_rate * self._effective_weight(state) / total_weight
+            state.tokens = min(share * BURST_SECONDS, state.tokens + elapsed * share)
+        return total_weight
+
+    def consume(self, job_id, nbytes):
+        # Blocks the calling download thread until the job may transfer nbytes more
+        if self.total_rate is None or nbytes <= 0:
+            return
+        with self.cond:
+            state = self.jobs.get(job_id)
+            if state is None:
+                state = self.jobs[job_id] = _JobState(1.0)
+            while True:
+                now = time.monotonic()
+                state.last_active = now
+                total_weight = self._refill(now)
+                if self.tokens > 0 and state.tokens > 0:
+                    self.tokens -= nbytes
+                    state.tokens -= nbytes
+                    return
+                share = self.total_rate * self._effective_weight(state) / total_weight
+                wait = max(-self.tokens / self.total_rate, -state.tokens / share, 0.01)
+                self.cond.wait(min(wait, 0.5))
+                if job_id not in self.jobs:
+                    return
+
+    def acquire_connections(self, count):
+        count = max(1, min(count, self.max_connections))
+        with self.cond:
+            while self.connections_in_use + count > self.max_connections:
+                self.cond.wait()
+            self.connections_in_use += count
+        return count
+
+    def release_connections(self, count):
+        with self.cond:
+            self.connections_in_use -= count
+            self.cond.notify_all()
+
+    def progress_hook(self, job_id):
+        # yt_dlp progress hook: hooks run on the downloading thread, so blocking here throttles it
+        state = self.jobs.get(job_id) or _JobState(1.0)
+
+        def hook(status):
+            if status.get('status') != 'downloading':
+                return
+            key = status.get('filename') or status.get('tmpfilename')
+            downloaded = status.get('downloaded_bytes') or 0
+            previous = state.downloaded.get(key, 0)
+            if downloaded > previous:
+                state.downloaded[key] = downloaded
+                self.consume(job_id, downloaded - previous)
+        return hook
+
+_default_scheduler = BandwidthScheduler()
+
+def get_scheduler():
+    return _default_scheduler
+
+def configure(total_rate=None, max_connections=DEFAULT_MAX_CONNECTIONS):
+    global _default_scheduler
+    _default_scheduler = BandwidthScheduler(total_rate, max_connections)
+    return _default_scheduler
+
+def yt_dlp_options(job_id, connections=DEFAULT_CONNECTIONS_PER_FILE, scheduler=None):
+    # Fragmented (DASH/HLS) formats are fetched with several connections; plain HTTP formats are
+    # requested in ranged chunks so a single stalled connection cannot hold up the whole file.
+    scheduler = scheduler or get_scheduler()
+    return {
+        'concurrent_fragment_downloads': connections,
+        'http_chunk_size': HTTP_CHUNK_SIZE,
+        'progress_hooks': [scheduler.progress_hook(job_id)],
+    }
+
+@contextmanager
+def connection_slots(count, scheduler=None):
+    scheduler = scheduler or get_scheduler()
+    granted = scheduler.acquire_connections(count)
+    try:
+        yield granted
+    finally:
+        scheduler.release_connections(granted)
+
+def _download_range(session, url, output_path, start, end, job_id, scheduler):
+    response = session.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True, timeout=60)
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise IOError(f"Server ignored the range request for bytes {start}-{end}")
+    with open(output_path, 'r+b') as file:
+        file.seek(start)
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            scheduler.consume(job_id, len(chunk))
+            file.write(chunk)
+
+def ranged_download(url, output_path, job_id=None, total_size=None, connections=DEFAULT_CONNECTIONS_PER_FILE,
+                    scheduler=None):
+    # Downloads a single progressive file over several concurrent Range requests
+    import requests
+    scheduler = scheduler or get_scheduler()
+    job_id = job_id or url
+    session = requests.Session()
+    if total_size is None:
+        head = session.head(url, allow_redirects=True, timeout=60)
+        head.raise_for_status()
+        total_size = int(head.headers.get('Content-Length', 0))
+
+    with open(output_path, 'wb') as file:
+        file.truncate(total_size)
+    if total_size == 0:
+        return output_path
+
+    ranges = [(start, min(start + RANGE_CHUNK_SIZE, total_size) - 1) for start in range(0, total_size, RANGE_CHUNK_SIZE)]
+    error = None
+    with connection_slots(connections, scheduler) as granted:
+        with ThreadPoolExecutor(max_workers=granted) as executor:
+            futures = [executor.submit(_download_range, session, url, output_path, start, end, job_id, scheduler)
+                       for start, end in ranges]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    error = error or e
+                    for pending in futures:
+                        pending.cancel()
+    if error:
+        os.remove(output_path)
+        raise error
+    return output_path
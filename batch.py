@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import threading
+import app
+import bandwidth
+import captions
+import chapter_parser
+import discovery
+import downloaders
+import encoder_profiles
+import fingerprint
+import planner
+import previews
+import scheduling
+import scratch
+import storage
+from processed_index import ProcessedIndex
+from video_ids import canonical_video_id
+
+CHAPTERS_INTERVALS_KEY = 'description_chapters'
+
+def read_urls(urls_file):
+    # One URL per line, optionally followed by an encoder profile name for that job, or a JSON
+    # object per line (a manifest) such as
+    # {"url": ..., "profile": "fast", "priority": 1, "deadline": "2026-05-01T18:00:00Z"}
+    entries = []
+    with open(urls_file, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if line.startswith('{'):
+                try:
+                    entry = json.loads(line)
+                    entries.append({'url': entry['url'], 'profile': entry.get('profile'),
+                                    'priority': int(entry.get('priority') or 0),
+                                    'deadline': scheduling.parse_deadline(entry.get('deadline'))})
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"Invalid manifest entry on line {line_number} of {urls_file}: {e}. Skipping.")
+                continue
+            parts = line.split()
+            if parts:
+                entries.append({'url': parts[0], 'profile': parts[1] if len(parts) > 1 else None,
+                                'priority': 0, 'deadline': None})
+    return entries
+
+class CutterGate:
+    # Limits how many jobs are cut at once while the other workers download ahead, and marks the
+    # downloads that an idle cutter is waiting for so the bandwidth scheduler favours them.
+
+    def __init__(self, cut_workers, scheduler):
+        self.slots = threading.Semaphore(cut_workers)
+        self.cut_workers = cut_workers
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+        self.cutting = 0
+        self.ready = 0
+        self.downloading = []
+
+    def _update_waiting(self):
+        idle_cutters = max(0, self.cut_workers - self.cutting - self.ready)
+        for position, job_id in enumerate(self.downloading):
+            self.scheduler.set_waiting(job_id, position < idle_cutters)
+
+    def download_started(self, job_id):
+        self.scheduler.register(job_id)
+        with self.lock:
+            self.downloading.append(job_id)
+            self._update_waiting()
+
+    def download_finished(self, job_id, succeeded):
+        self.scheduler.unregister(job_id)
+        with self.lock:
+            self.downloading.remove(job_id)
+            if succeeded:
+                self.ready += 1
+            self._update_waiting()
+
+    def cut_started(self):
+        with self.lock:
+            self.ready -= 1
+            self.cutting += 1
+            self._update_waiting()
+
+    def cut_finished(self):
+        with self.lock:
+            self.cutting -= 1
+            self._update_waiting()
+
+def plan_job(job, profiles):
+    profile = profiles[job['video_id']]
+    plan = planner.plan_job(job['title'], job['intervals'], job['duration'], output_kbps=profile['output_kbps'],
+                            cpu_seconds_per_second=profile['cpu_seconds_per_second'])
+    for issue in plan['issues']:
+        print(f"Interval issue in '{job['title']}': {issue}")
+    return plan
+
+def process_job(job, gate, profiles, preview_mode=None, verify_output=True, caption_index=None, chunk_workers=1,
+                fingerprint_index=None):
+    if not job['intervals']:
+        print(f"No chapters found for {job['url']}. Skipping.")
+        return None
+    planned = plan_job(job, profiles)['intervals']
+    intervals = chapter_parser.chapters_to_intervals(planned)
+    if not intervals:
+        print(f"No valid intervals left after validation for {job['url']}. Skipping.")
+        return None
+    if caption_index is not None:
+        captions.index_video(caption_index, job['url'], job['title'], planned)
+    output_directory = app.setup_output_directory(job['title'])
+    profile = profiles[job['video_id']]
+    source_fingerprint = None
+    if fingerprint_index is not None:
+        settings = encoder_profiles.settings_key(profile)
+        duplicate, source_fingerprint = fingerprint.find_duplicate(fingerprint_index, job['video_id'], job['url'],
+                                                                   job['duration'], planned, settings)
+        if duplicate:
+            location = fingerprint.reuse_outputs(fingerprint_index, storage.get_storage(), duplicate, output_directory)
+            if location:
+                return location
+    need = scratch.estimate_disk_need(planned, job['duration'], output_kbps=profile['output_kbps'],
+                                      remote_output=storage.get_storage().remote)
+
+    # The job waits here until its source, temporary files and outputs fit on disk; the source goes
+    # to the scratch volume and the scratch directory is removed when the job ends
+    with scratch.get_scratch().admit(job['video_id'], need, output_directory) as job_dir:
+        source_file = None
+        gate.download_started(job['video_id'])
+        try:
+            source_file = downloaders.download(job['url'], job_dir, job_id=job['video_id'])
+        finally:
+            gate.download_finished(job['video_id'], source_file is not None)
+        if source_file:
+            with gate.slots:
+                gate.cut_started()
+                try:
+                    location = app.process_videos(source_file, intervals, output_directory, job['duration'], use_local=True,
+                                                  profile=profile, preview_mode=preview_mode, verify_output=verify_output,
+                                                  chunk_workers=chunk_workers, work_dir=job_dir)
+                finally:
+                    gate.cut_finished()
+    if not source_file:
+        # Unavailable to every backend (private, removed, age-restricted): nothing to cut or publish.
+        # The scratch directory is gone by now, so the output directory is empty.
+        print(f"Source video {job['url']} could not be retrieved. Skipping.")
+        try:
+            os.rmdir(output_directory)
+        except OSError:
+            pass
+        return None
+    if location and source_fingerprint:
+        fingerprint_index.add(job['video_id'], job['duration'], source_fingerprint, planned, settings, location)
+    return location
+
+def annotate_job(job, profiles, schedule_fields):
+    # Adds what the scheduling policy ranks jobs by: the manifest's priority and deadline and the
+    # estimated cost from the API duration, the chapters' coverage and the encoder profile
+    job.update(schedule_fields.get(job['video_id'], {'priority': 0, 'deadline': None}))
+    job['cost'] = round(scheduling.estimate_cost(job['intervals'], job['duration'], profiles.get(job['video_id'])), 1)
+
+def print_job(job):
+    # Called from several worker threads; print() writes the newline separately, so lines could
+    # interleave. One write per job keeps every line whole.
+    sys.stdout.write(json.dumps(job) + '\n')
+    sys.stdout.flush()
+    return None
+
+async def run_batch(args, urls, profiles, schedule_fields):
+    # The stage and its queue are created inside the running loop so their asyncio primitives bind
+    # to it. The queue hands the discovered jobs to the workers in the order of -schedule.
+    queue = scheduling.JobQueue(args.schedule, args.queue_size,
+                                annotate=functools.partial(annotate_job, profiles=profiles, schedule_fields=schedule_fields))
+    stage = discovery.DiscoveryStage(args.api_key, rate=args.rate, burst=args.burst, concurrency=args.concurrency,
+                                     chapter_fallback=not args.no_fallback, queue=queue)
+    if args.discover_only:
+        handler = print_job
+    elif args.dry_run:
+        handler = functools.partial(plan_job, profiles=profiles)
+    else:
+        scheduler = bandwidth.configure(total_rate=args.max_rate_mbps * 125000 if args.max_rate_mbps else None,
+                                        max_connections=args.max_connections)
+        handler = functools.partial(process_job, gate=CutterGate(args.cut_workers, scheduler), profiles=profiles,
+                                    preview_mode=args.previews, verify_output=not args.no_verify,
+                                    caption_index=captions.get_index() if args.captions else None,
+                                    fingerprint_index=fingerprint.get_index() if args.dedupe else None,
+                                    chunk_workers=args.chunk_workers or max(1, (os.cpu_count() or 1) // args.cut_workers))
+    return await discovery.run_pipeline(stage, urls, handler, workers=args.workers)
+
+def main():
+    parser = argparse.ArgumentParser(description='Discover chapters for a list of YouTube videos and cut them.')
+    parser.add_argument('-urls_file', type=str, help='File with one YouTube URL per line, or a JSON lines manifest with url, profile, priority and deadline', default='urls.txt')
+    parser.add_argument('-api_key', type=str, help='YouTube Data API key', required=True)
+    parser.add_argument('-rate', type=float, help='Data API requests per second', default=5.0)
+    parser.add_argument('-burst', type=int, help='Data API requests allowed in a burst', default=10)
+    parser.add_argument('-daily_quota', type=int, help='Spread requests evenly over this many quota units per day (overrides -rate)', default=None)
+    parser.add_argument('-concurrency', type=int, help='Metadata lookups in flight at once', default=8)
+    parser.add_argument('-queue_size', type=int, help='Discovered jobs buffered ahead of the download stage; the scheduling policy reorders within them', default=32)
+    parser.add_argument('-schedule', type=str, choices=sorted(scheduling.POLICIES), default=scheduling.DEFAULT_POLICY, help='Order in which discovered jobs run: fifo (URL order, the default), sjf (shortest estimated job first) or edf (earliest deadline first); higher manifest priorities always go first')
+    parser.add_argument('-workers', type=int, help='Jobs in progress at the same time (downloading ahead or cutting)', default=4)
+    parser.add_argument('-cut_workers', type=int, help='Jobs cut at the same time', default=2)
+    parser.add_argument('-max_rate_mbps', type=float, help='Total download bandwidth cap in Mbit/s shared by all jobs', default=None)
+    parser.add_argument('-max_connections', type=int, help='Total HTTP connections shared by all downloads', default=bandwidth.DEFAULT_MAX_CONNECTIONS)
+    parser.add_argument('-no_fallback', action='store_true', help='Do not run sel_chapters.py for videos without description chapters')
+    parser.add_argument('-discover_only', action='store_true', help='Print the discovered jobs as JSON lines instead of processing them')
+    parser.add_argument('-dry_run', action='store_true', help='Print the validated plan with download, encode and output estimates instead of processing')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile for jobs that do not name one in the URLs file')
+    parser.add_argument('-threads', type=int, default=None, help='Encoder threads per cut (defaults to the profile setting)')
+    parser.add_argument('-chunk_workers', type=int, default=None, help='Encoder processes per long interval (default: the cores divided by -cut_workers; 1 disables chunking)')
+    parser.add_argument('-previews', type=str, choices=previews.PREVIEW_MODES, default=None, help='Write a poster, sprite sheets and a WebVTT map per chapter (see app.py)')
+    parser.add_argument('-captions', action='store_true', help='Fetch the captions of every job and index them by chapter (search them with captions.py or app.py -search)')
+    parser.add_argument('-no_verify', action='store_true', help='Skip the probe and sampled decode of every output')
+    parser.add_argument('-dedupe', action='store_true', help='Fingerprint the start of each video and reuse the outputs of an already processed upload of the same content cut the same way')
+    parser.add_argument('-downloaders', type=str, nargs='+', default=None, help='Download backends to use, e.g. yt_dlp pytube (default: every registered one, the fastest healthy one first)')
+    parser.add_argument('-scratch_dir', type=str, default=scratch.SCRATCH_DIR, help='Volume for downloads and temporary files, e.g. a tmpfs or NVMe mount (default: EXTRACTOR_SCRATCH or the output directory)')
+    parser.add_argument('-disk_reserve_gb', type=float, default=scratch.DEFAULT_RESERVE_BYTES / 1024 ** 3, help='Free space left untouched on each volume; jobs wait until their estimated need fits above it')
+    parser.add_argument('-storage', type=str, default=storage.STORAGE_URL, help='Output location: a directory or s3://bucket/prefix (default: EXTRACTOR_STORAGE or the current directory)')
+    parser.add_argument('-upload_concurrency', type=int, default=storage.DEFAULT_UPLOAD_CONCURRENCY, help='Parts uploaded at the same time per output (s3 storage)')
+    parser.add_argument('-part_size_mb', type=int, default=storage.DEFAULT_PART_SIZE // 1048576, help='Multipart upload part size in MiB (s3 storage, at least 5)')
+    args = parser.parse_args()
+
+    if args.daily_quota:
+        args.rate = discovery.requests_per_second_for_quota(args.daily_quota)
+        args.burst = 1
+
+    entries = read_urls(args.urls_file)
+    if not entries:
+        print("No URLs found in the file.")
+        return
+
+    if not args.discover_only and not args.dry_run:
+        storage.configure(args.storage, part_size=args.part_size_mb * 1048576, concurrency=args.upload_concurrency)
+        scratch.configure(args.scratch_dir, int(args.disk_reserve_gb * 1024 ** 3))
+        try:
+            downloaders.configure(args.downloaders)
+        except ValueError as e:
+            parser.error(str(e))
+    index = ProcessedIndex()
+    pending = []
+    profiles = {}
+    schedule_fields = {}
+    for entry in entries:
+        url, profile_name = entry['url'], entry['profile']
+        video_id = canonical_video_id(url)
+        try:
+            profile = encoder_profiles.get_profile(profile_name or args.profile, args.threads)
+        except ValueError as e:
+            print(f"{e}. Skipping {url}.")
+            continue
+        if video_id and not args.discover_only and not args.dry_run and index.contains(video_id, CHAPTERS_INTERVALS_KEY, encoder_profiles.settings_key(profile)):
+            print(f"Video {video_id} was already processed. Skipping.")
+            continue
+        # Discovery drops repeated IDs, so the first profile given for a video wins
+        if video_id and video_id not in profiles:
+            profiles[video_id] = profile
+            schedule_fields[video_id] = {'priority': entry['priority'], 'deadline': entry['deadline']}
+        pending.append(url)
+
+    results = asyncio.run(run_batch(args, pending, profiles, schedule_fields))
+    if args.dry_run:
+        planner.print_plan([plan for _, plan in results if plan])
+        return
+    for job, output_directory in results:
+        if output_directory:
+            index.add(job['video_id'], CHAPTERS_INTERVALS_KEY, encoder_profiles.settings_key(profiles[job['video_id']]),
+                      output_directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark of chapter_parser against the description regex it replaced, over the
+# description fixtures in fixtures/descriptions. The fixtures follow the shapes of real uploads (lectures,
+# mixes, podcasts, tutorials, recipes, stream VODs, a non-English talk, a long description without
+# chapters), with names, links, handles and codes replaced by <placeholders>.
+
+import argparse
+import os
+import re
+import timeit
+import chapter_parser
+
+LEGACY_PATTERN = re.compile(r'(\d{1,2}:\d{2})\s*-?\s*(.*?)\s*(?=\d{1,2}:\d{2}|\Z)')
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'descriptions')
+
+def legacy_parse(description):
+    return LEGACY_PATTERN.findall(description)
+
+def time_per_call(func, description, number):
+    return min(timeit.repeat(lambda: func(description), number=number, repeat=5)) / number
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the description chapter parser.')
+    parser.add_argument('-fixtures_dir', type=str, help='Directory of .txt description fixtures', default=FIXTURES_DIR)
+    parser.add_argument('-number', type=int, help='Calls per timing run', default=200)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<28}{'bytes':>8}{'legacy n':>10}{'legacy us':>11}{'parser n':>10}{'parser us':>11}{'speedup':>9}")
+    for name in sorted(os.listdir(args.fixtures_dir)):
+        if not name.endswith('.txt'):
+            continue
+        with open(os.path.join(args.fixtures_dir, name), 'r', encoding='utf-8') as file:
+            description = file.read()
+
+        legacy_count = len(legacy_parse(description))
+        parser_count = len(chapter_parser.parse_chapters(description))
+        legacy_time = time_per_call(legacy_parse, description, args.number)
+        parser_time = time_per_call(chapter_parser.parse_chapters, description, args.number)
+        print(f"{name:<28}{len(description):>8}{legacy_count:>10}{legacy_time * 1e6:>11.1f}"
+              f"{parser_count:>10}{parser_time * 1e6:>11.1f}{legacy_time / parser_time:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
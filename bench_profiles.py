@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Encodes the same clip with every encoder profile and reports wall time, encoding fps, CPU
+# seconds and output size. Run it on the hosts that do the cutting and copy the CPU-s per second
+# and kbps figures into encoder_profiles.PROFILES so the dry-run estimates stay honest.
+
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+import encoder_profiles
+import media
+
+def make_sample(output_path, seconds):
+    # A 720p30 test pattern with a tone, for hosts without a representative clip at hand
+    media.run_ffmpeg(['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+                      '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                      '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '18', '-c:a', 'aac', output_path])
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def encode(source, output_path, profile, seconds):
+    args = ['-i', source]
+    if seconds:
+        args += ['-t', str(seconds)]
+    args += encoder_profiles.ffmpeg_video_args(profile) + encoder_profiles.ffmpeg_audio_args(profile) + [output_path]
+    cpu_before = children_cpu_seconds()
+    started = time.monotonic()
+    media.run_ffmpeg(args)
+    return time.monotonic() - started, children_cpu_seconds() - cpu_before
+
+def frame_rate(signature):
+    # ffprobe reports the frame rate as a fraction such as '30000/1001'
+    video = signature.get('video')
+    if not video:
+        return 0
+    numerator, _, denominator = video[5].partition('/')
+    return float(numerator) / float(denominator or 1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the encoder profiles on this host.')
+    parser.add_argument('-input', type=str, help='Clip to encode (a generated test pattern when omitted)')
+    parser.add_argument('-seconds', type=float, help='Seconds of the clip to encode', default=30)
+    parser.add_argument('-threads', type=int, help='Encoder threads (defaults to each profile setting)', default=None)
+    parser.add_argument('-profiles', type=str, nargs='+', help='Profiles to run', default=sorted(encoder_profiles.PROFILES))
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_profiles_')
+    try:
+        source = args.input
+        if not source:
+            source = os.path.join(work_dir, 'sample.mp4')
+            make_sample(source, args.seconds)
+        duration = min(media.get_duration(source), args.seconds)
+        frames = duration * frame_rate(media.stream_signature(source))
+
+        print(f"{'profile':<12}{'wall s':>9}{'fps':>9}{'CPU s':>9}{'CPU s/s':>9}{'size':>12}{'kbps':>9}")
+        for name in args.profiles:
+            profile = encoder_profiles.get_profile(name, args.threads)
+            output_path = os.path.join(work_dir, f'{name}.mp4')
+            wall, cpu = encode(source, output_path, profile, args.seconds)
+            size = os.path.getsize(output_path)
+            print(f"{name:<12}{wall:>9.2f}{frames / wall:>9.1f}{cpu:>9.2f}{cpu / duration:>9.2f}"
+                  f"{size / 1048576.0:>10.2f}MB{size * 8 / 1000.0 / duration:>9.0f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
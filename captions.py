@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+import argparse
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from chapter_parser import format_ms
+from video_ids import canonical_video_id, canonical_url
+
+DEFAULT_CAPTION_INDEX_PATH = os.environ.get('EXTRACTOR_CAPTION_INDEX', os.path.join(os.getcwd(), 'caption_index.sqlite'))
+# Uploaded subtitles are preferred over automatic captions in the first language found
+CAPTION_LANGUAGES = ('en', 'en-US', 'en-GB', 'en-orig')
+# Consecutive cues of a chapter are indexed together in passages of about this length, so a phrase
+# split over two cues is still found; the passage start is the timestamp a search returns
+PASSAGE_MS = 30000
+SNIPPET_TOKENS = 12
+TAG = re.compile(r'<[^>]*>')
+
+def parse_vtt_time(value):
+    seconds = 0.0
+    for part in value.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return int(round(seconds * 1000))
+
+def parse_vtt(text):
+    # Returns [(start_ms, end_ms, text)]. Automatic captions repeat the previous line at the top of
+    # every cue while the next one scrolls in; lines equal to the last one kept are dropped.
+    cues = []
+    last_line = None
+    timing = None
+    lines = []
+    for line in text.splitlines() + ['']:
+        line = line.strip()
+        if '-->' in line:
+            start, end = line.split('-->', 1)
+            timing = (parse_vtt_time(start), parse_vtt_time(end.split()[0]))
+            lines = []
+        elif timing and line:
+            line = html.unescape(TAG.sub('', line)).strip()
+            if line and line != last_line:
+                lines.append(line)
+                last_line = line
+        elif timing:
+            if lines:
+                cues.append((timing[0], timing[1], ' '.join(lines)))
+            timing = None
+    return cues
+
+def pick_track(info, languages=CAPTION_LANGUAGES):
+    for tracks in (info.get('subtitles') or {}, info.get('automatic_captions') or {}):
+        for language in languages:
+            for track in tracks.get(language) or []:
+                if track.get('ext') == 'vtt' and track.get('url'):
+                    return language, track['url']
+    return None, None
+
+def fetch_captions(video_url, languages=CAPTION_LANGUAGES):
+    # Captions come from the same metadata call yt_dlp makes before a download; nothing is downloaded.
+    # Returns [] when the video has no captions in the given languages.
+    import yt_dlp
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'skip_download': True}) as ydl:
+        info = ydl.extract_info(video_url, download=False)
+        language, url = pick_track(info, languages)
+        if not url:
+            return []
+        text = ydl.urlopen(url).read().decode('utf-8', 'replace')
+    print(f"Fetched {language} captions for {video_url}")
+    return parse_vtt(text)
+
+def align_captions(cues, chapters):
+    # chapters: [(start_ms, end_ms or None, title)]. Every cue goes to the chapter its start falls in
+    # (cues outside all chapters get None) and is merged into passages of up to PASSAGE_MS.
+    # Returns [(chapter position or None, start_ms, end_ms, text)].
+    passages = []
+    for start_ms, end_ms, text in sorted(cues):
+        position = None
+        for i, (chapter_start, chapter_end, _) in enumerate(chapters):
+            if chapter_start <= start_ms and (chapter_end is None or start_ms < chapter_end):
+                position = i
+                break
+        if passages and passages[-1][0] == position and start_ms - passages[-1][1] < PASSAGE_MS:
+            last = passages[-1]
+            passages[-1] = (position, last[1], max(last[2], end_ms), f"{last[3]} {text}")
+        else:
+            passages.append((position, start_ms, end_ms, text))
+    return passages
+
+def phrase_query(phrase):
+    # The whole input is one FTS5 phrase, so quotes and operators in it are taken literally
+    return '"' + phrase.replace('"', '""') + '"'
+
+class CaptionIndex:
+    # On-disk inverted index (SQLite FTS5) of caption passages aligned to the cut intervals. A phrase
+    # lookup returns (video, chapter, timestamp) without touching any media.
+
+    def __init__(self, path=DEFAULT_CAPTION_INDEX_PATH):
+        self.path = path
+        # Shared by the batch workers; writes are serialized with the lock
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript('''
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            title TEXT,
+            indexed_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chapters (
+            video_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            start_ms INTEGER NOT NULL,
+            end_ms INTEGER,
+            PRIMARY KEY (video_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS passages (
+            id INTEGER PRIMARY KEY,
+            video_id TEXT NOT NULL,
+            chapter INTEGER,
+            start_ms INTEGER NOT NULL,
+            end_ms INTEGER NOT NULL,
+            text TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS passages_video_idx ON passages (video_id);
+        -- The inverted index over passages.text; the triggers keep it in step with the table
+        CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+            text, content = 'passages', content_rowid = 'id', tokenize = 'porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS passages_ai AFTER INSERT ON passages BEGIN
+            INSERT INTO passages_fts (rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS passages_ad AFTER DELETE ON passages BEGIN
+            INSERT INTO passages_fts (passages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END;''')
+        self.conn.commit()
+
+    def add_video(self, video_id, title, chapters, cues):
+        # Replaces whatever was indexed for the video before
+        passages = align_captions(cues, chapters)
+        with self.lock:
+            self.conn.execute('DELETE FROM passages WHERE video_id = ?', (video_id,))
+            self.conn.execute('DELETE FROM chapters WHERE video_id = ?', (video_id,))
+            self.conn.execute('INSERT OR REPLACE INTO videos VALUES (?, ?, ?)', (video_id, title, time.time()))
+            self.conn.executemany('INSERT INTO chapters VALUES (?, ?, ?, ?, ?)',
+                                  [(video_id, i, chapter_title, start_ms, end_ms)
+                                   for i, (start_ms, end_ms, chapter_title) in enumerate(chapters)])
+            self.conn.executemany('INSERT INTO passages (video_id, chapter, start_ms, end_ms, text) VALUES (?, ?, ?, ?, ?)',
+                                  [(video_id, position, start_ms, end_ms, text)
+                                   for position, start_ms, end_ms, text in passages])
+            self.conn.commit()
+        return len(passages)
+
+    def contains(self, video_id):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM videos WHERE video_id = ?', (video_id,)).fetchone() is not None
+
+    def search(self, phrase, video_id=None, limit=20):
+        # Best matches first: [{'video_id', 'video_title', 'chapter', 'chapter_start_ms', 'chapter_end_ms',
+        # 'start_ms', 'snippet'}]
+        query = f'''
+        SELECT p.video_id, v.title, c.title, c.start_ms, c.end_ms, p.start_ms,
+               snippet(passages_fts, 0, '[', ']', '...', {SNIPPET_TOKENS})
+        FROM passages_fts JOIN passages p ON p.id = passages_fts.rowid
+        LEFT JOIN videos v ON v.video_id = p.video_id
+        LEFT JOIN chapters c ON c.video_id = p.video_id AND c.position = p.chapter
+        WHERE passages_fts MATCH ?'''
+        params = [phrase_query(phrase)]
+        if video_id:
+            query += ' AND p.video_id = ?'
+            params.append(video_id)
+        query += ' ORDER BY bm25(passages_fts) LIMIT ?'
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [{'video_id': row[0], 'video_title': row[1], 'chapter': row[2], 'chapter_start_ms': row[3],
+                 'chapter_end_ms': row[4], 'start_ms': row[5], 'snippet': row[6]} for row in rows]
+
+    def matching_videos(self, phrase):
+        with self.lock:
+            rows = self.conn.execute('''SELECT DISTINCT p.video_id FROM passages_fts JOIN passages p ON p.id = passages_fts.rowid
+                                     WHERE passages_fts MATCH ? ORDER BY p.video_id''',
+                                     (phrase_query(phrase),)).fetchall()
+        return [row[0] for row in rows]
+
+    def matching_intervals(self, phrase, video_id, context_ms=None):
+        # The [(start_ms, end_ms, title)] of a video to cut for a phrase: every chapter that mentions
+        # it, or with context_ms a window around each matching passage instead
+        query = '''
+        SELECT p.start_ms, p.end_ms, c.start_ms, c.end_ms, c.title
+        FROM passages_fts JOIN passages p ON p.id = passages_fts.rowid
+        LEFT JOIN chapters c ON c.video_id = p.video_id AND c.position = p.chapter
+        WHERE passages_fts MATCH ? AND p.video_id = ? ORDER BY p.start_ms'''
+        with self.lock:
+            rows = self.conn.execute(query, (phrase_query(phrase), video_id)).fetchall()
+        intervals = []
+        for start_ms, end_ms, chapter_start, chapter_end, chapter_title in rows:
+            if context_ms is not None:
+                interval = (max(0, start_ms - context_ms), end_ms + context_ms,
+                            f"{chapter_title or phrase} at {format_ms(start_ms)}")
+            elif chapter_title is not None:
+                interval = (chapter_start, chapter_end, chapter_title)
+            else:
+                continue
+            if interval not in intervals:
+                intervals.append(interval)
+        return intervals
+
+    def close(self):
+        self.conn.close()
+
+_default_index = None
+
+def get_index():
+    global _default_index
+    if _default_index is None:
+        _default_index = CaptionIndex()
+    return _default_index
+
+def index_video(index, video_url, title, chapters):
+    # Fetches the captions of a video and indexes them against chapters ([(start_ms, end_ms, title)]).
+    # Failures are reported and never fail the job.
+    try:
+        cues = fetch_captions(video_url)
+    except Exception as e:
+        print(f"Error fetching captions for {video_url}: {e}")
+        return 0
+    if not cues:
+        print(f"No captions available for {video_url}.")
+        return 0
+    count = index.add_video(canonical_video_id(video_url), title, chapters, cues)
+    print(f"Indexed {count} caption passages for {video_url}")
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Index video captions by chapter and search them.')
+    parser.add_argument('-search', type=str, help='Phrase to look up')
+    parser.add_argument('-index', type=str, help='Video URL or ID whose captions are indexed (by its description chapters with -api_key)')
+    parser.add_argument('-api_key', type=str, help='YouTube Data API key, to align -index captions to description chapters')
+    parser.add_argument('-video', type=str, help='Only search this video (URL or ID)')
+    parser.add_argument('-limit', type=int, help='Maximum number of matches', default=20)
+    parser.add_argument('-intervals_out', type=str, help='With -search and -video, write the matching chapters as an intervals JSON file')
+    parser.add_argument('-context', type=float, help='Seconds around each match to cut instead of the whole chapter (-intervals_out)', default=None)
+    parser.add_argument('-index_path', type=str, help='Caption index file', default=DEFAULT_CAPTION_INDEX_PATH)
+    args = parser.parse_args()
+    if not args.search and not args.index:
+        parser.error("one of -search or -index is required")
+
+    index = CaptionIndex(args.index_path)
+    try:
+        if args.index:
+            chapters = []
+            title = None
+            if args.api_key:
+                import youtube_api
+                import chapter_parser
+                video_id = canonical_video_id(args.index)
+                description, title, duration = youtube_api.get_videos_details(args.api_key, [video_id]).get(video_id, (None, None, None))
+                chapters = chapter_parser.parse_chapters(description, duration)
+            index_video(index, canonical_url(canonical_video_id(args.index)), title, chapters)
+
+        if args.search:
+            video_id = canonical_video_id(args.video) if args.video else None
+            started = time.perf_counter()
+            matches = index.search(args.search, video_id, args.limit)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            for match in matches:
+                chapter = f"'{match['chapter']}'" if match['chapter'] is not None else '(no chapter)'
+                print(f"{match['video_id']} {chapter} at {format_ms(match['start_ms'])}: {match['snippet']}")
+            print(f"{len(matches)} matches in {elapsed_ms:.1f} ms")
+            if args.intervals_out:
+                if not video_id:
+                    parser.error("-intervals_out needs -video")
+                context_ms = int(args.context * 1000) if args.context is not None else None
+                intervals = index.matching_intervals(args.search, video_id, context_ms)
+                with open(args.intervals_out, 'w') as file:
+                    json.dump([{'start': format_ms(start_ms), 'end': format_ms(end_ms) if end_ms is not None else 'end',
+                                'title': title} for start_ms, end_ms, title in intervals], file, indent=2)
+                print(f"Wrote {len(intervals)} intervals to {args.intervals_out}")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
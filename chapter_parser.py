@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import re
+
+# A timestamp at the start of a line (after optional bullets or brackets) followed by the title, or
+# a title followed by a separated or bracketed timestamp at the end of the line ("Intro - 0:00",
+# "Intro (0:00)"). Timestamps inside running text are ignored.
+_TIMESTAMP = r'((?:\d{1,2}:)?\d{1,2}:\d{2})'
+LEADING_TIMESTAMP = re.compile(r'[\s\-*•>#]*[\[(]?' + _TIMESTAMP + r'[\])]?(?:\s+|\s*[-–—:|.]\s*|$)(.*)')
+TRAILING_TIMESTAMP = re.compile(r'(?:\s[-–—|]\s*|\s*[\[(])' + _TIMESTAMP + r'[\])]?\s*$')
+# A trailing separator, brackets and H:MM:SS timestamp always fit in the last few characters
+TRAILING_WINDOW = 24
+TITLE_STRIP = ' \t-–—:|•*'
+
+def timestamp_to_ms(timestamp):
+    seconds = 0
+    for part in timestamp.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds * 1000
+
+def format_ms(ms):
+    seconds, millis = divmod(int(ms), 1000)
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    if millis:
+        return f"{h:02d}:{m:02d}:{s:02d}.{millis:03d}"
+    return f"{h:02d}:{m:02d}:{s:02d}"
+
+def _match_line(line):
+    # Cheap first/last character checks keep the regexes off ordinary prose lines
+    line = line.strip()
+    if not line:
+        return None
+    first = line.lstrip(' -*•>#')[:1]
+    if first.isdigit() or first in ('[', '('):
+        match = LEADING_TIMESTAMP.match(line)
+        if match:
+            return match.group(1), match.group(2)
+    if line[-1].isdigit() or line[-1] in (']', ')'):
+        match = TRAILING_TIMESTAMP.search(line, max(0, len(line) - TRAILING_WINDOW))
+        if match and match.start() > 0:
+            return match.group(1), line[:match.start()]
+    return None
+
+def parse_chapters(description, duration=None):
+    # Returns [(start_ms, end_ms, title)] in one pass over the description lines. Timestamps that do
+    # not increase, or that fall at or after the video duration (seconds), are dropped; each chapter
+    # ends where the next starts and the last one ends at the duration (None when unknown).
+    duration_ms = int(duration * 1000) if duration else None
+    starts = []
+    for line in (description or '').splitlines():
+        if ':' not in line:
+            continue
+        found = _match_line(line)
+        if not found:
+            continue
+        start_ms = timestamp_to_ms(found[0])
+        if starts and start_ms <= starts[-1][0]:
+            continue
+        if duration_ms is not None and start_ms >= duration_ms:
+            continue
+        title = found[1].strip(TITLE_STRIP) or f'Chapter {len(starts) + 1}'
+        starts.append((start_ms, title))
+
+    chapters = []
+    for i, (start_ms, title) in enumerate(starts):
+        end_ms = starts[i + 1][0] if i + 1 < len(starts) else duration_ms
+        chapters.append((start_ms, end_ms, title))
+    return chapters
+
+def chapters_to_intervals(chapters, open_end='end'):
+    # The (start, end, title) time-string intervals used by the app scripts
+    return [(format_ms(start_ms), format_ms(end_ms) if end_ms is not None else open_end, title)
+            for start_ms, end_ms, title in chapters]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# Check of the shared bandwidth scheduler against a local throttled HTTP server that serves byte
+# ranges, as the pytube backend downloads them. The check fails unless:
+# - two concurrent ranged downloads together stay under the total cap (and use most of it)
+# - a job whose cutter is waiting for it (set_waiting) gets a larger share and finishes first
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bandwidth
+
+MIB = 1024 * 1024
+WRITE_CHUNK = 64 * 1024
+# The cap may be exceeded by the scheduler's burst allowance and the chunks already in flight
+CAP_TOLERANCE = 1.15
+MIN_UTILISATION = 0.7
+# With the boost the waiting job gets 4/5 of the cap and finishes at about 0.63 of the other
+# job's time; without it both finish together
+MAX_BOOSTED_FINISH_RATIO = 0.8
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # Serves server.payload with Range support, each connection throttled to server.connection_rate
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.payload)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        payload = self.server.payload
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else len(payload) - 1, len(payload) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+        else:
+            start, end = 0, len(payload) - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        for offset in range(start, end + 1, WRITE_CHUNK):
+            self.wfile.write(payload[offset:min(offset + WRITE_CHUNK, end + 1)])
+            time.sleep(WRITE_CHUNK / float(self.server.connection_rate))
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(size, connection_rate):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.daemon_threads = True
+    server.payload = os.urandom(size)
+    server.connection_rate = connection_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/video.mp4"
+
+def run_jobs(url, work_dir, scheduler, waiting_job=None):
+    # Downloads the file as two jobs at the same time; returns ({job: seconds to finish}, total seconds)
+    finished = {}
+    errors = []
+    started = time.monotonic()
+
+    def job(name):
+        scheduler.register(name)
+        if name == waiting_job:
+            scheduler.set_waiting(name)
+        try:
+            bandwidth.ranged_download(url, os.path.join(work_dir, f"{name}.mp4"), job_id=name, scheduler=scheduler)
+            finished[name] = time.monotonic() - started
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+        finally:
+            scheduler.unregister(name)
+
+    threads = [threading.Thread(target=job, args=(name,)) for name in ('first', 'second')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise RuntimeError('; '.join(errors))
+    return finished, time.monotonic() - started
+
+def check_files(work_dir, payload, failures):
+    for name in ('first', 'second'):
+        with open(os.path.join(work_dir, f"{name}.mp4"), 'rb') as file:
+            if file.read() != payload:
+                failures.append(f"{name}: downloaded file differs from the served one")
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the bandwidth cap and the waiting-job boost against a local throttled server.')
+    parser.add_argument('-cap_mib', type=float, help='Total bandwidth cap in MiB/s', default=4)
+    parser.add_argument('-size_mib', type=int, help='Size of each of the two downloads in MiB', default=6)
+    parser.add_argument('-server_mib', type=float, help='Per-connection rate of the local server in MiB/s', default=4)
+    args = parser.parse_args()
+
+    cap = args.cap_mib * MIB
+    server, url = start_server(args.size_mib * MIB, args.server_mib * MIB)
+    work_dir = tempfile.mkdtemp(prefix='check_bandwidth_')
+    failures = []
+    try:
+        finished, seconds = run_jobs(url, work_dir, bandwidth.BandwidthScheduler(cap))
+        check_files(work_dir, server.payload, failures)
+        rate = 2 * len(server.payload) / seconds
+        print(f"Capped: 2 x {args.size_mib} MiB in {seconds:.2f}s, {rate / MIB:.2f} MiB/s (cap {args.cap_mib:g} MiB/s)")
+        if rate > cap * CAP_TOLERANCE:
+            failures.append(f"total rate {rate / MIB:.2f} MiB/s is over the {args.cap_mib:g} MiB/s cap")
+        if rate < cap * MIN_UTILISATION:
+            failures.append(f"total rate {rate / MIB:.2f} MiB/s uses less than {MIN_UTILISATION:.0%} of the cap")
+
+        finished, seconds = run_jobs(url, work_dir, bandwidth.BandwidthScheduler(cap), waiting_job='first')
+        check_files(work_dir, server.payload, failures)
+        ratio = finished['first'] / finished['second']
+        print(f"Waiting boost: waiting job finished after {finished['first']:.2f}s, other job after "
+              f"{finished['second']:.2f}s (ratio {ratio:.2f})")
+        if ratio > MAX_BOOSTED_FINISH_RATIO:
+            failures.append(f"the waiting job finished at {ratio:.2f} of the other job's time "
+                            f"(expected at most {MAX_BOOSTED_FINISH_RATIO})")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: the total rate stays under the cap and waiting jobs are boosted")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Regression check for chunk-parallel encoding. A generated source is cut with
+# chunked_encode.encode_interval, and the check fails unless the output is continuous:
+# - video frame timestamps advance by exactly one frame duration (no gap or repeat at a chunk join)
+# - audio packets advance by exactly one AAC frame (no gap or overlap)
+# - audio and video cover the requested duration
+# - the whole output decodes without errors
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import chunked_encode
+import encoder_profiles
+import media
+
+FRAME_RATE = 30
+SAMPLE_RATE = 48000
+AAC_FRAME_SAMPLES = 1024
+# Two seconds between source keyframes, like a typical upload
+GOP_FRAMES = 60
+
+def make_source(output_path, seconds):
+    media.run_ffmpeg(['-f', 'lavfi', '-i', f'testsrc2=size=640x360:rate={FRAME_RATE}:duration={seconds}',
+                      '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate={SAMPLE_RATE}:duration={seconds}',
+                      '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(GOP_FRAMES), '-keyint_min', str(GOP_FRAMES),
+                      '-c:a', 'aac', '-ar', str(SAMPLE_RATE), output_path])
+
+def packet_times(path, stream):
+    # (pts, duration) of every packet of the stream, in seconds, in presentation order
+    cmd = [media.FFPROBE_BINARY, '-v', 'error', '-select_streams', stream, '-show_entries',
+           'packet=pts_time,duration_time', '-of', 'csv=p=0', path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    packets = []
+    for line in result.stdout.splitlines():
+        pts, duration = (line.split(',') + [''])[:2]
+        if pts not in ('', 'N/A'):
+            packets.append((float(pts), float(duration) if duration not in ('', 'N/A') else 0.0))
+    return sorted(packets)
+
+def check_continuity(packets, step, name, failures):
+    tolerance = step * 0.05
+    for (previous, _), (current, _) in zip(packets, packets[1:]):
+        if abs(current - previous - step) > tolerance:
+            failures.append(f"{name}: {current - previous:.6f}s between packets at {previous:.3f}s and {current:.3f}s "
+                            f"(expected {step:.6f}s)")
+            return
+    if packets and abs(packets[0][0]) > step:
+        failures.append(f"{name}: starts at {packets[0][0]:.3f}s instead of 0")
+
+def check_output(path, expected_duration):
+    failures = []
+    frame = 1.0 / FRAME_RATE
+    video = packet_times(path, 'v:0')
+    audio = packet_times(path, 'a:0')
+    check_continuity(video, frame, 'video', failures)
+    check_continuity(audio, AAC_FRAME_SAMPLES / float(SAMPLE_RATE), 'audio', failures)
+    for name, packets, tolerance in (('video', video, frame * 1.5),
+                                     ('audio', audio, AAC_FRAME_SAMPLES / float(SAMPLE_RATE) * 2)):
+        covered = packets[-1][0] + packets[-1][1] - packets[0][0] if packets else 0.0
+        if abs(covered - expected_duration) > tolerance:
+            failures.append(f"{name}: covers {covered:.3f}s instead of {expected_duration:.3f}s")
+    decode = subprocess.run([media.FFMPEG_BINARY, '-v', 'error', '-xerror', '-i', path, '-f', 'null', '-'],
+                            capture_output=True, text=True)
+    if decode.returncode != 0 or decode.stderr.strip():
+        failures.append(f"output does not decode cleanly: {decode.stderr.strip() or decode.returncode}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that chunk-parallel encoding gives continuous timestamps and gapless audio.')
+    parser.add_argument('-seconds', type=float, help='Length of the generated source', default=40)
+    parser.add_argument('-chunk_seconds', type=float, help='Chunk length', default=6)
+    parser.add_argument('-workers', type=int, help='Chunks encoded at the same time', default=4)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='check_chunked_')
+    try:
+        source = os.path.join(work_dir, 'source.mp4')
+        make_source(source, args.seconds)
+        # Neither end falls on a keyframe, so the first and last chunks start and stop mid-GOP
+        start, end = 3.5, args.seconds - 2.7
+        output_path = os.path.join(work_dir, 'output.mp4')
+        profile = encoder_profiles.get_profile('fast')
+        started = time.monotonic()
+        count = chunked_encode.encode_interval(source, start, end, output_path, profile, args.workers,
+                                               chunk_seconds=args.chunk_seconds)
+        print(f"Encoded {end - start:.1f}s in {count} chunks with {args.workers} workers in {time.monotonic() - started:.2f}s")
+        failures = [] if count > 1 else [f"expected several chunks, got {count}"]
+        failures += check_output(output_path, end - start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: timestamps are continuous and the audio is gapless")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
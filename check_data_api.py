@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+# Check of the Data API ingestion against a local fake of the API, reached through YOUTUBE_API_BASE.
+# The fake serves a channel whose uploads playlist spans several pages, one upload without metadata
+# (private or removed), and answers the first videos.list call of the batch run with a 429. The
+# check fails unless:
+# - -channel resolves the @handle to the uploads playlist and follows every nextPageToken
+# - metadata is fetched with one videos.list call of at most 50 IDs per page
+# - the video without metadata is skipped and the others keep their playlist order
+# - batch.py -discover_only retries the 429 and emits one job with chapters per unique URL
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import chapter_parser
+import youtube_api
+
+API_KEY = 'fake-key'
+HANDLE = '@fakechannel'
+UPLOADS_PLAYLIST_ID = 'UUfakechannel'
+PAGE_SIZE = 50
+DESCRIPTION = "Recorded at the spring meetup.\n\n0:00 Intro\n1:30 Talk\n12:45 Questions\n"
+DURATION = 'PT15M2S'
+
+def video_id(number):
+    return f"vid{number:08d}"
+
+class FakeDataAPI(BaseHTTPRequestHandler):
+    # channels.list, playlistItems.list and videos.list, enough for the ingestion paths
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        resource = parsed.path.rstrip('/').split('/')[-1]
+        params = {name: values[0] for name, values in parse_qs(parsed.query).items()}
+        api = self.server.api
+        with api['lock']:
+            api['calls'].append((resource, params))
+            throttled = resource == 'videos' and api['throttle_videos'] > 0
+            if throttled:
+                api['throttle_videos'] -= 1
+        if params.get('key') != API_KEY:
+            return self.send_json(400, {'error': {'code': 400, 'message': 'API key not valid'}})
+        if throttled:
+            return self.send_json(429, {'error': {'code': 429, 'message': 'Rate limit exceeded'}})
+        if resource == 'channels':
+            items = []
+            if params.get('forHandle') == HANDLE:
+                items = [{'contentDetails': {'relatedPlaylists': {'uploads': UPLOADS_PLAYLIST_ID}}}]
+            return self.send_json(200, {'items': items})
+        if resource == 'playlistItems':
+            uploads = api['uploads'] if params.get('playlistId') == UPLOADS_PLAYLIST_ID else []
+            start = int(params.get('pageToken') or 0)
+            end = start + min(int(params.get('maxResults', 5)), PAGE_SIZE)
+            body = {'items': [{'contentDetails': {'videoId': vid}} for vid in uploads[start:end]]}
+            if end < len(uploads):
+                body['nextPageToken'] = str(end)
+            return self.send_json(200, body)
+        if resource == 'videos':
+            ids = params.get('id', '').split(',')
+            if len(ids) > PAGE_SIZE:
+                return self.send_json(400, {'error': {'code': 400, 'message': 'Too many IDs'}})
+            items = [{'id': vid, 'snippet': {'title': f"Talk {vid}", 'description': DESCRIPTION},
+                      'contentDetails': {'duration': DURATION}}
+                     for vid in ids if vid in api['uploads'] and vid != api['missing']]
+            return self.send_json(200, {'items': items})
+        self.send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(upload_count, missing):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeDataAPI)
+    server.daemon_threads = True
+    uploads = [video_id(number) for number in range(upload_count)]
+    server.api = {'lock': threading.Lock(), 'calls': [], 'throttle_videos': 0,
+                  'uploads': uploads, 'missing': uploads[missing]}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/youtube/v3"
+
+def check_channel(server, failures):
+    api = server.api
+    del api['calls'][:]
+    videos = list(youtube_api.iter_channel_videos(API_KEY, f"https://www.youtube.com/{HANDLE}"))
+    expected = [vid for vid in api['uploads'] if vid != api['missing']]
+    found = [url.split('v=')[-1] for url, _, _, _ in videos]
+    pages = [params for resource, params in api['calls'] if resource == 'playlistItems']
+    batches = [params['id'].split(',') for resource, params in api['calls'] if resource == 'videos']
+    print(f"Channel: {len(videos)} videos from {len(pages)} playlist pages and {len(batches)} videos.list calls")
+    if found != expected:
+        failures.append(f"channel: got {len(found)} videos, expected {len(expected)} in playlist order")
+    if len(pages) != -(-len(api['uploads']) // PAGE_SIZE):
+        failures.append(f"channel: {len(pages)} playlist pages fetched for {len(api['uploads'])} uploads")
+    if len(batches) != len(pages) or any(len(batch) > PAGE_SIZE for batch in batches):
+        failures.append(f"channel: videos.list batches of {[len(batch) for batch in batches]} IDs")
+    if videos and videos[0][3] != youtube_api.manually_parse_duration(DURATION):
+        failures.append(f"channel: duration {videos[0][3]} instead of {youtube_api.manually_parse_duration(DURATION)}")
+
+def check_batch(server, base, work_dir, failures):
+    # A URLs file with every upload once, one repeated under another URL form, run as a subprocess
+    # with YOUTUBE_API_BASE pointing at the fake
+    api = server.api
+    del api['calls'][:]
+    api['throttle_videos'] = 1
+    urls_path = os.path.join(work_dir, 'urls.txt')
+    with open(urls_path, 'w') as file:
+        for vid in api['uploads']:
+            file.write(f"https://www.youtube.com/watch?v={vid}\n")
+        file.write(f"https://youtu.be/{api['uploads'][0]}\n")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'batch.py')
+    result = subprocess.run([sys.executable, script, '-urls_file', urls_path, '-api_key', API_KEY, '-discover_only',
+                             '-no_fallback', '-schedule', 'fifo'],
+                            cwd=work_dir, env=dict(os.environ, YOUTUBE_API_BASE=base),
+                            capture_output=True, text=True, timeout=120)
+    jobs = [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+    retried = 'retrying' in result.stdout
+    expected = sorted(vid for vid in api['uploads'] if vid != api['missing'])
+    print(f"Batch: {len(jobs)} jobs, 429 {'retried' if retried else 'not retried'}, exit code {result.returncode}")
+    if result.returncode != 0:
+        failures.append(f"batch.py exited with {result.returncode}: {result.stderr.strip()[-300:]}")
+    if not retried:
+        failures.append("batch: the 429 answer was not retried")
+    if sorted(job['video_id'] for job in jobs) != expected:
+        failures.append(f"batch: {len(jobs)} jobs for {len(expected)} unique available videos")
+    chapters = chapter_parser.chapters_to_intervals(
+        chapter_parser.parse_chapters(DESCRIPTION, youtube_api.manually_parse_duration(DURATION)))
+    if any([tuple(interval) for interval in job['intervals']] != chapters for job in jobs):
+        failures.append("batch: jobs do not carry the description chapters")
+    if any(len(params['id'].split(',')) > PAGE_SIZE for resource, params in api['calls'] if resource == 'videos'):
+        failures.append("batch: a videos.list call asked for more than 50 IDs")
+
+def main():
+    parser = argparse.ArgumentParser(description='Check playlist, channel and batch ingestion against a local fake of the Data API.')
+    parser.add_argument('-uploads', type=int, help='Videos in the fake channel', default=120)
+    args = parser.parse_args()
+
+    server, base = start_server(args.uploads, missing=args.uploads // 2)
+    # This process reads the hook at import, so it is pointed at the fake directly; batch.py gets
+    # YOUTUBE_API_BASE in its environment
+    youtube_api.API_BASE = base
+    work_dir = tempfile.mkdtemp(prefix='check_data_api_')
+    failures = []
+    try:
+        check_channel(server, failures)
+        check_batch(server, base, work_dir, failures)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: paging, batching, skipping and retries behave against the fake API")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Startup-time regression check for the CLI entry points. Each script is loaded in a fresh
+# interpreter; the check fails when `-h` takes longer than the budget or when loading the
+# script pulls in one of the heavy backends, which must only be imported by the stage that uses them.
+
+import os
+import subprocess
+import sys
+import time
+
+BUDGET_SECONDS = 0.2
+RUNS = 3
+HEAVY_MODULES = ['moviepy', 'yt_dlp', 'requests', 'pytube', 'psycopg2', 'numpy', 'imageio', 'proglog', 'selenium']
+ENTRY_POINTS = ['app.py', 'app-intervals.py', 'app-chapters.py', 'app-new.py', 'app-resolution.py',
+                'highlights.py', 'batch.py', 'service.py', 'watch_folder.py', 'captions.py',
+                'feature_store.py', 'with-db/app-db.py']
+
+LOAD_SNIPPET = """
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location('entry_point', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(','.join(sorted(name for name in sys.argv[2].split(',') if name in sys.modules)))
+"""
+
+def startup_seconds(script_path):
+    best = None
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, script_path, '-h'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def heavy_imports(script_path):
+    result = subprocess.run([sys.executable, '-c', LOAD_SNIPPET, script_path, ','.join(HEAVY_MODULES)],
+                            capture_output=True, text=True, check=True)
+    return [name for name in result.stdout.strip().split(',') if name]
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    failures = []
+    for entry_point in ENTRY_POINTS:
+        script_path = os.path.join(base_dir, entry_point)
+        seconds = startup_seconds(script_path)
+        loaded = heavy_imports(script_path)
+        print(f"{entry_point}: {seconds * 1000:.0f} ms" + (f", heavy imports: {', '.join(loaded)}" if loaded else ""))
+        if seconds > BUDGET_SECONDS:
+            failures.append(f"{entry_point} took {seconds * 1000:.0f} ms (budget {BUDGET_SECONDS * 1000:.0f} ms)")
+        if loaded:
+            failures.append(f"{entry_point} imports {', '.join(loaded)} at module load")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
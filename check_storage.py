@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Check of the S3 output storage against an S3-compatible endpoint. By default a local stand-in for
+# MinIO is started with moto's server (pip install "moto[server]"); pass -endpoint to use a real
+# MinIO or S3 endpoint instead (credentials from the usual boto3 sources). The check fails unless:
+# - an encode streamed through the FIFO lands as one object bigger than a part, and decodes when
+#   read back through its presigned URL
+# - a failed encode leaves neither an object nor an unfinished multipart upload behind
+# - publish uploads the side files and list_outputs lists the video under the s3:// location
+# - link copies a published location to another one inside the bucket
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import media
+import storage
+
+PART_SIZE = 5 * 1024 * 1024
+# A high bitrate so the generated output spans several parts
+SOURCE_SECONDS = 6
+SOURCE_BITRATE = '20M'
+
+def start_stand_in():
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'check')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'check')
+    from moto.server import ThreadedMotoServer
+    # The stand-in logs every request otherwise
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    return server, f"http://{host}:{port}"
+
+def encode(output_path, store, valid=True):
+    source = f'testsrc2=size=1280x720:rate=30:duration={SOURCE_SECONDS}' if valid else 'nosuchfilter'
+    media.run_ffmpeg(['-f', 'lavfi', '-i', source, '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', SOURCE_BITRATE]
+                     + store.ffmpeg_params + ['-f', 'mp4', output_path])
+
+def check_streamed_upload(store, output_directory, failures):
+    path = os.path.join(output_directory, 'check.mp4')
+    with store.writer(path) as write_path:
+        encode(write_path, store)
+    if not store.exists(path):
+        failures.append("streamed encode did not produce an object")
+        return
+    size = store.client.head_object(Bucket=store.bucket, Key=store.key_for(path))['ContentLength']
+    print(f"Streamed upload: {size / 1048576.0:.1f} MiB in parts of {store.part_size // 1048576} MiB")
+    if size <= store.part_size:
+        failures.append(f"the output ({size} bytes) fits in one part; it does not exercise the multipart path")
+    errors = media.decode_errors(store.reader(path))
+    if errors:
+        failures.append(f"the uploaded output does not decode through its presigned URL: {errors.splitlines()[0]}")
+
+def check_failed_upload(store, output_directory, failures):
+    path = os.path.join(output_directory, 'failed.mp4')
+    try:
+        with store.writer(path) as write_path:
+            encode(write_path, store, valid=False)
+        failures.append("a failed encode did not raise")
+    except subprocess.CalledProcessError:
+        pass
+    uploads = store.client.list_multipart_uploads(Bucket=store.bucket, Prefix=store.key_for(path)).get('Uploads', [])
+    print(f"Failed upload: object {'left behind' if store.exists(path) else 'absent'}, "
+          f"{len(uploads)} unfinished multipart uploads")
+    if store.exists(path):
+        failures.append("a failed encode left an object behind")
+    if uploads:
+        failures.append("a failed encode left an unfinished multipart upload behind")
+
+def check_publish_and_link(store, output_directory, failures):
+    with open(os.path.join(output_directory, 'manifest.json'), 'w') as file:
+        file.write('{}')
+    location = store.publish(output_directory)
+    outputs = store.list_outputs(location)
+    keys = store.list_keys(location[len(f"s3://{store.bucket}/"):] + '/')
+    print(f"Published {location}: {[output['name'] for output in outputs]}, {len(keys)} objects")
+    if [output['name'] for output in outputs] != ['check.mp4']:
+        failures.append(f"list_outputs({location}) returned {outputs}")
+    if not any(key.endswith('/manifest.json') for key in keys):
+        failures.append("publish did not upload manifest.json")
+    copy = store.link(location, store.output_directory('Check copy'))
+    if store.list_outputs(copy) != outputs:
+        failures.append(f"link to {copy} listed {store.list_outputs(copy)} instead of {outputs}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Check streaming S3 output storage against a local MinIO stand-in or a given endpoint.')
+    parser.add_argument('-endpoint', type=str, default=None, help='S3-compatible endpoint, e.g. http://127.0.0.1:9000 (default: start a local stand-in)')
+    parser.add_argument('-bucket', type=str, default='extractor-check', help='Bucket to use; created when missing')
+    parser.add_argument('-upload_concurrency', type=int, default=storage.DEFAULT_UPLOAD_CONCURRENCY, help='Parts uploaded at the same time')
+    args = parser.parse_args()
+
+    server = None
+    if args.endpoint:
+        endpoint = args.endpoint
+    else:
+        server, endpoint = start_stand_in()
+    # The module reads S3_ENDPOINT_URL at import; the check points it at the endpoint directly
+    storage.S3_ENDPOINT_URL = endpoint
+    spool_root = tempfile.mkdtemp(prefix='check_storage_')
+    failures = []
+    try:
+        store = storage.S3Storage(args.bucket, 'check', part_size=PART_SIZE, concurrency=args.upload_concurrency,
+                                  spool_root=spool_root)
+        if args.bucket not in [bucket['Name'] for bucket in store.client.list_buckets()['Buckets']]:
+            store.client.create_bucket(Bucket=args.bucket)
+        output_directory = store.output_directory('Check')
+        check_streamed_upload(store, output_directory, failures)
+        check_failed_upload(store, output_directory, failures)
+        check_publish_and_link(store, output_directory, failures)
+    finally:
+        shutil.rmtree(spool_root, ignore_errors=True)
+        if server:
+            server.stop()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: streaming upload, abort, publish and link work against {endpoint}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# End-to-end check of the watch-folder daemon. A generated mp4 and its intervals JSON are dropped
+# into a fresh watch directory and watch_folder.py -once is run on it. The check fails unless the
+# pair ends up in one output directory with one cut per interval, each as long as its interval.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import media
+
+SOURCE_SECONDS = 12
+INTERVALS = [{'start': '00:00:02', 'end': '00:00:05', 'title': 'Intro'},
+             {'start': '00:00:06', 'end': '00:00:10.500', 'title': 'Main part'}]
+EXPECTED_SECONDS = {'Intro.mp4': 3.0, 'Main part.mp4': 4.5}
+# moviepy rounds cuts to whole frames and AAC adds a frame of padding
+DURATION_TOLERANCE = 0.15
+
+def make_pair(watch_dir, stem):
+    media.run_ffmpeg(['-f', 'lavfi', '-i', f'testsrc2=size=320x180:rate=25:duration={SOURCE_SECONDS}',
+                      '-f', 'lavfi', '-i', f'sine=frequency=440:duration={SOURCE_SECONDS}',
+                      '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest',
+                      os.path.join(watch_dir, f'{stem}.mp4')])
+    with open(os.path.join(watch_dir, f'{stem}.json'), 'w') as file:
+        json.dump(INTERVALS, file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run one video/intervals pair through watch_folder.py -once and check the cuts.')
+    parser.add_argument('-workers', type=int, help='Cuts running at the same time', default=2)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='check_watch_folder_')
+    failures = []
+    try:
+        watch_dir = os.path.join(work_dir, 'incoming')
+        output_root = os.path.join(work_dir, 'outputs')
+        os.makedirs(watch_dir)
+        make_pair(watch_dir, 'talk')
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'watch_folder.py')
+        result = subprocess.run([sys.executable, script, '-watch_dir', watch_dir, '-output_root', output_root,
+                                 '-once', '-poll', '-settle', '0.2', '-workers', str(args.workers), '-profile', 'fast'],
+                                capture_output=True, text=True, timeout=600)
+        if result.returncode != 0:
+            failures.append(f"watch_folder.py exited with {result.returncode}: {result.stderr.strip()[-300:]}")
+        output_dirs = sorted(os.listdir(output_root)) if os.path.isdir(output_root) else []
+        print(f"Output directories: {output_dirs}")
+        if output_dirs != ['talk']:
+            failures.append(f"expected one output directory 'talk', found {output_dirs}")
+        else:
+            outputs = sorted(name for name in os.listdir(os.path.join(output_root, 'talk')) if name.endswith('.mp4'))
+            if outputs != sorted(EXPECTED_SECONDS):
+                failures.append(f"expected cuts {sorted(EXPECTED_SECONDS)}, found {outputs}")
+            for name in outputs:
+                seconds = media.get_duration(os.path.join(output_root, 'talk', name))
+                expected = EXPECTED_SECONDS.get(name)
+                print(f"{name}: {seconds:.3f}s (expected {expected}s)")
+                if expected is not None and abs(seconds - expected) > DURATION_TOLERANCE:
+                    failures.append(f"{name} is {seconds:.3f}s long instead of {expected}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: the pair was cut into one output directory with the requested intervals")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
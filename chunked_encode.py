@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import encoder_profiles
+import media
+
+# Target chunk length; boundaries are moved to the next keyframe of the source
+CHUNK_SECONDS = 60
+# Shorter intervals are encoded in one pass, where splitting them would cost more than it saves
+MIN_CHUNKED_SECONDS = 120
+# moviepy writes yuv420p; chunks must match it and each other for the stream-copy concat
+PIX_FMT = 'yuv420p'
+
+def plan_chunks(keyframes, start, end, chunk_seconds=CHUNK_SECONDS):
+    # [(chunk_start, chunk_end)] covering start..end. Every inner boundary is a source keyframe, so
+    # each chunk decodes on its own, and no chunk is shorter than half the target length.
+    boundaries = [start]
+    for keyframe in keyframes:
+        if keyframe - boundaries[-1] >= chunk_seconds and end - keyframe >= chunk_seconds / 2.0:
+            boundaries.append(keyframe)
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def chunk_threads(profile, workers):
+    # Without an explicit thread count each x264 process would start a thread per core
+    if profile['threads']:
+        return profile
+    return dict(profile, threads=max(1, (os.cpu_count() or 1) // workers))
+
+def encode_chunk(source, start, end, output_path, profile):
+    # Video only: the audio is encoded in one piece when the chunks are joined, so AAC priming and
+    # padding never land at a chunk boundary. -ss before -i seeks accurately when re-encoding, and
+    # -t stops before the frame at `end`, which is the first frame of the next chunk.
+    media.run_ffmpeg(['-ss', f"{start:.6f}", '-i', source, '-t', f"{end - start:.6f}", '-map', '0:v:0', '-an']
+                     + encoder_profiles.ffmpeg_video_args(profile) + ['-pix_fmt', PIX_FMT, output_path])
+
+def join_chunks(chunk_paths, source, start, end, output_path, profile, has_audio, ffmpeg_params, work_dir):
+    # Concatenates the video chunks with stream copy and encodes the interval's audio alongside
+    list_path = os.path.join(work_dir, 'chunks.txt')
+    with open(list_path, 'w') as file:
+        for path in chunk_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            file.write(f"file '{escaped}'\n")
+    args = ['-f', 'concat', '-safe', '0', '-i', list_path]
+    if has_audio:
+        args += ['-ss', f"{start:.6f}", '-i', source, '-t', f"{end - start:.6f}", '-map', '0:v:0', '-map', '1:a:0']
+        args += ['-c:v', 'copy'] + encoder_profiles.ffmpeg_audio_args(profile)
+    else:
+        args += ['-map', '0:v:0', '-c:v', 'copy']
+    args += (ffmpeg_params or ['-movflags', '+faststart']) + [output_path]
+    media.run_ffmpeg(args)
+
+def encode_interval(source, start, end, output_path, profile, workers, chunk_seconds=CHUNK_SECONDS,
+                    ffmpeg_params=None, work_dir=None):
+    # Encodes source[start:end] into output_path with up to `workers` ffmpeg processes, one chunk
+    # each. Returns the number of chunks.
+    keyframes = media.get_keyframes(source)
+    chunks = plan_chunks(keyframes, start, end, chunk_seconds)
+    has_audio = media.stream_signature(source)['audio'] is not None
+    chunk_dir = tempfile.mkdtemp(prefix='.chunks-', dir=work_dir)
+    try:
+        chunk_paths = [os.path.join(chunk_dir, f"chunk_{i:04d}.mp4") for i in range(len(chunks))]
+        chunk_profile = chunk_threads(profile, min(workers, len(chunks)))
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            futures = [executor.submit(encode_chunk, source, chunk_start, chunk_end, path, chunk_profile)
+                       for (chunk_start, chunk_end), path in zip(chunks, chunk_paths)]
+            for future in futures:
+                future.result()
+        join_chunks(chunk_paths, source, start, end, output_path, profile, has_audio, ffmpeg_params, chunk_dir)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    return len(chunks)
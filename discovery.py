@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import youtube_api
+import chapter_parser
+from video_ids import canonical_video_id, canonical_url
+
+RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 64.0
+SEL_CHAPTERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sel_chapters.py')
+
+def requests_per_second_for_quota(units_per_day, units_per_request=1):
+    # videos.list costs one quota unit per call (up to 50 IDs), so the default 10,000 units/day
+    # allow one call every ~8.6 s when spread evenly over the day
+    return units_per_day / units_per_request / 86400.0
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+def description_intervals(description, video_duration):
+    return chapter_parser.chapters_to_intervals(chapter_parser.parse_chapters(description, video_duration))
+
+class DiscoveryStage:
+    # Fetches metadata for many videos concurrently (batched 50 IDs per videos.list call), derives
+    # chapter intervals from descriptions and falls back to sel_chapters.py for videos without any.
+    # Finished jobs are put on a bounded queue, so a slow download stage throttles discovery. Pass a
+    # scheduling.JobQueue as queue to hand jobs out by a scheduling policy instead of in URL order.
+
+    def __init__(self, api_key, rate=5.0, burst=10, concurrency=8, chapter_fallback=True,
+                 fallback_concurrency=2, queue_size=32, queue=None):
+        self.api_key = api_key
+        self.bucket = TokenBucket(rate, burst)
+        self.api_slots = asyncio.Semaphore(concurrency)
+        self.fallback_slots = asyncio.Semaphore(fallback_concurrency)
+        self.chapter_fallback = chapter_fallback
+        self.queue = queue if queue is not None else asyncio.Queue(maxsize=queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def api_get(self, resource, params):
+        import requests
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            try:
+                async with self.api_slots:
+                    return await loop.run_in_executor(self.executor, youtube_api.api_get, self.api_key, resource, params)
+            except (requests.HTTPError, requests.ConnectionError, requests.Timeout) as e:
+                status = e.response.status_code if getattr(e, 'response', None) is not None else None
+                if (status is not None and status not in RETRY_STATUSES) or attempt == MAX_RETRIES:
+                    raise
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * (0.5 + random.random() / 2)
+                print(f"API {resource} request failed ({status or e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def fetch_details(self, video_ids):
+        response_json = await self.api_get('videos', {'part': 'snippet,contentDetails', 'id': ','.join(video_ids),
+                                                      'maxResults': youtube_api.MAX_RESULTS})
+        details = {}
+        for item in response_json.get('items', []):
+            details[item['id']] = (item['snippet']['description'], item['snippet']['title'],
+                                   youtube_api.manually_parse_duration(item['contentDetails']['duration']))
+        return details
+
+    async def fallback_intervals(self, video_id, video_duration):
+        async with self.fallback_slots:
+            fd, output_path = tempfile.mkstemp(prefix=f'chapters_{video_id}_', suffix='.json')
+            os.close(fd)
+            try:
+                process = await asyncio.create_subprocess_exec(sys.executable, SEL_CHAPTERS_PATH,
+                                                               canonical_url(video_id), output_path)
+                if await process.wait() != 0:
+                    return []
+                with open(output_path, 'r') as file:
+                    chapters_json = json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Error extracting chapters using Selenium for {video_id}: {e}")
+                return []
+            finally:
+                os.remove(output_path)
+
+        intervals = []
+        for i, chapter in enumerate(chapters_json):
+            if i + 1 < len(chapters_json):
+                end_time = chapters_json[i + 1]['timestamp']
+            else:
+                end_time = chapter_parser.format_ms(video_duration * 1000) if video_duration else 'end'
+            intervals.append((chapter['timestamp'], end_time, chapter['title']))
+        return intervals
+
+    async def classify(self, video_id, detail):
+        description, title, duration = detail
+        intervals = description_intervals(description, duration)
+        chapter_source = 'description'
+        if not intervals and self.chapter_fallback:
+            intervals = await self.fallback_intervals(video_id, duration)
+            chapter_source = 'selenium'
+        job = {'video_id': video_id, 'url': canonical_url(video_id), 'title': title, 'duration': duration,
+               'intervals': intervals, 'chapter_source': chapter_source if intervals else None}
+        await self.queue.put(job)
+
+    async def discover_batch(self, video_ids):
+        try:
+            details = await self.fetch_details(video_ids)
+        except Exception as e:
+            print(f"Error retrieving video info for {len(video_ids)} videos: {e}")
+            return
+        for video_id in video_ids:
+            if video_id not in details:
+                print(f"No metadata for video {video_id}. Skipping.")
+        await asyncio.gather(*(self.classify(video_id, details[video_id]) for video_id in video_ids if video_id in details))
+
+    async def run(self, urls):
+        video_ids = []
+        seen = set()
+        for url in urls:
+            video_id = canonical_video_id(url)
+            if not video_id:
+                print(f"Could not determine the video ID of {url}. Skipping.")
+            elif video_id not in seen:
+                seen.add(video_id)
+                video_ids.append(video_id)
+
+        batch_size = youtube_api.MAX_RESULTS
+        await asyncio.gather(*(self.discover_batch(video_ids[i:i + batch_size])
+                               for i in range(0, len(video_ids), batch_size)))
+        self.executor.shutdown(wait=False)
+
+async def run_pipeline(stage, urls, handle_job, workers=2):
+    # Runs discovery and `workers` consumers of its queue; handle_job is a blocking callable
+    # (download and cut) executed in a thread per consumer.
+    loop = asyncio.get_running_loop()
+    job_executor = ThreadPoolExecutor(max_workers=workers)
+    results = []
+
+    async def consume():
+        while True:
+            job = await stage.queue.get()
+            try:
+                if job is None:
+                    return
+                results.append((job, await loop.run_in_executor(job_executor, handle_job, job)))
+            except Exception as e:
+                print(f"Error processing {job['url']}: {e}")
+                results.append((job, None))
+            finally:
+                stage.queue.task_done()
+
+    consumers = [asyncio.ensure_future(consume()) for _ in range(workers)]
+    await stage.run(urls)
+    for _ in consumers:
+        await stage.queue.put(None)
+    await asyncio.gather(*consumers)
+    job_executor.shutdown()
+    return results
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib
+import os
+import sqlite3
+import threading
+import time
+import bandwidth
+import planner
+from video_ids import canonical_video_id, canonical_url
+
+DEFAULT_STATS_PATH = os.environ.get('EXTRACTOR_DOWNLOAD_STATS', os.path.join(os.getcwd(), 'download_stats.sqlite'))
+# Comma-separated modules imported before the first download; they register more backends
+PLUGIN_MODULES = os.environ.get('EXTRACTOR_DOWNLOAD_PLUGINS', '')
+# Routing looks at the most recent attempts of each backend
+STATS_WINDOW = 20
+# A backend that failed at least this share of its recent attempts is tried last until it has not
+# failed for COOLDOWN_SECONDS, so a fixed extractor is picked up again
+MAX_FAILURE_RATE = 0.5
+COOLDOWN_SECONDS = 900
+# yt_dlp and pytube report videos that no backend can fetch (private, removed, age-restricted) with these
+UNAVAILABLE_MESSAGES = ('video unavailable', 'private video', 'confirm your age', 'age restricted',
+                        'members-only', 'has been removed')
+
+class Unavailable(Exception):
+    # The video cannot be fetched at all; not held against the backend's health
+    pass
+
+class DownloadError(Exception):
+    pass
+
+# name -> download(url, output_path, job_id, progress, resolution), which writes an mp4 to
+# output_path or raises. Plugins add to it with @register('name').
+BACKENDS = {}
+
+def register(name):
+    def decorator(function):
+        BACKENDS[name] = function
+        return function
+    return decorator
+
+def unavailable_error(error):
+    return any(message in str(error).lower() for message in UNAVAILABLE_MESSAGES)
+
+@register('yt_dlp')
+def download_yt_dlp(url, output_path, job_id, progress=None, resolution=None):
+    # Separate DASH video and audio streams merged into an mp4, fetched over several connections
+    import yt_dlp
+    stem = os.path.splitext(output_path)[0]
+    video_format = planner.DOWNLOAD_FORMAT
+    if resolution:
+        height = int(resolution.rstrip('p'))
+        video_format = (f'bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]/best[height<={height}][ext=mp4]/'
+                        + video_format)
+    ydl_opts = {'format': video_format, 'outtmpl': f'{stem}.%(ext)s', 'merge_output_format': 'mp4'}
+    ydl_opts.update(bandwidth.yt_dlp_options(job_id))
+    if progress:
+        ydl_opts['progress_hooks'].append(lambda status: progress(
+            'download', status.get('downloaded_bytes') or 0,
+            status.get('total_bytes') or status.get('total_bytes_estimate') or 0))
+    try:
+        with bandwidth.connection_slots(bandwidth.DEFAULT_CONNECTIONS_PER_FILE):
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
+    except yt_dlp.utils.DownloadError as e:
+        if unavailable_error(e):
+            raise Unavailable(str(e))
+        raise
+    return output_path
+
+@register('pytube')
+def download_pytube(url, output_path, job_id, progress=None, resolution=None):
+    # A progressive (muxed) mp4 at the requested resolution or the highest one, fetched in ranges
+    from pytube import YouTube
+    from pytube.exceptions import AgeRestrictedError, VideoUnavailable
+    try:
+        streams = YouTube(url).streams.filter(progressive=True, file_extension='mp4')
+        stream = streams.filter(res=resolution).first() if resolution else None
+        if resolution and not stream:
+            print(f"Requested resolution {resolution} not available. Using the highest one.")
+        stream = stream or streams.order_by('resolution').desc().first()
+    except (AgeRestrictedError, VideoUnavailable) as e:
+        raise Unavailable(str(e) or type(e).__name__)
+    if not stream:
+        raise DownloadError("No progressive mp4 stream found.")
+    bandwidth.ranged_download(stream.url, output_path, job_id=job_id, total_size=stream.filesize)
+    return output_path
+
+def load_plugins(modules=PLUGIN_MODULES):
+    for module in filter(None, (name.strip() for name in modules.split(','))):
+        importlib.import_module(module)
+
+class DownloadStats:
+    # Outcome, size and time of every download attempt per backend
+
+    def __init__(self, path=DEFAULT_STATS_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript('''
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY,
+            backend TEXT NOT NULL,
+            finished_at REAL NOT NULL,
+            ok INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            seconds REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS attempts_backend_idx ON attempts (backend, id);''')
+        self.conn.commit()
+
+    def record(self, backend, ok, nbytes, seconds):
+        with self.lock:
+            self.conn.execute('INSERT INTO attempts (backend, finished_at, ok, bytes, seconds) VALUES (?, ?, ?, ?, ?)',
+                              (backend, time.time(), int(ok), nbytes, seconds))
+            self.conn.commit()
+
+    def summary(self, backend, window=STATS_WINDOW):
+        # {'attempts', 'failure_rate', 'bytes_per_second' (None before the first success), 'last_failure'}
+        with self.lock:
+            rows = self.conn.execute('SELECT ok, bytes, seconds, finished_at FROM attempts WHERE backend = ? '
+                                     'ORDER BY id DESC LIMIT ?', (backend, window)).fetchall()
+        succeeded = [(nbytes, seconds) for ok, nbytes, seconds, _ in rows if ok]
+        failed_at = [finished_at for ok, _, _, finished_at in rows if not ok]
+        seconds = sum(seconds for _, seconds in succeeded)
+        return {'attempts': len(rows), 'failure_rate': len(failed_at) / float(len(rows)) if rows else 0.0,
+                'bytes_per_second': sum(nbytes for nbytes, _ in succeeded) / seconds if seconds > 0 else None,
+                'last_failure': max(failed_at) if failed_at else None}
+
+    def close(self):
+        self.conn.close()
+
+def healthy(summary, now=None):
+    if summary['failure_rate'] < MAX_FAILURE_RATE or summary['last_failure'] is None:
+        return True
+    return (now or time.time()) - summary['last_failure'] >= COOLDOWN_SECONDS
+
+def rank_backends(stats, names=None):
+    # Healthy backends by measured throughput, fastest first, then the ones not measured yet in
+    # their given order, then the unhealthy ones as a last resort
+    names = list(names or BACKENDS)
+    summaries = {name: stats.summary(name) for name in names}
+    measured = [name for name in names if healthy(summaries[name]) and summaries[name]['bytes_per_second']]
+    unmeasured = [name for name in names if healthy(summaries[name]) and not summaries[name]['bytes_per_second']]
+    unhealthy = [name for name in names if not healthy(summaries[name])]
+    measured.sort(key=lambda name: -summaries[name]['bytes_per_second'])
+    return measured + unmeasured + unhealthy
+
+def remove_partial(output_path):
+    # What a failed backend left behind: the output and yt_dlp's per-format and .part files
+    directory, stem = os.path.split(os.path.splitext(output_path)[0])
+    for name in os.listdir(directory or '.'):
+        if name.startswith(stem + '.'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+_default_stats = None
+_default_backends = None
+_plugins_loaded = False
+
+def get_stats():
+    global _default_stats
+    if _default_stats is None:
+        _default_stats = DownloadStats()
+    return _default_stats
+
+def check_backends(names):
+    global _plugins_loaded
+    if not _plugins_loaded:
+        load_plugins()
+        _plugins_loaded = True
+    unknown = [name for name in names or [] if name not in BACKENDS]
+    if unknown:
+        raise ValueError(f"Unknown download backend '{unknown[0]}'. Available: {', '.join(sorted(BACKENDS))}")
+
+def configure(backends=None, stats_path=None):
+    # backends: the only backends downloads may use (default: every registered one)
+    global _default_stats, _default_backends
+    check_backends(backends)
+    _default_backends = list(backends) if backends else None
+    if stats_path:
+        _default_stats = DownloadStats(stats_path)
+
+def download(url, output_dir='.', job_id=None, progress=None, resolution=None, backends=None, stats=None):
+    # Downloads a video to <output_dir>/<video id>.mp4 with the fastest healthy backend, falling
+    # back to the next one on failure. backends limits or orders the candidates (default: all
+    # registered). Returns the path, or None when no backend can fetch the video (private,
+    # removed, age-restricted); raises DownloadError when they all failed otherwise.
+    backends = backends or _default_backends
+    check_backends(backends)
+    stats = stats or get_stats()
+    video_id = canonical_video_id(url)
+    if video_id:
+        url = canonical_url(video_id)
+    output_path = os.path.join(output_dir, f"{video_id or 'downloaded_video'}.mp4")
+    job_id = job_id or video_id or url
+
+    errors = []
+    unavailable = False
+    for name in rank_backends(stats, backends):
+        print(f"Starting to download video from {url} with {name}")
+        started = time.monotonic()
+        try:
+            BACKENDS[name](url, output_path, job_id, progress=progress, resolution=resolution)
+            if not os.path.exists(output_path):
+                raise DownloadError(f"{name} did not produce {output_path}")
+        except Unavailable as e:
+            print(f"{name}: video {url} is not available ({e}).")
+            remove_partial(output_path)
+            unavailable = True
+            continue
+        except Exception as e:
+            stats.record(name, False, 0, time.monotonic() - started)
+            print(f"{name} failed to download {url}: {e}")
+            remove_partial(output_path)
+            errors.append(f"{name}: {e}")
+            continue
+        seconds = time.monotonic() - started
+        nbytes = os.path.getsize(output_path)
+        stats.record(name, True, nbytes, seconds)
+        print(f"Video downloaded successfully with {name} ({planner.format_bytes(nbytes)} in {seconds:.1f}s)")
+        return output_path
+    if unavailable and not errors:
+        print(f"Video {url} cannot be downloaded, skipping.")
+        return None
+    raise DownloadError(f"Every download backend failed for {url}: " + '; '.join(errors))
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the throughput and failure rate of the download backends.')
+    parser.add_argument('-stats_path', type=str, default=DEFAULT_STATS_PATH, help='Download statistics database')
+    args = parser.parse_args()
+    check_backends(None)
+    stats = DownloadStats(args.stats_path)
+    print(f"{'backend':<12}{'attempts':>10}{'failures':>10}{'MB/s':>10}  status")
+    for name in rank_backends(stats):
+        summary = stats.summary(name)
+        rate = f"{summary['bytes_per_second'] / 1e6:.2f}" if summary['bytes_per_second'] else '-'
+        print(f"{name:<12}{summary['attempts']:>10}{summary['failure_rate'] * 100:>9.0f}%{rate:>10}  "
+              f"{'healthy' if healthy(summary) else 'cooling down'}")
+
+if __name__ == "__main__":
+    main()
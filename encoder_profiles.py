@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Named libx264/aac encoder settings. 'balanced' matches what moviepy and ffmpeg use when nothing
+# is specified (preset medium, CRF 23), so it is the default. cpu_seconds_per_second and output_kbps
+# are sizing figures for the planner; refresh them with bench_profiles.py on the target hosts.
+PROFILES = {
+    'fast': {
+        'preset': 'veryfast', 'crf': 26, 'bitrate': None, 'tune': None, 'threads': None,
+        'audio_bitrate': '96k', 'cpu_seconds_per_second': 0.8, 'output_kbps': 1800,
+    },
+    'balanced': {
+        'preset': 'medium', 'crf': 23, 'bitrate': None, 'tune': None, 'threads': None,
+        'audio_bitrate': '128k', 'cpu_seconds_per_second': 2.5, 'output_kbps': 2500,
+    },
+    'archive': {
+        'preset': 'slow', 'crf': 18, 'bitrate': None, 'tune': 'film', 'threads': None,
+        'audio_bitrate': '192k', 'cpu_seconds_per_second': 6.0, 'output_kbps': 5000,
+    },
+}
+DEFAULT_PROFILE = 'balanced'
+VIDEO_CODEC = 'libx264'
+AUDIO_CODEC = 'aac'
+
+def get_profile(name=None, threads=None):
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encoder profile '{name}'. Available: {', '.join(sorted(PROFILES))}")
+    profile = dict(PROFILES[name], name=name)
+    if threads:
+        profile['threads'] = threads
+    return profile
+
+def settings_key(profile):
+    # The parts of a profile that change the output, for the processed-jobs index
+    return {'codec': VIDEO_CODEC, 'audio_codec': AUDIO_CODEC, 'preset': profile['preset'], 'crf': profile['crf'],
+            'bitrate': profile['bitrate'], 'tune': profile['tune'], 'audio_bitrate': profile['audio_bitrate']}
+
+def moviepy_kwargs(profile):
+    # Keyword arguments for VideoFileClip.write_videofile
+    ffmpeg_params = []
+    if not profile['bitrate']:
+        ffmpeg_params += ['-crf', str(profile['crf'])]
+    if profile['tune']:
+        ffmpeg_params += ['-tune', profile['tune']]
+    return {
+        'codec': VIDEO_CODEC,
+        'audio_codec': AUDIO_CODEC,
+        'preset': profile['preset'],
+        'bitrate': profile['bitrate'],
+        'audio_bitrate': profile['audio_bitrate'],
+        'threads': profile['threads'],
+        'ffmpeg_params': ffmpeg_params,
+    }
+
+def ffmpeg_video_args(profile):
+    args = ['-c:v', VIDEO_CODEC, '-preset', profile['preset']]
+    if profile['bitrate']:
+        args += ['-b:v', profile['bitrate']]
+    else:
+        args += ['-crf', str(profile['crf'])]
+    if profile['tune']:
+        args += ['-tune', profile['tune']]
+    if profile['threads']:
+        args += ['-threads', str(profile['threads'])]
+    return args
+
+def ffmpeg_audio_args(profile):
+    return ['-c:a', AUDIO_CODEC, '-b:a', profile['audio_bitrate']]
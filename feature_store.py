@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import media
+
+FEATURE_DIR = os.environ.get('EXTRACTOR_FEATURES', os.path.join(os.getcwd(), 'features'))
+# Bumped whenever the columns change, so older stores are rebuilt instead of misread
+FEATURE_VERSION = 1
+# Grey thumbnails of SIGNATURE_WIDTH x SIGNATURE_HEIGHT pixels, SIGNATURE_RATE per second
+SIGNATURE_RATE = 2
+SIGNATURE_WIDTH = 32
+SIGNATURE_HEIGHT = 18
+# Audio energy in dBFS per AUDIO_WINDOW seconds of mono AUDIO_RATE samples
+AUDIO_RATE = 16000
+AUDIO_WINDOW = 0.1
+SILENCE_FLOOR_DB = -100.0
+# A source is identified by its size and three samples of its content, so a renamed or copied file
+# keeps its features and a replaced one gets new ones
+KEY_SAMPLE_BYTES = 1024 * 1024
+
+# Segmentation defaults: a chapter boundary is a scene change (mean absolute difference of
+# consecutive signatures, 0-255) inside or next to a pause in the audio
+SCENE_THRESHOLD = 30.0
+SILENCE_DB = -45.0
+MIN_SILENCE_SECONDS = 0.5
+SILENCE_MARGIN_SECONDS = 1.0
+MIN_CHAPTER_SECONDS = 60.0
+
+def source_key(path):
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    with open(path, 'rb') as file:
+        for offset in sorted(set((0, max(0, size // 2 - KEY_SAMPLE_BYTES // 2), max(0, size - KEY_SAMPLE_BYTES)))):
+            file.seek(offset)
+            digest.update(file.read(KEY_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+def extract(source, directory):
+    # Decodes the source once into the columns of a store directory:
+    # - signatures.npy: uint8 (frames, SIGNATURE_HEIGHT, SIGNATURE_WIDTH) grey thumbnails
+    # - signature_times.npy: float64 timestamp of each signature
+    # - audio_energy.npy: float32 dBFS per audio window (empty without audio)
+    # - keyframes.npy: float64 keyframe timestamps
+    # meta.json is written last, so an interrupted extraction is redone
+    import numpy as np
+    work_dir = tempfile.mkdtemp(prefix='.features-', dir=directory)
+    try:
+        has_audio = media.stream_signature(source)['audio'] is not None
+        frames_path = os.path.join(work_dir, 'frames.raw')
+        audio_path = os.path.join(work_dir, 'audio.raw')
+        args = ['-i', source, '-map', '0:v:0', '-vf',
+                f'fps={SIGNATURE_RATE},scale={SIGNATURE_WIDTH}:{SIGNATURE_HEIGHT},format=gray', '-f', 'rawvideo', frames_path]
+        if has_audio:
+            args += ['-map', '0:a:0', '-ac', '1', '-ar', str(AUDIO_RATE), '-f', 's16le', audio_path]
+        media.run_ffmpeg(args)
+
+        frame_size = SIGNATURE_WIDTH * SIGNATURE_HEIGHT
+        signatures = np.fromfile(frames_path, dtype=np.uint8)
+        signatures = signatures[:len(signatures) // frame_size * frame_size].reshape(-1, SIGNATURE_HEIGHT, SIGNATURE_WIDTH)
+        np.save(os.path.join(directory, 'signatures.npy'), signatures)
+        np.save(os.path.join(directory, 'signature_times.npy'), np.arange(len(signatures)) / float(SIGNATURE_RATE))
+
+        energy = np.zeros(0, dtype=np.float32)
+        if has_audio:
+            window = int(AUDIO_RATE * AUDIO_WINDOW)
+            samples = np.fromfile(audio_path, dtype='<i2')
+            samples = samples[:len(samples) // window * window].astype(np.float32) / 32768.0
+            power = (samples.reshape(-1, window) ** 2).mean(axis=1)
+            energy = np.maximum(10 * np.log10(np.maximum(power, 1e-12)), SILENCE_FLOOR_DB).astype(np.float32)
+        np.save(os.path.join(directory, 'audio_energy.npy'), energy)
+        np.save(os.path.join(directory, 'keyframes.npy'), np.array(media.get_keyframes(source), dtype=np.float64))
+
+        meta = {'version': FEATURE_VERSION, 'source': os.path.abspath(source), 'duration': media.get_duration(source),
+                'signature_rate': SIGNATURE_RATE, 'audio_window': AUDIO_WINDOW, 'extracted_at': time.time()}
+        with open(os.path.join(directory, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+class SourceFeatures:
+    # The columns of one source, memory-mapped: opening a store reads no media and only the pages
+    # an analysis touches
+
+    def __init__(self, directory):
+        import numpy as np
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            self.meta = json.load(file)
+        self.directory = directory
+        self.duration = self.meta['duration']
+        self.signatures = np.load(os.path.join(directory, 'signatures.npy'), mmap_mode='r')
+        self.signature_times = np.load(os.path.join(directory, 'signature_times.npy'), mmap_mode='r')
+        self.audio_energy = np.load(os.path.join(directory, 'audio_energy.npy'), mmap_mode='r')
+        self.keyframes = np.load(os.path.join(directory, 'keyframes.npy'), mmap_mode='r')
+        self._differences = None
+
+    def frame_differences(self):
+        # Mean absolute difference between each signature and the previous one (0 for the first),
+        # computed once per process and shared by every parameter set
+        import numpy as np
+        if self._differences is None:
+            differences = np.zeros(len(self.signatures), dtype=np.float32)
+            if len(self.signatures) > 1:
+                signatures = np.asarray(self.signatures, dtype=np.int16)
+                differences[1:] = np.abs(np.diff(signatures, axis=0)).mean(axis=(1, 2))
+            self._differences = differences
+        return self._differences
+
+def store_directory(source, feature_dir=None):
+    return os.path.join(feature_dir or FEATURE_DIR, source_key(source))
+
+def load(source, feature_dir=None):
+    # The features of a local source, extracted on first use
+    directory = store_directory(source, feature_dir)
+    meta_path = os.path.join(directory, 'meta.json')
+    try:
+        with open(meta_path, 'r') as file:
+            current = json.load(file).get('version') == FEATURE_VERSION
+    except (OSError, ValueError):
+        current = False
+    if not current:
+        print(f"Extracting features of {source}")
+        os.makedirs(directory, exist_ok=True)
+        extract(source, directory)
+    return SourceFeatures(directory)
+
+def scene_changes(features, threshold=SCENE_THRESHOLD):
+    import numpy as np
+    differences = features.frame_differences()
+    return np.asarray(features.signature_times)[differences > threshold]
+
+def silences(features, threshold_db=SILENCE_DB, min_seconds=MIN_SILENCE_SECONDS):
+    # [(start, end)] of the runs of audio windows quieter than threshold_db lasting min_seconds or more
+    import numpy as np
+    quiet = np.concatenate(([False], np.asarray(features.audio_energy) < threshold_db, [False]))
+    edges = np.flatnonzero(quiet[1:] != quiet[:-1])
+    window = features.meta['audio_window']
+    return [(start * window, end * window) for start, end in zip(edges[0::2], edges[1::2])
+            if (end - start) * window >= min_seconds]
+
+def segment(features, scene_threshold=SCENE_THRESHOLD, silence_db=SILENCE_DB, min_silence=MIN_SILENCE_SECONDS,
+            min_chapter=MIN_CHAPTER_SECONDS, snap=True):
+    # Chapters [(start_ms, end_ms, title)] split at scene changes that fall in or next to a pause,
+    # at least min_chapter seconds apart. Without audio every scene change counts. With snap, each
+    # boundary moves to the nearest keyframe, so the cuts start on one.
+    import numpy as np
+    changes = scene_changes(features, scene_threshold)
+    if len(features.audio_energy):
+        pauses = silences(features, silence_db, min_silence)
+        starts = np.array([start - SILENCE_MARGIN_SECONDS for start, _ in pauses])
+        ends = np.array([end + SILENCE_MARGIN_SECONDS for _, end in pauses])
+        positions = np.searchsorted(starts, changes, side='right') - 1
+        changes = changes[(positions >= 0) & (changes <= ends[np.maximum(positions, 0)])] if len(pauses) else changes[:0]
+    if snap and len(features.keyframes):
+        keyframes = np.asarray(features.keyframes)
+        after = np.minimum(np.searchsorted(keyframes, changes), len(keyframes) - 1)
+        before = np.maximum(after - 1, 0)
+        closer = np.abs(keyframes[before] - changes) <= np.abs(keyframes[after] - changes)
+        changes = np.where(closer, keyframes[before], keyframes[after])
+
+    boundaries = [0.0]
+    for change in changes:
+        if change - boundaries[-1] >= min_chapter and features.duration - change >= min_chapter:
+            boundaries.append(float(change))
+    boundaries.append(features.duration)
+    return [(int(round(start * 1000)), int(round(end * 1000)), f'Chapter {i}')
+            for i, (start, end) in enumerate(zip(boundaries[:-1], boundaries[1:]), start=1)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the feature store of local sources and segment them into chapters from it.')
+    parser.add_argument('sources', type=str, nargs='+', help='Local video files')
+    parser.add_argument('-feature_dir', type=str, default=FEATURE_DIR, help='Store directory (default: EXTRACTOR_FEATURES or ./features)')
+    parser.add_argument('-scene_threshold', type=float, nargs='+', default=[SCENE_THRESHOLD], help='Mean signature difference (0-255) that counts as a scene change; several values are tried in turn')
+    parser.add_argument('-silence_db', type=float, default=SILENCE_DB, help='Audio level below which a window is a pause')
+    parser.add_argument('-min_silence', type=float, default=MIN_SILENCE_SECONDS, help='Shortest pause that can hold a chapter boundary, in seconds')
+    parser.add_argument('-min_chapter', type=float, default=MIN_CHAPTER_SECONDS, help='Shortest chapter, in seconds')
+    parser.add_argument('-no_snap', action='store_true', help='Keep boundaries at the scene change instead of the nearest keyframe')
+    parser.add_argument('-intervals_out', type=str, default=None, help='Write the chapters of the last source and threshold as an intervals file for app.py -intervals_path')
+    args = parser.parse_args()
+
+    from chapter_parser import format_ms
+    chapters = []
+    for source in args.sources:
+        features = load(source, args.feature_dir)
+        for threshold in args.scene_threshold:
+            started = time.perf_counter()
+            chapters = segment(features, threshold, args.silence_db, args.min_silence, args.min_chapter, not args.no_snap)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"{source} (scene threshold {threshold:g}): {len(chapters)} chapters in {elapsed_ms:.1f} ms")
+            for start_ms, end_ms, title in chapters:
+                print(f"  {format_ms(start_ms)} - {format_ms(end_ms)}  {title}")
+    if args.intervals_out:
+        with open(args.intervals_out, 'w') as file:
+            json.dump([[format_ms(start_ms), format_ms(end_ms)] for start_ms, end_ms, _ in chapters], file, indent=2)
+
+if __name__ == "__main__":
+    main()
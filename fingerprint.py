@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import struct
+import subprocess
+import threading
+import time
+import media
+from processed_index import make_key
+
+DEFAULT_FINGERPRINT_INDEX_PATH = os.environ.get('EXTRACTOR_FINGERPRINTS', os.path.join(os.getcwd(), 'fingerprints.sqlite'))
+# Only the start of a source is sampled, so a duplicate is recognised before it is downloaded
+EARLY_SECONDS = 180
+# One frame every FRAME_STEP seconds is reduced to a 64-bit difference hash (9x8 grey pixels)
+FRAME_STEP = 3
+# Audio energy is measured over windows of AUDIO_WINDOW seconds; each bit says whether it rose
+AUDIO_WINDOW = 0.5
+AUDIO_RATE = 8000
+# Mean fraction of differing bits below which two sources count as the same content. Unrelated
+# content lands around 0.5; re-encodes of the same upload at another resolution stay under 0.1.
+FRAME_THRESHOLD = 0.12
+AUDIO_THRESHOLD = 0.2
+# Uploads of the same content differ in length by at most a few frames or an end card
+DURATION_TOLERANCE_SECONDS = 2.0
+# Fingerprints of mostly static openings (a title card, black) would match each other
+MIN_FRAMES = 10
+MIN_DISTINCT_FRAMES = 5
+
+def header_args(headers):
+    if not headers:
+        return []
+    return ['-headers', ''.join(f"{name}: {value}\r\n" for name, value in headers.items())]
+
+def read_ffmpeg(args):
+    cmd = [media.FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error'] + args
+    return subprocess.run(cmd, capture_output=True, check=True).stdout
+
+def dhash(pixels):
+    # pixels: 9x8 grey bytes, row by row; each bit says whether a pixel is brighter than its right neighbour
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = (value << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value
+
+def frame_hashes(source, seconds=EARLY_SECONDS, headers=None):
+    data = read_ffmpeg(header_args(headers) + ['-t', str(seconds), '-i', source, '-map', '0:v:0',
+                                               '-vf', f'fps=1/{FRAME_STEP},scale=9:8,format=gray', '-f', 'rawvideo', '-'])
+    return [dhash(data[i:i + 72]) for i in range(0, len(data) - 71, 72)]
+
+def audio_bits(source, seconds=EARLY_SECONDS, headers=None):
+    import numpy as np
+    data = read_ffmpeg(header_args(headers) + ['-t', str(seconds), '-i', source, '-map', '0:a:0',
+                                               '-ac', '1', '-ar', str(AUDIO_RATE), '-f', 's16le', '-'])
+    window = int(AUDIO_WINDOW * AUDIO_RATE)
+    samples = np.frombuffer(data[:len(data) // (2 * window) * 2 * window], dtype='<i2').astype(np.float64)
+    if len(samples) < 2 * window:
+        return b''
+    energy = np.log1p((samples.reshape(-1, window) ** 2).mean(axis=1))
+    return (np.diff(energy) > 0).astype(np.uint8).tobytes()
+
+def compute(source, seconds=EARLY_SECONDS, video_headers=None, audio_source=None, audio_headers=None,
+            has_audio=True):
+    # {'frames': [64-bit hashes], 'audio': bytes of 0/1} of the first `seconds` of a local file or URL.
+    # Separate video and audio streams (as YouTube serves them) are passed as source and audio_source.
+    fingerprint = {'frames': frame_hashes(source, seconds, video_headers), 'audio': b''}
+    if has_audio:
+        fingerprint['audio'] = audio_bits(audio_source or source, seconds,
+                                          audio_headers if audio_source else video_headers)
+    return fingerprint
+
+def early_fingerprint(url, seconds=EARLY_SECONDS):
+    # Fingerprints the start of a video from its smallest streams instead of downloading it
+    import yt_dlp
+    options = {'quiet': True, 'no_warnings': True, 'format': 'worstvideo[height>=144]+worstaudio/worst[height>=144]/worst'}
+    with yt_dlp.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=False)
+    formats = info.get('requested_formats') or [info]
+    video = next(f for f in formats if f.get('vcodec') != 'none')
+    audio = next((f for f in formats if f.get('acodec') != 'none'), None)
+    return compute(video['url'], seconds, video.get('http_headers'), audio['url'] if audio else None,
+                   audio.get('http_headers') if audio else None, has_audio=audio is not None)
+
+def informative(fingerprint):
+    return len(fingerprint['frames']) >= MIN_FRAMES and len(set(fingerprint['frames'])) >= MIN_DISTINCT_FRAMES
+
+def distance(a, b):
+    # (frame distance, audio distance or None): the mean fraction of differing bits over the part
+    # both fingerprints cover
+    count = min(len(a['frames']), len(b['frames']))
+    frames = sum(bin(x ^ y).count('1') for x, y in zip(a['frames'], b['frames'])) / (64.0 * count) if count else 1.0
+    length = min(len(a['audio']), len(b['audio']))
+    audio = None
+    if length:
+        audio = sum(x != y for x, y in zip(a['audio'][:length], b['audio'][:length])) / float(length)
+    return frames, audio
+
+def matches(a, b):
+    if not informative(a) or not informative(b):
+        return False
+    frames, audio = distance(a, b)
+    return frames <= FRAME_THRESHOLD and (audio is None or audio <= AUDIO_THRESHOLD)
+
+def pack_frames(frames):
+    return struct.pack(f'>{len(frames)}Q', *frames)
+
+def unpack_frames(blob):
+    return list(struct.unpack(f'>{len(blob) // 8}Q', blob))
+
+class FingerprintIndex:
+    # Fingerprints of processed sources with where their outputs went, keyed by the planned intervals
+    # and encoder settings, so a re-upload cut the same way can reuse those outputs.
+
+    def __init__(self, path=DEFAULT_FINGERPRINT_INDEX_PATH):
+        self.path = path
+        # Shared by the batch workers; writes are serialized with the lock
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript('''
+        CREATE TABLE IF NOT EXISTS sources (
+            video_id TEXT NOT NULL,
+            intervals_key TEXT NOT NULL,
+            settings_key TEXT NOT NULL,
+            duration REAL NOT NULL,
+            frames BLOB NOT NULL,
+            audio BLOB NOT NULL,
+            location TEXT NOT NULL,
+            added_at REAL NOT NULL,
+            PRIMARY KEY (video_id, intervals_key, settings_key)
+        );
+        CREATE INDEX IF NOT EXISTS sources_lookup_idx ON sources (intervals_key, settings_key, duration);''')
+        self.conn.commit()
+
+    def add(self, video_id, duration, fingerprint, intervals, settings, location):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (video_id, make_key(intervals), make_key(settings), duration or 0,
+                               pack_frames(fingerprint['frames']), fingerprint['audio'], location, time.time()))
+            self.conn.commit()
+
+    def find(self, fingerprint, duration, intervals, settings, exclude=None):
+        # The closest processed source that matches, as {'video_id', 'location', 'frames', 'audio'}, or None
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT video_id, frames, audio, location FROM sources WHERE intervals_key = ? AND settings_key = ? '
+                'AND duration BETWEEN ? AND ? AND video_id != ?',
+                (make_key(intervals), make_key(settings), (duration or 0) - DURATION_TOLERANCE_SECONDS,
+                 (duration or 0) + DURATION_TOLERANCE_SECONDS, exclude or '')).fetchall()
+        best = None
+        for video_id, frames, audio, location in rows:
+            candidate = {'frames': unpack_frames(frames), 'audio': audio}
+            if matches(fingerprint, candidate):
+                frame_distance, audio_distance = distance(fingerprint, candidate)
+                if best is None or frame_distance < best['frames']:
+                    best = {'video_id': video_id, 'location': location, 'frames': frame_distance, 'audio': audio_distance}
+        return best
+
+    def remove(self, video_id):
+        with self.lock:
+            self.conn.execute('DELETE FROM sources WHERE video_id = ?', (video_id,))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+_default_index = None
+
+def get_index():
+    global _default_index
+    if _default_index is None:
+        _default_index = FingerprintIndex()
+    return _default_index
+
+def find_duplicate(index, video_id, url, duration, intervals, settings):
+    # Returns (duplicate, fingerprint): the processed source this video repeats (see
+    # FingerprintIndex.find) or None, and the video's own fingerprint to add once it is processed
+    # (None when it could not be taken). Failures are reported and never fail the job.
+    try:
+        fingerprint = early_fingerprint(url)
+    except Exception as e:
+        print(f"Error fingerprinting {url}: {e}")
+        return None, None
+    if not informative(fingerprint):
+        print(f"The start of {url} is too uniform to fingerprint; it is not checked for duplicates.")
+        return None, None
+    return index.find(fingerprint, duration, intervals, settings, exclude=video_id), fingerprint
+
+def reuse_outputs(index, storage_backend, duplicate, output_directory):
+    # Links the outputs of the duplicate into output_directory. Returns the new location, or None
+    # when the old outputs are gone (the job is then processed as usual and the stale entry dropped).
+    try:
+        location = storage_backend.link(duplicate['location'], output_directory)
+    except Exception as e:
+        print(f"Cannot reuse the outputs of {duplicate['video_id']} ({e}); processing the video again.")
+        index.remove(duplicate['video_id'])
+        return None
+    print(f"Same content as {duplicate['video_id']} (frame distance {duplicate['frames']:.3f}); "
+          f"reused its outputs in {location}")
+    return location
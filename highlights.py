@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import downloaders
+import encoder_profiles
+import media
+import storage
+from video_ids import canonical_video_id, canonical_url
+
+def convert_time_str_to_seconds(time_str):
+    if time_str in (None, 'end'):
+        return None
+    parts = str(time_str).split(':')
+    if len(parts) == 3:
+        h, m, s = parts
+    elif len(parts) == 2:
+        h, m, s = 0, parts[0], parts[1]
+    else:
+        raise ValueError(f"Invalid time format: {time_str}")
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+def load_selection(file_path):
+    # A selection is a list of {"source": <local path or URL>, "intervals": [...]}, where each interval
+    # is either a [start, end] pair or a {"start", "end", "title"} object as used by -intervals_file.
+    with open(file_path, 'r') as file:
+        selection_json = json.load(file)
+
+    selection = []
+    for entry in selection_json:
+        for i, item in enumerate(entry['intervals'], start=1):
+            if isinstance(item, dict):
+                start, end, title = item['start'], item.get('end', 'end'), item.get('title', f'Chapter {i}')
+            else:
+                start, end = item[:2]
+                title = item[2] if len(item) > 2 else f'Chapter {i}'
+            selection.append((entry['source'], start, end, title))
+    return selection
+
+def filter_by_keyword(selection, keyword):
+    keyword = keyword.lower()
+    return [item for item in selection if keyword in item[3].lower()]
+
+def resolve_source(source, cache_dir):
+    # Sources are cached in cache_dir and, with object storage configured, shared through the
+    # bucket so that other hosts fetch them from there instead of from YouTube
+    if os.path.exists(source):
+        return source
+
+    video_id = canonical_video_id(source)
+    if not video_id:
+        raise ValueError(f"Not a local file or a YouTube URL: {source}")
+    cached_path = os.path.join(cache_dir, f"{video_id}.mp4")
+    if os.path.exists(cached_path):
+        print(f"Using cached source {cached_path} for {source}")
+        return cached_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    store = storage.get_storage()
+    cache_key = f"{storage.SOURCE_CACHE_PREFIX}{video_id}.mp4"
+    if store.remote and store.fetch(cache_key, cached_path):
+        print(f"Fetched cached source {store.url_for(store.prefix + cache_key)} for {source}")
+        return cached_path
+
+    # Writes <cache_dir>/<video id>.mp4 with the fastest healthy download backend
+    if not downloaders.download(canonical_url(video_id), cache_dir):
+        raise ValueError(f"{source} cannot be downloaded")
+    if store.remote:
+        store.store(cached_path, cache_key)
+    return cached_path
+
+def copy_pieces(selection, sources, work_dir):
+    # Cuts every piece with stream copy. A copy can only start on a keyframe, so each piece starts
+    # at the keyframe at or before its start; returns (pieces, seconds of pre-roll in total).
+    pieces = []
+    pre_roll = 0.0
+    previous = None
+    for index, (source, start, end, title) in enumerate(selection):
+        source_file = sources[source]
+        start_seconds = convert_time_str_to_seconds(start)
+        end_seconds = convert_time_str_to_seconds(end)
+        copy_start = media.keyframe_at_or_before(media.get_keyframes(source_file), start_seconds)
+        # Moving the start back can make a piece repeat the end of the one before it
+        if previous and previous[0] == source and previous[1] is not None and copy_start < previous[1] <= start_seconds:
+            print(f"'{title}' starts {previous[1] - copy_start:.3f}s before the previous piece ends once moved to the keyframe")
+        previous = (source, end_seconds)
+        if start_seconds - copy_start > 0.001:
+            print(f"Copying '{title}' from {source} from the keyframe at {copy_start:.3f}s, "
+                  f"{start_seconds - copy_start:.3f}s before its start")
+        else:
+            print(f"Copying '{title}' from {source}")
+        pre_roll += start_seconds - copy_start
+        piece_path = os.path.join(work_dir, f"piece_{index:04d}.mp4")
+        media.cut_stream_copy(source_file, copy_start, end_seconds, piece_path)
+        pieces.append(piece_path)
+    return pieces, pre_roll
+
+def encode_reel(selection, sources, output_path, signatures, profile):
+    # Cuts every piece at its exact start and encodes the whole reel in one pass, scaled and padded
+    # to the first piece's size and frame rate, so the output has a single codec configuration.
+    # signatures: {source: media.stream_signature of it}, every source with a video stream
+    reference = signatures[selection[0][0]]
+    video = reference['video']
+    width, height, frame_rate = video[2], video[3], video[5]
+    has_audio = any(signature['audio'] for signature in signatures.values())
+    sample_rate = (reference['audio'] or [None, '48000'])[1]
+    args = []
+    filters = []
+    labels = ''
+    for index, (source, start, end, title) in enumerate(selection):
+        source_file = sources[source]
+        start_seconds = convert_time_str_to_seconds(start)
+        end_seconds = convert_time_str_to_seconds(end)
+        if end_seconds is None:
+            end_seconds = media.get_duration(source_file)
+        print(f"Encoding '{title}' from {source}")
+        args += ['-ss', f"{start_seconds:.3f}", '-t', f"{end_seconds - start_seconds:.3f}", '-i', source_file]
+        filters.append(f"[{index}:v:0]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                       f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={frame_rate},format=yuv420p[v{index}]")
+        labels += f"[v{index}]"
+        if has_audio:
+            if signatures[source]['audio']:
+                filters.append(f"[{index}:a:0]aresample={sample_rate},aformat=channel_layouts=stereo[a{index}]")
+            else:
+                filters.append(f"anullsrc=r={sample_rate}:cl=stereo,atrim=duration={end_seconds - start_seconds:.3f}[a{index}]")
+            labels += f"[a{index}]"
+    filters.append(f"{labels}concat=n={len(selection)}:v=1:a={1 if has_audio else 0}[v]" + ("[a]" if has_audio else ''))
+    args += ['-filter_complex', ';'.join(filters), '-map', '[v]']
+    args += encoder_profiles.ffmpeg_video_args(profile)
+    if has_audio:
+        args += ['-map', '[a]'] + encoder_profiles.ffmpeg_audio_args(profile)
+    media.run_ffmpeg(args + ['-movflags', '+faststart', output_path])
+
+def build_highlight_reel(selection, output_path, cache_dir, accurate=False, profile=None):
+    # Stream-copies the pieces when every source has the same codec parameters and configuration as
+    # the first one; otherwise, or with accurate, or when the copied reel does not decode cleanly,
+    # the whole reel is encoded in one pass.
+    if not selection:
+        print("Nothing selected. Exiting.")
+        return False
+
+    sources = {}
+    for source, _, _, _ in selection:
+        if source not in sources:
+            sources[source] = resolve_source(source, cache_dir)
+
+    signatures = {source: media.stream_signature(path) for source, path in sources.items()}
+    videoless = sorted(source for source, signature in signatures.items() if not signature['video'])
+    if videoless:
+        print(f"No video stream in {', '.join(videoless)}; a highlight reel needs video from every source. Exiting.")
+        return False
+    reference = signatures[selection[0][0]]
+    profile = profile or encoder_profiles.get_profile()
+    mismatched = sorted(source for source, signature in signatures.items() if signature != reference)
+
+    work_dir = tempfile.mkdtemp(prefix='.highlights_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        if not accurate and not mismatched:
+            pieces, pre_roll = copy_pieces(selection, sources, work_dir)
+            try:
+                media.concat_stream_copy(pieces, output_path, work_dir)
+                errors = media.decode_errors(output_path)
+            except subprocess.CalledProcessError as e:
+                errors = f"ffmpeg exited with {e.returncode}"
+            if not errors:
+                print(f"Highlight reel written to {output_path} ({len(pieces)} pieces copied, "
+                      f"{pre_roll:.3f}s of keyframe pre-roll in total; -accurate cuts exactly)")
+                return True
+            print(f"The copied reel does not decode cleanly ({errors.splitlines()[0]}); encoding it instead")
+        elif mismatched and not accurate:
+            print(f"Encoding the whole reel: codec parameters of {', '.join(mismatched)} differ from the first piece")
+        encode_reel(selection, sources, output_path, signatures, profile)
+        errors = media.decode_errors(output_path)
+        if errors:
+            print(f"Highlight reel {output_path} does not decode cleanly: {errors.splitlines()[0]}")
+            return False
+        print(f"Highlight reel written to {output_path} ({len(selection)} pieces encoded)")
+        return True
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Concatenate selected intervals from one or more videos into a single file.')
+    parser.add_argument('-selection', type=str, help='Path to the JSON file listing sources and their intervals', required=True)
+    parser.add_argument('-output', type=str, help='Path of the concatenated output file', default='highlights.mp4')
+    parser.add_argument('-keyword', type=str, help='Only keep intervals whose title contains this keyword', default=None)
+    parser.add_argument('-cache_dir', type=str, help='Directory where downloaded sources are cached and reused', default='source_cache')
+    parser.add_argument('-storage', type=str, default=storage.STORAGE_URL, help='s3://bucket/prefix to share the source cache through object storage')
+    parser.add_argument('-downloaders', type=str, nargs='+', default=None, help='Download backends to use, e.g. yt_dlp pytube (default: every registered one, the fastest healthy one first)')
+    parser.add_argument('-accurate', action='store_true', help='Encode the reel with every piece cut at its exact start instead of copying from the keyframe before it')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile when the reel is encoded')
+    args = parser.parse_args()
+    storage.configure(args.storage)
+    try:
+        downloaders.configure(args.downloaders)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        selection = load_selection(args.selection)
+    except Exception as e:
+        print(f"Error reading selection file: {e}")
+        return
+
+    if args.keyword:
+        selection = filter_by_keyword(selection, args.keyword)
+        print(f"{len(selection)} intervals match '{args.keyword}'")
+
+    build_highlight_reel(selection, args.output, args.cache_dir, accurate=args.accurate,
+                         profile=encoder_profiles.get_profile(args.profile))
+
+if __name__ == "__main__":
+    main()
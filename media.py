@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import bisect
+import json
+import os
+import subprocess
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+
+def probe(path):
+    # -show_data_hash adds each stream's extradata_hash (the avcC/hvcC or AudioSpecificConfig)
+    cmd = [FFPROBE_BINARY, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams',
+           '-show_data_hash', 'MD5', path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def get_duration(path):
+    return float(probe(path)['format']['duration'])
+
+def stream_signature(path):
+    # The parameters that have to be identical for the concat demuxer to join files with -c copy.
+    # The muxer keeps only the first file's codec configuration, so the extradata must match too.
+    info = probe(path)
+    video = next((s for s in info['streams'] if s['codec_type'] == 'video'), None)
+    audio = next((s for s in info['streams'] if s['codec_type'] == 'audio'), None)
+    signature = {'video': None, 'audio': None}
+    if video:
+        signature['video'] = [video.get('codec_name'), video.get('profile'), video.get('width'),
+                              video.get('height'), video.get('pix_fmt'), video.get('r_frame_rate'),
+                              video.get('extradata_hash')]
+    if audio:
+        signature['audio'] = [audio.get('codec_name'), audio.get('sample_rate'), audio.get('channels'),
+                              audio.get('extradata_hash')]
+    return signature
+
+def _keyframe_cache_path(path):
+    return f"{path}.keyframes.json"
+
+def load_cached_keyframes(path):
+    cache_path = _keyframe_cache_path(path)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r') as file:
+            cached = json.load(file)
+        stat = os.stat(path)
+        if cached['size'] == stat.st_size and cached['mtime'] == int(stat.st_mtime):
+            return cached['keyframes']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def read_keyframes(path):
+    # Keyframe timestamps (seconds) of the first video stream, read from packet flags so nothing is decoded
+    cmd = [FFPROBE_BINARY, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.split(',')
+        if len(parts) >= 2 and 'K' in parts[1] and parts[0] not in ('', 'N/A'):
+            keyframes.append(float(parts[0]))
+    keyframes.sort()
+    return keyframes
+
+def get_keyframes(path):
+    # read_keyframes, cached next to the source and reused as long as the source is unchanged
+    keyframes = load_cached_keyframes(path)
+    if keyframes is not None:
+        return keyframes
+
+    keyframes = read_keyframes(path)
+    try:
+        stat = os.stat(path)
+        with open(_keyframe_cache_path(path), 'w') as file:
+            json.dump({'size': stat.st_size, 'mtime': int(stat.st_mtime), 'keyframes': keyframes}, file)
+    except OSError as e:
+        print(f"Could not cache keyframes for {path}: {e}")
+    return keyframes
+
+def keyframe_at_or_before(keyframes, seconds):
+    if not keyframes:
+        return seconds
+    index = bisect.bisect_right(keyframes, seconds + 1e-6) - 1
+    return keyframes[max(index, 0)]
+
+def keyframe_at_or_after(keyframes, seconds):
+    if not keyframes:
+        return seconds
+    index = bisect.bisect_left(keyframes, seconds - 1e-6)
+    return keyframes[index] if index < len(keyframes) else None
+
+def run_ffmpeg(args):
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y'] + args
+    subprocess.run(cmd, check=True)
+
+def cut_stream_copy(source, start, end, output_path):
+    args = ['-ss', f"{start:.3f}", '-i', source]
+    if end is not None:
+        args += ['-t', f"{end - start:.3f}"]
+    args += ['-map', '0:v:0?', '-map', '0:a:0?', '-c', 'copy', '-avoid_negative_ts', 'make_zero', output_path]
+    run_ffmpeg(args)
+
+def concat_stream_copy(pieces, output_path, work_dir):
+    list_path = os.path.join(work_dir, 'concat_list.txt')
+    with open(list_path, 'w') as file:
+        for piece in pieces:
+            escaped = os.path.abspath(piece).replace("'", "'\\''")
+            file.write(f"file '{escaped}'\n")
+    run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-movflags', '+faststart', output_path])
+    os.remove(list_path)
+
+def decode_errors(path):
+    # Decodes the whole file and returns what the decoder reported ('' when it decoded cleanly)
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-v', 'error', '-xerror', '-i', path, '-f', 'null', '-']
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 and not result.stderr.strip():
+        return f"ffmpeg exited with {result.returncode}"
+    return result.stderr.strip()
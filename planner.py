@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import json
+import media
+from chapter_parser import format_ms
+
+# Rough sizing constants for dry-run estimates when nothing better is known about a source
+DEFAULT_SOURCE_KBPS = 2500
+DEFAULT_OUTPUT_KBPS = 2500
+ENCODE_CPU_SECONDS_PER_SECOND = 2.5
+# config.json style intervals end one second before the next one starts
+GAP_TOLERANCE_MS = 1000
+DOWNLOAD_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+def parse_time_ms(value):
+    # Accepts 'H:MM:SS', 'M:SS', 'HH:MM:SS.mmm', plain seconds, and None/'end' for open ends
+    if value is None or value == 'end':
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value * 1000))
+    seconds = 0.0
+    for part in str(value).strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return int(round(seconds * 1000))
+
+def normalize_intervals(raw_intervals):
+    # All interval sources (config.json pairs, {"start", "end", "title"} objects, extracted
+    # (start, end, title) tuples) become [(start_ms, end_ms or None, title)]
+    intervals = []
+    for i, item in enumerate(raw_intervals, start=1):
+        if isinstance(item, dict):
+            start, end, title = item.get('start'), item.get('end', 'end'), item.get('title')
+        else:
+            start, end = item[0], item[1] if len(item) > 1 else 'end'
+            title = item[2] if len(item) > 2 else None
+        intervals.append((parse_time_ms(start) or 0, parse_time_ms(end), title or f'Chapter {i}'))
+    return intervals
+
+def load_intervals(file_path):
+    with open(file_path, 'r') as file:
+        return normalize_intervals(json.load(file))
+
+def validate_intervals(intervals, duration, merge_overlaps=False):
+    # Returns (intervals, issues). Open ends are resolved to the duration (seconds), ends past the
+    # duration are clamped, empty intervals are dropped, and overlaps are flagged or merged.
+    duration_ms = int(duration * 1000) if duration else None
+    issues = []
+    cleaned = []
+    for start_ms, end_ms, title in intervals:
+        if end_ms is None:
+            end_ms = duration_ms
+        elif duration_ms is not None and end_ms > duration_ms:
+            issues.append(f"'{title}' ends at {format_ms(end_ms)}, after the end of the video; clamped to {format_ms(duration_ms)}")
+            end_ms = duration_ms
+        if end_ms is not None and end_ms <= start_ms:
+            issues.append(f"'{title}' is empty or reversed ({format_ms(start_ms)} to {format_ms(end_ms)}); dropped")
+            continue
+        cleaned.append((start_ms, end_ms, title))
+
+    cleaned.sort(key=lambda interval: interval[0])
+    planned = []
+    for start_ms, end_ms, title in cleaned:
+        if planned:
+            prev_start, prev_end, prev_title = planned[-1]
+            if prev_end is None or start_ms < prev_end:
+                if merge_overlaps:
+                    merged_end = None if prev_end is None or end_ms is None else max(prev_end, end_ms)
+                    planned[-1] = (prev_start, merged_end, f"{prev_title} + {title}")
+                    issues.append(f"'{title}' overlaps '{prev_title}'; merged")
+                    continue
+                issues.append(f"'{title}' starts at {format_ms(start_ms)}, before '{prev_title}' ends")
+            elif start_ms - prev_end > GAP_TOLERANCE_MS:
+                issues.append(f"Gap of {format_ms(start_ms - prev_end)} before '{title}'")
+        planned.append((start_ms, end_ms, title))
+    return planned, issues
+
+def snap_to_keyframes(intervals, keyframes):
+    # Moves each start back to the keyframe at or before it, so stream-copy cuts can start without a
+    # re-encode. Returns (intervals, issues), with an issue for every start that moved.
+    if not keyframes:
+        return intervals, []
+    snapped = []
+    issues = []
+    for start_ms, end_ms, title in intervals:
+        keyframe_ms = int(round(media.keyframe_at_or_before(keyframes, start_ms / 1000.0) * 1000))
+        if keyframe_ms != start_ms:
+            issues.append(f"'{title}' starts at the keyframe at {format_ms(keyframe_ms)} instead of {format_ms(start_ms)}")
+        snapped.append((keyframe_ms, end_ms, title))
+    return snapped, issues
+
+def probe_format_kbps(url):
+    # Total bitrate of the format the yt_dlp download backend would fetch, without downloading it
+    import yt_dlp
+    with yt_dlp.YoutubeDL({'format': DOWNLOAD_FORMAT, 'quiet': True, 'skip_download': True}) as ydl:
+        info = ydl.extract_info(url, download=False)
+    formats = info.get('requested_formats') or [info]
+    kbps = sum(f.get('tbr') or 0 for f in formats)
+    return kbps or None
+
+def estimate_job(intervals, duration, source_kbps=None, output_kbps=None,
+                 cpu_seconds_per_second=ENCODE_CPU_SECONDS_PER_SECOND):
+    source_kbps = source_kbps or DEFAULT_SOURCE_KBPS
+    output_kbps = output_kbps or source_kbps or DEFAULT_OUTPUT_KBPS
+    duration = duration or 0
+    output_seconds = sum(((end_ms / 1000.0) if end_ms is not None else duration) - start_ms / 1000.0
+                         for start_ms, end_ms, _ in intervals)
+    return {
+        'download_bytes': int(duration * source_kbps * 125),
+        'output_seconds': output_seconds,
+        'encode_cpu_seconds': output_seconds * cpu_seconds_per_second,
+        'output_bytes': int(output_seconds * output_kbps * 125),
+    }
+
+def plan_job(name, raw_intervals, duration, merge_overlaps=False, keyframes=None, source_kbps=None,
+             output_kbps=None, cpu_seconds_per_second=ENCODE_CPU_SECONDS_PER_SECOND):
+    # keyframes is only for stream-copy cuts; re-encoded cuts start exactly where asked. Starts are
+    # snapped before validating, so overlaps created by moving a start back are caught too.
+    intervals, snap_issues = snap_to_keyframes(normalize_intervals(raw_intervals), keyframes)
+    intervals, issues = validate_intervals(intervals, duration, merge_overlaps)
+    issues = snap_issues + issues
+    plan = {'name': name, 'duration': duration, 'intervals': intervals, 'issues': issues}
+    plan.update(estimate_job(intervals, duration, source_kbps, output_kbps, cpu_seconds_per_second))
+    return plan
+
+def format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(count) < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024.0
+    return f"{count:.1f} TB"
+
+def print_plan(plans):
+    totals = {'download_bytes': 0, 'encode_cpu_seconds': 0, 'output_bytes': 0, 'output_seconds': 0}
+    for plan in plans:
+        print(f"{plan['name']} ({format_ms((plan['duration'] or 0) * 1000)})")
+        for start_ms, end_ms, title in plan['intervals']:
+            print(f"  {format_ms(start_ms)} - {format_ms(end_ms) if end_ms is not None else 'end'}  {title}")
+        for issue in plan['issues']:
+            print(f"  ! {issue}")
+        print(f"  download {format_bytes(plan['download_bytes'])}, encode {plan['encode_cpu_seconds']:.0f} CPU-s, "
+              f"output {format_bytes(plan['output_bytes'])}")
+        for key in totals:
+            totals[key] += plan[key]
+    print(f"Total for {len(plans)} job(s): download {format_bytes(totals['download_bytes'])}, "
+          f"encode {totals['encode_cpu_seconds']:.0f} CPU-s ({totals['encode_cpu_seconds'] / 3600:.1f} CPU-h), "
+          f"output {format_bytes(totals['output_bytes'])} for {format_ms(totals['output_seconds'] * 1000)} of video")
+    return totals
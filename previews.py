@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import bisect
+import os
+import media
+
+PREVIEW_MODES = ('pass', 'keyframes')
+TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+POSTER_WIDTH = 640
+# Seconds between sprite tiles when sampling the cutting pass
+SPRITE_INTERVAL = 2.0
+# The poster is taken a little way in, past fade-ins and title cards
+POSTER_POSITION = 0.1
+JPEG_QUALITY = 80
+
+def even(value):
+    return max(2, int(round(value / 2.0)) * 2)
+
+def vtt_time(seconds):
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+def write_vtt(vtt_path, cues):
+    # cues: [(start, end, sprite file name, x, y, width, height)] with times relative to the cut
+    with open(vtt_path, 'w') as file:
+        file.write("WEBVTT\n\n")
+        for start, end, sprite_name, x, y, width, height in cues:
+            file.write(f"{vtt_time(start)} --> {vtt_time(end)}\n{sprite_name}#xywh={x},{y},{width},{height}\n\n")
+
+def sprite_cues(times, duration, stem, tile_width, tile_height, columns=SPRITE_COLUMNS, rows=SPRITE_ROWS):
+    # Tile i covers times[i] until the next tile (the first one from 0, the last one until the end)
+    per_sheet = columns * rows
+    cues = []
+    for i, start in enumerate(times):
+        end = times[i + 1] if i + 1 < len(times) else duration
+        sheet, position = divmod(i, per_sheet)
+        row, column = divmod(position, columns)
+        cues.append((0.0 if i == 0 else start, end, f"{stem}_sprite_{sheet:03d}.jpg",
+                     column * tile_width, row * tile_height, tile_width, tile_height))
+    return cues
+
+class FrameSampler:
+    # Passed to moviepy's clip.fl so the frames write_videofile decodes for the cut are also used for
+    # the poster and the sprite tiles; nothing is decoded a second time.
+
+    def __init__(self, duration, interval=SPRITE_INTERVAL, tile_width=TILE_WIDTH):
+        self.duration = duration
+        self.interval = interval
+        self.tile_width = tile_width
+        self.poster_time = duration * POSTER_POSITION
+        self.next_time = 0.0
+        self.tiles = []
+        self.poster = None
+
+    def __call__(self, get_frame, t):
+        frame = get_frame(t)
+        if t + 1e-6 >= self.next_time:
+            self.tiles.append((t, resize(frame, self.tile_width)))
+            self.next_time = t + self.interval
+        if self.poster is None and t + 1e-6 >= self.poster_time:
+            self.poster = resize(frame, POSTER_WIDTH)
+        return frame
+
+    def write(self, output_dir, stem):
+        from PIL import Image
+        import numpy as np
+        written = []
+        if self.poster is not None:
+            poster_path = os.path.join(output_dir, f"{stem}.jpg")
+            Image.fromarray(self.poster).save(poster_path, quality=JPEG_QUALITY)
+            written.append(poster_path)
+        if not self.tiles:
+            return written
+
+        tile_height, tile_width = self.tiles[0][1].shape[:2]
+        per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+        for sheet in range(0, len(self.tiles), per_sheet):
+            tiles = [tile for _, tile in self.tiles[sheet:sheet + per_sheet]]
+            rows = (len(tiles) + SPRITE_COLUMNS - 1) // SPRITE_COLUMNS
+            canvas = np.zeros((rows * tile_height, SPRITE_COLUMNS * tile_width, 3), dtype=np.uint8)
+            for position, tile in enumerate(tiles):
+                row, column = divmod(position, SPRITE_COLUMNS)
+                canvas[row * tile_height:(row + 1) * tile_height, column * tile_width:(column + 1) * tile_width] = tile[:tile_height, :tile_width, :3]
+            sprite_path = os.path.join(output_dir, f"{stem}_sprite_{sheet // per_sheet:03d}.jpg")
+            Image.fromarray(canvas).save(sprite_path, quality=JPEG_QUALITY)
+            written.append(sprite_path)
+
+        vtt_path = os.path.join(output_dir, f"{stem}.vtt")
+        write_vtt(vtt_path, sprite_cues([t for t, _ in self.tiles], self.duration, stem, tile_width, tile_height))
+        written.append(vtt_path)
+        return written
+
+def resize(frame, width):
+    from PIL import Image
+    import numpy as np
+    height, source_width = frame.shape[:2]
+    return np.asarray(Image.fromarray(frame).resize((width, even(height * width / float(source_width))), Image.BILINEAR))
+
+def keyframe_previews(source, start, end, output_dir, stem, tile_width=TILE_WIDTH):
+    # Builds the poster and sprites from the source's keyframes only: ffmpeg skips every non-key
+    # frame, so the cost is one intra-frame decode per GOP plus the image encodes.
+    keyframes = media.get_keyframes(source)
+    end = end if end is not None else media.get_duration(source)
+    first = bisect.bisect_left(keyframes, start - 1e-6)
+    last = bisect.bisect_left(keyframes, end - 1e-6)
+    times = [keyframe - start for keyframe in keyframes[first:last]]
+    if not times:
+        print(f"No keyframes between {start:.3f} and {end:.3f} in {source}; no previews written.")
+        return []
+
+    video = media.stream_signature(source)['video']
+    width, height = video[2], video[3]
+    tile_height = even(height * tile_width / float(width))
+    written = []
+
+    poster_index = min(bisect.bisect_left(times, (end - start) * POSTER_POSITION), len(times) - 1)
+    poster_time = start + times[poster_index]
+    poster_path = os.path.join(output_dir, f"{stem}.jpg")
+    media.run_ffmpeg(['-ss', f"{poster_time:.3f}", '-i', source, '-frames:v', '1',
+                      '-vf', f"scale={POSTER_WIDTH}:-2", poster_path])
+    written.append(poster_path)
+
+    sprite_pattern = os.path.join(output_dir, f"{stem}_sprite_%03d.jpg")
+    media.run_ffmpeg(['-skip_frame', 'nokey', '-ss', f"{start:.3f}", '-i', source, '-t', f"{end - start:.3f}",
+                      '-an', '-vsync', 'passthrough', '-start_number', '0',
+                      '-vf', f"scale={tile_width}:{tile_height},tile={SPRITE_COLUMNS}x{SPRITE_ROWS}", sprite_pattern])
+    sheets = (len(times) + SPRITE_COLUMNS * SPRITE_ROWS - 1) // (SPRITE_COLUMNS * SPRITE_ROWS)
+    written += [sprite_pattern % sheet for sheet in range(sheets)]
+
+    vtt_path = os.path.join(output_dir, f"{stem}.vtt")
+    write_vtt(vtt_path, sprite_cues(times, end - start, stem, tile_width, tile_height))
+    written.append(vtt_path)
+    return written
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_INDEX_PATH = os.environ.get('EXTRACTOR_INDEX', os.path.join(os.getcwd(), 'processed_index.sqlite'))
+
+def make_key(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class ProcessedIndex:
+    # Persistent record of (video ID, interval set, settings) combinations that have already been
+    # cut, so a batch can skip duplicates before spending any network or CPU on them.
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        # Callers that share one index between threads serialize access themselves (see service.py)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS processed (
+            video_id TEXT NOT NULL,
+            intervals_key TEXT NOT NULL,
+            settings_key TEXT NOT NULL,
+            output_dir TEXT,
+            processed_at REAL NOT NULL,
+            PRIMARY KEY (video_id, intervals_key, settings_key)
+        )''')
+        self.conn.commit()
+
+    def lookup(self, video_id, intervals, settings):
+        row = self.conn.execute(
+            'SELECT output_dir FROM processed WHERE video_id = ? AND intervals_key = ? AND settings_key = ?',
+            (video_id, make_key(intervals), make_key(settings))).fetchone()
+        return row[0] if row else None
+
+    def contains(self, video_id, intervals, settings):
+        return self.lookup(video_id, intervals, settings) is not None
+
+    def add(self, video_id, intervals, settings, output_dir):
+        self.conn.execute('INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?)',
+                          (video_id, make_key(intervals), make_key(settings), output_dir, time.time()))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -1,4 +1,12 @@
 import subprocess
+from video_ids import canonical_video_id
+
+def read_config(config_file):
+    try:
+        with open(config_file, 'r') as file:
+            return file.read()
+    except OSError:
+        return None
 
 def run_extraction(api_key, script_path, urls_file):
     with open(urls_file, 'r') as file:
@@ -8,10 +16,17 @@ def run_extraction(api_key, script_path, urls_file):
         print("No URLs found in the file.")
         return
 
+    seen = set()
     for index, url in enumerate(urls, start=1):
         url = url.strip()
         if url:
             config_file = f"config-{index}.json"
+            # The same video listed under another URL form with the same intervals is only processed once
+            job_key = (canonical_video_id(url) or url, read_config(config_file))
+            if job_key in seen:
+                print(f"Skipping duplicate of an earlier entry: {url}")
+                continue
+            seen.add(job_key)
             print(f"Processing {url} with {config_file}")
             try:
                 subprocess.run(["python", script_path, "-url", url, "-api_key", api_key, "-intervals_path", config_file], check=True)
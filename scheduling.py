@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import asyncio
+import heapq
+import itertools
+import math
+from datetime import datetime, timezone
+import planner
+
+# Assumed download rate for the cost estimate (10 Mbit/s); only the relative cost of jobs matters
+DOWNLOAD_BYTES_PER_SECOND = 1250000
+NO_DEADLINE = float('inf')
+
+def parse_deadline(value):
+    # Epoch seconds or an ISO 8601 time ('2026-05-01T18:00:00Z'; without an offset it is UTC)
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def estimate_cost(intervals, duration, profile=None):
+    # Rough seconds of worker time: downloading the whole source (from the API duration) plus
+    # encoding the covered part with the profile. intervals may be in any form
+    # planner.normalize_intervals accepts; a job without intervals is skipped, so it costs nothing.
+    if not intervals:
+        return 0.0
+    profile = profile or {}
+    estimate = planner.estimate_job(planner.normalize_intervals(intervals), duration,
+                                    output_kbps=profile.get('output_kbps'),
+                                    cpu_seconds_per_second=profile.get('cpu_seconds_per_second',
+                                                                       planner.ENCODE_CPU_SECONDS_PER_SECOND))
+    return estimate['download_bytes'] / float(DOWNLOAD_BYTES_PER_SECOND) + estimate['encode_cpu_seconds']
+
+# A policy maps a job (with 'cost', 'priority' and 'deadline') and its arrival number to a sort key;
+# the smallest key runs first. Higher priorities always go before lower ones. Register more in POLICIES.
+def fifo_key(job, arrival):
+    return (-job.get('priority', 0), arrival)
+
+def sjf_key(job, arrival):
+    return (-job.get('priority', 0), job.get('cost', 0.0), arrival)
+
+def edf_key(job, arrival):
+    deadline = job.get('deadline')
+    return (-job.get('priority', 0), NO_DEADLINE if deadline is None else deadline, job.get('cost', 0.0), arrival)
+
+POLICIES = {'fifo': fifo_key, 'sjf': sjf_key, 'edf': edf_key}
+# URL order stays the default; sjf and edf are chosen with -schedule
+DEFAULT_POLICY = 'fifo'
+
+def get_policy(name=None):
+    name = name or DEFAULT_POLICY
+    if name not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy '{name}'. Available: {', '.join(sorted(POLICIES))}")
+    return POLICIES[name]
+
+class JobQueue(asyncio.Queue):
+    # asyncio.Queue that hands out the waiting job the policy ranks first instead of the oldest one.
+    # annotate(job) fills in 'cost', 'priority' and 'deadline' as the job is queued. None (the end
+    # marker of the consumers) always comes last.
+
+    def __init__(self, policy=None, maxsize=0, annotate=None):
+        self.key = get_policy(policy) if not callable(policy) else policy
+        self.annotate = annotate
+        self.arrivals = itertools.count()
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._queue = []
+
+    def _put(self, job):
+        arrival = next(self.arrivals)
+        if job is None:
+            heapq.heappush(self._queue, ((NO_DEADLINE,), arrival, None))
+            return
+        if self.annotate:
+            self.annotate(job)
+        heapq.heappush(self._queue, (self.key(job, arrival), arrival, job))
+
+    def _get(self):
+        return heapq.heappop(self._queue)[2]
+
+def percentile(values, fraction):
+    # Nearest-rank percentile
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def simulate(jobs, policy, workers=1):
+    # Replays jobs on `workers` identical workers without preemption. Each job is a dict with
+    # 'arrival' (seconds), 'cost' (used for ranking) and optionally 'seconds' (the time it actually
+    # took, default the cost), 'priority' and 'deadline' (seconds on the same clock as 'arrival').
+    # Returns [(job, start, finish)] in start order.
+    key = get_policy(policy) if not callable(policy) else policy
+    pending = sorted(enumerate(jobs), key=lambda item: (item[1].get('arrival', 0.0), item[0]))
+    ready = []
+    free_at = [0.0] * workers
+    heapq.heapify(free_at)
+    schedule = []
+    position = 0
+    while position < len(pending) or ready:
+        now = free_at[0]
+        if not ready and pending[position][1].get('arrival', 0.0) > now:
+            now = pending[position][1].get('arrival', 0.0)
+        while position < len(pending) and pending[position][1].get('arrival', 0.0) <= now:
+            index, job = pending[position]
+            heapq.heappush(ready, (key(job, index), index, job))
+            position += 1
+        _, _, job = heapq.heappop(ready)
+        heapq.heappop(free_at)
+        finish = now + job.get('seconds', job.get('cost', 0.0))
+        heapq.heappush(free_at, finish)
+        schedule.append((job, now, finish))
+    return schedule
+
+def summarize(schedule):
+    completion = [finish - job.get('arrival', 0.0) for job, _, finish in schedule]
+    missed = sum(1 for job, _, finish in schedule if job.get('deadline') is not None and finish > job['deadline'])
+    return {'jobs': len(schedule), 'mean': sum(completion) / len(completion) if completion else 0.0,
+            'p95': percentile(completion, 0.95), 'max': max(completion or [0.0]),
+            'makespan': max([finish for _, _, finish in schedule] or [0.0]), 'missed_deadlines': missed}
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import itertools
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+import planner
+
+# Where sources and temporary files go, e.g. a tmpfs or NVMe mount (default: the output directory)
+SCRATCH_DIR = os.environ.get('EXTRACTOR_SCRATCH')
+# Free space left alone on every volume for everything else on the host
+DEFAULT_RESERVE_BYTES = 2 * 1024 ** 3
+# yt_dlp keeps the separate video and audio downloads next to the merged file until the merge ends
+MERGE_FACTOR = 2.0
+# The bitrates behind the estimates are rough; admit with some margin
+SAFETY_FACTOR = 1.25
+SCRATCH_PREFIX = '.scratch-'
+
+def estimate_disk_need(intervals, duration, source_kbps=None, output_kbps=None, remote_output=False):
+    # Peak bytes of a job: {'scratch': source download and merge plus the temporary files of the
+    # longest cut, 'output': the cuts kept in the output directory (nothing when they are streamed
+    # to object storage)}. intervals may be in any form planner.normalize_intervals accepts.
+    normalized = planner.normalize_intervals(intervals)
+    estimate = planner.estimate_job(normalized, duration, source_kbps, output_kbps)
+    output_kbps = output_kbps or source_kbps or planner.DEFAULT_OUTPUT_KBPS
+    longest = max([((end_ms / 1000.0) if end_ms is not None else (duration or 0)) - start_ms / 1000.0
+                   for start_ms, end_ms, _ in normalized] or [0])
+    scratch = estimate['download_bytes'] * MERGE_FACTOR + longest * output_kbps * 125
+    output = 0 if remote_output else estimate['output_bytes']
+    return {'scratch': int(scratch * SAFETY_FACTOR), 'output': int(output * SAFETY_FACTOR)}
+
+def used_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def device_of(path):
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+def clean_job_dir(job_dir, keep=()):
+    # Removes everything a finished cut left in the job's scratch directory (moviepy's temporary
+    # audio, encoder chunks) except the paths in keep and the files named after them (the source's
+    # keyframe cache)
+    kept = tuple(os.path.abspath(path) for path in keep if path)
+    for name in os.listdir(job_dir):
+        path = os.path.abspath(os.path.join(job_dir, name))
+        if kept and path.startswith(kept):
+            continue
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def outermost(paths):
+    # The paths not inside another one, so nothing is counted twice (without a scratch volume the
+    # job's scratch directory sits inside its output directory)
+    paths = [os.path.abspath(path) for path in paths]
+    return [path for path in paths
+            if not any(other != path and path.startswith(other.rstrip(os.sep) + os.sep) for other in paths)]
+
+class _Admission:
+    def __init__(self, demand, paths):
+        # demand: {device: (a path on it, bytes)}; paths: where the job writes
+        self.demand = demand
+        self.paths = outermost(paths)
+
+    def outstanding(self, device):
+        # The part of the reservation the job has not written yet; what it has written already shows
+        # up as used space on the volume
+        if device not in self.demand:
+            return 0
+        used = sum(used_bytes(path) for path in self.paths if os.path.exists(path) and device_of(path) == device)
+        return max(0, self.demand[device][1] - used)
+
+class ScratchSpace:
+    # Admits a job only when every volume it writes to has room for its estimated peak need on top
+    # of what the jobs already running have reserved but not yet written. A job whose need exceeds
+    # the whole budget runs alone rather than waiting forever.
+
+    def __init__(self, scratch_dir=None, reserve_bytes=DEFAULT_RESERVE_BYTES):
+        self.scratch_dir = os.path.abspath(scratch_dir) if scratch_dir else None
+        self.reserve_bytes = reserve_bytes
+        # Keyed by a token per admission, since callers may admit two jobs under the same id
+        self.jobs = {}
+        self.tokens = itertools.count()
+        self.cond = threading.Condition()
+        if self.scratch_dir:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+
+    def _available(self, device, path):
+        free = shutil.disk_usage(path).free - self.reserve_bytes
+        return free - sum(admission.outstanding(device) for admission in self.jobs.values())
+
+    def _fits(self, demand):
+        return all(self._available(device, path) >= nbytes for device, (path, nbytes) in demand.items())
+
+    def _demand(self, need, job_root, output_dir):
+        demand = {}
+        for path, nbytes in ((job_root, need['scratch']), (output_dir, need['output'])):
+            device = device_of(path)
+            previous = demand.get(device, (path, 0))
+            demand[device] = (previous[0], previous[1] + nbytes)
+        return demand
+
+    @contextmanager
+    def admit(self, job_id, need, output_dir):
+        # Blocks until the job fits, then yields its scratch directory, which is removed afterwards
+        job_root = self.scratch_dir or output_dir
+        with self.cond:
+            token = next(self.tokens)
+        job_dir = os.path.join(job_root, SCRATCH_PREFIX + re.sub(r'[^\w\-]', '_', str(job_id)) + f"-{token}")
+        demand = self._demand(need, job_root, output_dir)
+        admission = _Admission(demand, [job_dir, output_dir])
+        with self.cond:
+            waited = False
+            while not self._fits(demand):
+                if not self.jobs:
+                    print(f"Job {job_id} needs about {planner.format_bytes(sum(n for _, n in demand.values()))}, "
+                          f"more than the free space allows; running it alone.")
+                    break
+                if not waited:
+                    print(f"Waiting for disk space for {job_id} "
+                          f"(about {planner.format_bytes(sum(n for _, n in demand.values()))} needed)")
+                    waited = True
+                # Woken when a job finishes; the timeout also picks up space freed outside the tool
+                self.cond.wait(5.0)
+            self.jobs[token] = admission
+        try:
+            os.makedirs(job_dir, exist_ok=True)
+            yield job_dir
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            with self.cond:
+                self.jobs.pop(token, None)
+                self.cond.notify_all()
+
+_default_scratch = None
+
+def get_scratch():
+    global _default_scratch
+    if _default_scratch is None:
+        _default_scratch = ScratchSpace(SCRATCH_DIR)
+    return _default_scratch
+
+def configure(scratch_dir=None, reserve_bytes=DEFAULT_RESERVE_BYTES):
+    global _default_scratch
+    _default_scratch = ScratchSpace(scratch_dir or SCRATCH_DIR, reserve_bytes)
+    return _default_scratch
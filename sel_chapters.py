@@ -15,7 +15,7 @@ def format_timestamp(timestamp):
         return "00:" + timestamp
     return timestamp
 
-def get_youtube_chapters(url):
+def get_youtube_chapters(url, output_path='chapters_output.json'):
     service = FirefoxService(executable_path='./geckodriver.exe')
     driver = webdriver.Firefox(service=service)
     driver.get(url)
@@ -79,7 +79,7 @@ def get_youtube_chapters(url):
                 continue
 
         driver.quit()
-        with open('chapters_output.json', 'w') as file:
+        with open(output_path, 'w') as file:
             json.dump(chapters_list, file)
 
     except TimeoutException as e:
@@ -89,7 +89,8 @@ def get_youtube_chapters(url):
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         url = sys.argv[1]
-        get_youtube_chapters(url)
+        output_path = sys.argv[2] if len(sys.argv) > 2 else 'chapters_output.json'
+        get_youtube_chapters(url, output_path)
     else:
         print("Error: No URL provided.")
         sys.exit(1)
\ No newline at end of file
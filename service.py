@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import app
+import chapter_parser
+import downloaders
+import encoder_profiles
+import planner
+import scratch
+import storage
+from processed_index import ProcessedIndex
+from video_ids import canonical_video_id, canonical_url
+
+CHAPTERS_INTERVALS_KEY = 'description_chapters'
+# Finished jobs kept for status queries before the oldest are forgotten
+JOB_HISTORY = 1000
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Per worker process state, set up once by init_worker and reused by every job the process runs
+_progress_queue = None
+_api_key = None
+
+WARM_MODULES = ('requests', 'yt_dlp', 'moviepy.editor')
+
+def init_worker(progress_queue, api_key, warm, storage_settings=None, scratch_settings=None, download_settings=None):
+    global _progress_queue, _api_key
+    _progress_queue = progress_queue
+    _api_key = api_key
+    # Each worker opens its own storage client rather than sharing the parent's across the fork,
+    # and applies the scratch and download settings given on the command line
+    storage.configure(**(storage_settings or {}))
+    scratch.configure(**(scratch_settings or {}))
+    downloaders.configure(**(download_settings or {}))
+    if warm:
+        # Pay for the heavy imports once per worker instead of once per job
+        try:
+            for name in WARM_MODULES:
+                importlib.import_module(name)
+        except ImportError as e:
+            print(f"Could not preload backends: {e}")
+
+def run_job(job):
+    # Runs in a worker process. Metadata requests reuse the worker's pooled youtube_api session.
+    def report(stage, done=0, total=0):
+        _progress_queue.put((job['id'], stage, done, total))
+
+    report('metadata')
+    description, title, duration = app.get_video_info(_api_key, job['url'])
+    if duration is None:
+        raise RuntimeError("Video metadata not available")
+    if job['chapters']:
+        raw_intervals = chapter_parser.chapters_to_intervals(chapter_parser.parse_chapters(description, duration))
+        if not raw_intervals:
+            raise RuntimeError("No chapters found in the video description")
+    else:
+        raw_intervals = job['intervals']
+
+    profile = encoder_profiles.get_profile(job['profile'], job['threads'])
+    plan = planner.plan_job(title, raw_intervals, duration, merge_overlaps=job['merge_overlaps'],
+                            output_kbps=profile['output_kbps'], cpu_seconds_per_second=profile['cpu_seconds_per_second'])
+    if not plan['intervals']:
+        raise RuntimeError("No valid intervals left after validation")
+    intervals = chapter_parser.chapters_to_intervals(plan['intervals'])
+
+    output_directory = app.process_videos(job['url'], intervals, app.setup_output_directory(title), duration,
+                                          profile=profile, progress=report)
+    if not output_directory:
+        raise RuntimeError("Source video could not be retrieved")
+    return {'title': title, 'output_dir': output_directory, 'issues': plan['issues']}
+
+def list_outputs(output_dir):
+    # output_dir is a local directory or, with object storage, an s3:// location
+    if not output_dir:
+        return []
+    return storage.get_storage().list_outputs(output_dir)
+
+class JobService:
+    # Accepts jobs from the HTTP handlers, runs them on a pool of warm worker processes and keeps
+    # their status. Submissions are refused once max_queue jobs are queued or running.
+
+    def __init__(self, api_key, workers=2, max_queue=32, warm=True, index_path=None, storage_settings=None,
+                 scratch_settings=None, download_settings=None):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.max_queue = max_queue
+        self.workers = workers
+        self.index = ProcessedIndex(index_path) if index_path else ProcessedIndex()
+        self.progress_queue = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                            initargs=(self.progress_queue, api_key, warm, storage_settings,
+                                                      scratch_settings, download_settings))
+        self.progress_thread = threading.Thread(target=self._read_progress, daemon=True)
+        self.progress_thread.start()
+
+    def _read_progress(self):
+        while True:
+            job_id, stage, done, total = self.progress_queue.get()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job and job['status'] in ACTIVE_STATUSES:
+                    job['status'] = 'running'
+                    job['stage'] = stage
+                    job['progress'] = {'done': done, 'total': total}
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job['status'] not in ACTIVE_STATUSES]
+        for job in sorted(finished, key=lambda job: job['submitted_at'])[:max(0, len(self.jobs) - JOB_HISTORY)]:
+            del self.jobs[job['id']]
+
+    def counts(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+    def submit(self, request):
+        # Returns (http_status, body)
+        video_id = canonical_video_id(request.get('url') or '')
+        if not video_id:
+            return 400, {'error': "A valid YouTube 'url' is required"}
+        chapters = bool(request.get('chapters'))
+        intervals = request.get('intervals')
+        if not chapters:
+            if not intervals:
+                return 400, {'error': "Either 'intervals' or 'chapters': true is required"}
+            try:
+                planner.normalize_intervals(intervals)
+            except (TypeError, ValueError, IndexError) as e:
+                return 400, {'error': f"Invalid intervals: {e}"}
+        try:
+            profile = encoder_profiles.get_profile(request.get('profile'), request.get('threads'))
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+        intervals_key = CHAPTERS_INTERVALS_KEY if chapters else intervals
+        settings = encoder_profiles.settings_key(profile)
+        with self.lock:
+            # The same video, intervals and settings already in flight are not run twice
+            for job in self.jobs.values():
+                if job['status'] in ACTIVE_STATUSES and job['key'] == (video_id, intervals_key, settings):
+                    return 200, self.describe(job)
+            output_dir = self.index.lookup(video_id, intervals_key, settings)
+            if output_dir:
+                job = self._new_job(video_id, chapters, intervals, profile, intervals_key, settings)
+                job.update(status='skipped', output_dir=output_dir, finished_at=time.time())
+                return 200, self.describe(job)
+            active = sum(1 for job in self.jobs.values() if job['status'] in ACTIVE_STATUSES)
+            if active >= self.max_queue:
+                return 503, {'error': f"Queue is full ({active} jobs queued or running)"}
+            job = self._new_job(video_id, chapters, intervals, profile, intervals_key, settings)
+            self._forget_old_jobs()
+
+        future = self.executor.submit(run_job, {
+            'id': job['id'], 'url': job['url'], 'chapters': chapters, 'intervals': intervals,
+            'profile': profile['name'], 'threads': profile['threads'],
+            'merge_overlaps': bool(request.get('merge_overlaps'))})
+        future.add_done_callback(lambda future, job_id=job['id']: self._finish(job_id, future))
+        return 202, self.describe(job)
+
+    def _new_job(self, video_id, chapters, intervals, profile, intervals_key, settings):
+        job = {'id': uuid.uuid4().hex[:12], 'video_id': video_id, 'url': canonical_url(video_id),
+               'chapters': chapters, 'intervals': intervals, 'profile': profile['name'], 'status': 'queued',
+               'stage': None, 'progress': None, 'title': None, 'output_dir': None, 'issues': [], 'error': None,
+               'submitted_at': time.time(), 'finished_at': None, 'key': (video_id, intervals_key, settings)}
+        self.jobs[job['id']] = job
+        return job
+
+    def _finish(self, job_id, future):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            job['finished_at'] = time.time()
+            try:
+                result = future.result()
+            except Exception as e:
+                job.update(status='failed', error=str(e))
+                print(f"Job {job_id} ({job['url']}) failed: {e}")
+                return
+            job.update(status='done', stage='done', **result)
+            video_id, intervals_key, settings = job['key']
+            self.index.add(video_id, intervals_key, settings, result['output_dir'])
+
+    def describe(self, job):
+        return {key: value for key, value in job.items() if key != 'key'}
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return self.describe(job) if job else None
+
+    def list(self):
+        with self.lock:
+            return [self.describe(job) for job in sorted(self.jobs.values(), key=lambda job: job['submitted_at'])]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.index.close()
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # POST /jobs, GET /jobs, GET /jobs/<id>, GET /jobs/<id>/outputs, GET /health
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts == ['health']:
+            self.send_json(200, {'workers': service.workers, 'max_queue': service.max_queue, 'jobs': service.counts()})
+        elif parts == ['jobs']:
+            self.send_json(200, service.list())
+        elif len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = service.get(parts[1])
+            if not job:
+                self.send_json(404, {'error': f"Unknown job {parts[1]}"})
+            elif len(parts) == 2:
+                self.send_json(200, job)
+            elif parts[2] == 'outputs':
+                self.send_json(200, {'output_dir': job['output_dir'], 'files': list_outputs(job['output_dir'])})
+            else:
+                self.send_json(404, {'error': 'Not found'})
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if urlparse(self.path).path.strip('/') != 'jobs':
+            self.send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            self.send_json(400, {'error': f"Invalid JSON body: {e}"})
+            return
+        if not isinstance(request, dict):
+            self.send_json(400, {'error': 'The body must be a JSON object'})
+            return
+        status, body = self.server.service.submit(request)
+        self.send_json(status, body, {'Retry-After': '30'} if status == 503 else None)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local HTTP/JSON service that downloads and trims YouTube videos.')
+    parser.add_argument('-api_key', type=str, help='YouTube Data API key', required=True)
+    parser.add_argument('-host', type=str, help='Address to listen on', default='127.0.0.1')
+    parser.add_argument('-port', type=int, help='Port to listen on', default=8080)
+    parser.add_argument('-workers', type=int, help='Worker processes running jobs', default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('-max_queue', type=int, help='Jobs queued or running before submissions get 503', default=32)
+    parser.add_argument('-no_warm', action='store_true', help='Do not preload moviepy and yt_dlp in the workers')
+    parser.add_argument('-storage', type=str, default=storage.STORAGE_URL, help='Output location: a directory or s3://bucket/prefix (default: EXTRACTOR_STORAGE or the current directory)')
+    parser.add_argument('-upload_concurrency', type=int, default=storage.DEFAULT_UPLOAD_CONCURRENCY, help='Parts uploaded at the same time per output (s3 storage)')
+    parser.add_argument('-part_size_mb', type=int, default=storage.DEFAULT_PART_SIZE // 1048576, help='Multipart upload part size in MiB (s3 storage, at least 5)')
+    parser.add_argument('-downloaders', type=str, nargs='+', default=None, help='Download backends to use, e.g. yt_dlp pytube (default: every registered one, the fastest healthy one first)')
+    parser.add_argument('-scratch_dir', type=str, default=scratch.SCRATCH_DIR, help='Volume for downloads and temporary files, e.g. a tmpfs or NVMe mount (default: EXTRACTOR_SCRATCH or the output directory)')
+    parser.add_argument('-disk_reserve_gb', type=float, default=scratch.DEFAULT_RESERVE_BYTES / 1024 ** 3, help='Free space left untouched on each volume; jobs wait until their estimated need fits above it')
+    args = parser.parse_args()
+
+    storage_settings = {'url': args.storage, 'part_size': args.part_size_mb * 1048576, 'concurrency': args.upload_concurrency}
+    scratch_settings = {'scratch_dir': args.scratch_dir, 'reserve_bytes': int(args.disk_reserve_gb * 1024 ** 3)}
+    download_settings = {'backends': args.downloaders}
+    storage.configure(**storage_settings)
+    # Checked here so an unknown backend is reported before the workers start
+    try:
+        downloaders.check_backends(args.downloaders)
+    except ValueError as e:
+        parser.error(str(e))
+    service = JobService(args.api_key, workers=args.workers, max_queue=args.max_queue, warm=not args.no_warm,
+                         storage_settings=storage_settings, scratch_settings=scratch_settings,
+                         download_settings=download_settings)
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    server.service = service
+    print(f"Listening on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down; waiting for running jobs.")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
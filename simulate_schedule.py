@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Replays a recorded job manifest under each scheduling policy and compares completion times.
+# The manifest has one JSON object per line, e.g. the output of `batch.py -discover_only`:
+# - duration: source length in seconds (from the API's contentDetails.duration)
+# - intervals: the chapters to cut (default: the whole video)
+# - profile: encoder profile name (default: -profile)
+# - cost: estimated seconds of work (default: estimated from the above)
+# - seconds: how long the job actually took, when known (default: the cost)
+# - arrival: seconds after the start of the batch at which the job was queued (default 0)
+# - priority, deadline: as in the batch manifest (deadline in epoch seconds or ISO 8601)
+
+import argparse
+import json
+import time
+import chapter_parser
+import encoder_profiles
+import scheduling
+
+def load_jobs(path, default_profile, start):
+    jobs = []
+    with open(path, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            try:
+                entry = json.loads(line)
+                profile = encoder_profiles.get_profile(entry.get('profile') or default_profile)
+                duration = float(entry.get('duration') or 0)
+                cost = entry.get('cost')
+                if cost is None:
+                    cost = scheduling.estimate_cost(entry.get('intervals') or [(0, 'end')], duration, profile)
+                deadline = scheduling.parse_deadline(entry.get('deadline'))
+                job = {'name': entry.get('video_id') or entry.get('url') or f"line {line_number}",
+                       'cost': float(cost), 'arrival': float(entry.get('arrival') or 0),
+                       'priority': int(entry.get('priority') or 0),
+                       'deadline': deadline - start if deadline is not None else None}
+                if entry.get('seconds') is not None:
+                    job['seconds'] = float(entry['seconds'])
+                jobs.append(job)
+            except (ValueError, TypeError) as e:
+                print(f"Invalid job on line {line_number} of {path}: {e}. Skipping.")
+    return jobs
+
+def format_seconds(seconds):
+    return chapter_parser.format_ms(round(seconds) * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare scheduling policies on a recorded job manifest.')
+    parser.add_argument('manifest', type=str, help='JSON lines manifest, e.g. from batch.py -discover_only')
+    parser.add_argument('-workers', type=int, help='Jobs in progress at the same time', default=4)
+    parser.add_argument('-policies', type=str, nargs='+', choices=sorted(scheduling.POLICIES), default=sorted(scheduling.POLICIES))
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile for jobs that do not name one')
+    parser.add_argument('-start', type=str, default=None, help='When the replayed batch starts, for the deadlines (epoch seconds or ISO 8601; default: now)')
+    args = parser.parse_args()
+
+    start = scheduling.parse_deadline(args.start)
+    jobs = load_jobs(args.manifest, args.profile, start if start is not None else time.time())
+    if not jobs:
+        print("No jobs found in the manifest.")
+        return
+
+    print(f"{len(jobs)} jobs, {args.workers} workers, {format_seconds(sum(job.get('seconds', job['cost']) for job in jobs))} of work")
+    print(f"{'policy':<8}{'mean':>12}{'p95':>12}{'max':>12}{'makespan':>12}{'missed':>8}")
+    for policy in args.policies:
+        summary = scheduling.summarize(scheduling.simulate(jobs, policy, args.workers))
+        print(f"{policy:<8}{format_seconds(summary['mean']):>12}{format_seconds(summary['p95']):>12}"
+              f"{format_seconds(summary['max']):>12}{format_seconds(summary['makespan']):>12}{summary['missed_deadlines']:>8}")
+
+if __name__ == "__main__":
+    main()
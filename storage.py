@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Where outputs go: a directory (the default is the current one) or s3://bucket/prefix
+STORAGE_URL = os.environ.get('EXTRACTOR_STORAGE')
+# Set for S3-compatible stores such as MinIO, e.g. http://127.0.0.1:9000
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+# S3 parts must be at least 5 MiB, except the last one
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_UPLOAD_CONCURRENCY = 4
+PRESIGNED_URL_SECONDS = 3600
+# Fragmented MP4 is written front to back, so the muxer never seeks back into data already uploaded
+STREAMING_FFMPEG_PARAMS = ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+SOURCE_CACHE_PREFIX = 'sources/'
+
+class LocalStorage:
+    # Outputs are written straight into <root>/<name>
+    remote = False
+    ffmpeg_params = []
+
+    def __init__(self, root=None):
+        self.root = os.path.abspath(root or os.getcwd())
+
+    def output_directory(self, name):
+        output_directory = os.path.join(self.root, name)
+        os.makedirs(output_directory, exist_ok=True)
+        return output_directory
+
+    @contextmanager
+    def writer(self, path):
+        yield path
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def reader(self, path):
+        return path
+
+    def remove(self, path):
+        os.remove(path)
+
+    def publish(self, output_directory, exclude=()):
+        return output_directory
+
+    def list_outputs(self, location):
+        # [{'name', 'bytes'}] of the videos in a published output location
+        if not os.path.isdir(location):
+            return []
+        return [{'name': name, 'bytes': os.path.getsize(os.path.join(location, name))}
+                for name in sorted(os.listdir(location)) if name.endswith('.mp4')]
+
+    def link(self, location, output_directory):
+        # Hard-links the files of an earlier output directory into another one (copies them when
+        # the two are on different volumes)
+        if not os.path.isdir(location):
+            raise ValueError(f"{location} is not an output directory")
+        for name in sorted(os.listdir(location)):
+            path = os.path.join(location, name)
+            target = os.path.join(output_directory, name)
+            if not os.path.isfile(path) or os.path.exists(target):
+                continue
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+        return output_directory
+
+class MultipartUpload:
+    # Uploads a stream as it is produced: parts of part_size bytes are sent by up to `concurrency`
+    # threads, so at most concurrency + 1 parts are held in memory.
+
+    def __init__(self, client, bucket, key, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+        self.parts = []
+        self.error = None
+
+    def _upload_part(self, number, data):
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=data)
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def upload_stream(self, stream):
+        slots = threading.Semaphore(self.concurrency)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            number = 1
+            while True:
+                data = read_exactly(stream, self.part_size)
+                if not data and number > 1:
+                    break
+                slots.acquire()
+                future = executor.submit(self._upload_part, number, data)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+                number += 1
+                if len(data) < self.part_size:
+                    break
+        self.parts = [future.result() for future in futures]
+
+    def upload_file(self, path):
+        # Target of the reader thread; errors are kept for the writer to raise
+        try:
+            with open(path, 'rb') as stream:
+                self.upload_stream(stream)
+        except Exception as e:
+            self.error = e
+
+    def complete(self):
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+def read_exactly(stream, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+def release_fifo(path):
+    # If the encoder failed before opening the FIFO, the reader is blocked in open() (or about to
+    # be); a writer that opens and closes at once gives it EOF
+    try:
+        os.close(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+    except OSError:
+        pass
+
+class S3Storage:
+    # Outputs are uploaded to s3://<bucket>/<prefix><name>/. Videos are streamed to a multipart upload
+    # through a FIFO while they are encoded, so they never land on local disk; the small side files
+    # (manifest, previews) are spooled locally and uploaded by publish().
+    remote = True
+    ffmpeg_params = STREAMING_FFMPEG_PARAMS
+
+    def __init__(self, bucket, prefix='', part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY,
+                 spool_root=None):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        self.client = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.transfer_config = TransferConfig(multipart_chunksize=part_size, max_concurrency=concurrency)
+        self.spool_root = os.path.abspath(spool_root or tempfile.mkdtemp(prefix='extractor_spool_'))
+
+    def key_for(self, path):
+        return self.prefix + os.path.relpath(os.path.abspath(path), self.spool_root).replace(os.sep, '/')
+
+    def url_for(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+    def output_directory(self, name):
+        output_directory = os.path.join(self.spool_root, name)
+        os.makedirs(output_directory, exist_ok=True)
+        return output_directory
+
+    @contextmanager
+    def writer(self, path):
+        if os.path.lexists(path):
+            os.remove(path)
+        os.mkfifo(path)
+        upload = MultipartUpload(self.client, self.bucket, self.key_for(path), self.part_size, self.concurrency)
+        reader = threading.Thread(target=upload.upload_file, args=(path,), daemon=True)
+        reader.start()
+        succeeded = False
+        try:
+            yield path
+            succeeded = True
+        finally:
+            while reader.is_alive():
+                release_fifo(path)
+                reader.join(0.1)
+            os.remove(path)
+            if succeeded and not upload.error:
+                upload.complete()
+            else:
+                upload.abort()
+        if upload.error:
+            raise upload.error
+
+    def exists(self, path):
+        return self.exists_key(self.key_for(path))
+
+    def exists_key(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def reader(self, path):
+        # ffprobe/ffmpeg read the object over HTTP with range requests
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': self.key_for(path)},
+                                                  ExpiresIn=PRESIGNED_URL_SECONDS)
+
+    def remove(self, path):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key_for(path))
+
+    def publish(self, output_directory, exclude=()):
+        excluded = set(os.path.abspath(path) for path in exclude if path)
+        for name in sorted(os.listdir(output_directory)):
+            path = os.path.abspath(os.path.join(output_directory, name))
+            if path in excluded or not stat.S_ISREG(os.lstat(path).st_mode):
+                continue
+            self.put(path, self.key_for(path))
+        shutil.rmtree(output_directory, ignore_errors=True)
+        return self.url_for(self.key_for(output_directory))
+
+    def list_objects(self, prefix):
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            objects.extend(page.get('Contents', []))
+        return objects
+
+    def list_keys(self, prefix):
+        return [item['Key'] for item in self.list_objects(prefix)]
+
+    def list_outputs(self, location):
+        # [{'name', 'bytes'}] of the videos published under an s3:// location of this bucket
+        parsed = urlparse(location)
+        if parsed.scheme != 's3' or parsed.netloc != self.bucket:
+            return []
+        prefix = parsed.path.strip('/') + '/'
+        return [{'name': item['Key'][len(prefix):], 'bytes': item['Size']}
+                for item in sorted(self.list_objects(prefix), key=lambda item: item['Key'])
+                if item['Key'].endswith('.mp4') and '/' not in item['Key'][len(prefix):]]
+
+    def link(self, location, output_directory):
+        # Copies the objects of an earlier output location to this output directory's key prefix
+        # inside the bucket (server-side, nothing is downloaded)
+        parsed = urlparse(location)
+        if parsed.scheme != 's3' or parsed.netloc != self.bucket:
+            raise ValueError(f"{location} is not in s3://{self.bucket}")
+        source_prefix = parsed.path.strip('/') + '/'
+        target_prefix = self.key_for(output_directory) + '/'
+        keys = self.list_keys(source_prefix)
+        if not keys:
+            raise ValueError(f"nothing is stored under {location}")
+        if source_prefix != target_prefix:
+            for key in keys:
+                self.client.copy({'Bucket': self.bucket, 'Key': key}, self.bucket,
+                                 target_prefix + key[len(source_prefix):], Config=self.transfer_config)
+        shutil.rmtree(output_directory, ignore_errors=True)
+        return self.url_for(target_prefix.rstrip('/'))
+
+    def put(self, local_path, key):
+        self.client.upload_file(local_path, self.bucket, key, Config=self.transfer_config)
+
+    def fetch(self, key, local_path):
+        # Returns False when the object does not exist
+        if not self.exists_key(self.prefix + key):
+            return False
+        self.client.download_file(self.bucket, self.prefix + key, local_path, Config=self.transfer_config)
+        return True
+
+    def store(self, local_path, key):
+        self.put(local_path, self.prefix + key)
+
+def open_storage(url=None, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY):
+    url = url or STORAGE_URL
+    if not url:
+        return LocalStorage()
+    parsed = urlparse(url)
+    if parsed.scheme == 's3':
+        return S3Storage(parsed.netloc, parsed.path, part_size=part_size, concurrency=concurrency)
+    if parsed.scheme == 'file':
+        return LocalStorage(parsed.path)
+    if not parsed.scheme:
+        return LocalStorage(url)
+    raise ValueError(f"Unsupported storage URL: {url}")
+
+_default_storage = None
+
+def get_storage():
+    global _default_storage
+    if _default_storage is None:
+        _default_storage = open_storage()
+    return _default_storage
+
+def configure(url=None, part_size=DEFAULT_PART_SIZE, concurrency=DEFAULT_UPLOAD_CONCURRENCY):
+    global _default_storage
+    _default_storage = open_storage(url, part_size, concurrency)
+    return _default_storage
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import subprocess
+import time
+import media
+
+# A re-encoded cut may differ from the requested interval by up to a frame or an audio packet
+DURATION_TOLERANCE = 0.5
+# GOPs decoded per output: the first, the last (where truncation shows) and evenly spaced ones between
+SAMPLED_GOPS = 3
+MANIFEST_NAME = 'manifest.json'
+
+class VerificationError(Exception):
+    pass
+
+def new_result(path, expected_duration=None, name=None):
+    return {'file': name or os.path.basename(path), 'ok': False, 'duration': None, 'expected_duration': expected_duration,
+            'reasons': [], 'checked_at': time.time()}
+
+def failed_result(path, reason, expected_duration=None):
+    result = new_result(path, expected_duration)
+    result['reasons'].append(reason)
+    return result
+
+def sample_keyframes(keyframes, count=SAMPLED_GOPS):
+    if len(keyframes) <= count:
+        return list(range(len(keyframes)))
+    if count < 2:
+        return [len(keyframes) - 1]
+    step = (len(keyframes) - 1) / float(count - 1)
+    return sorted(set(int(round(i * step)) for i in range(count)))
+
+def decode_gop(path, start, length):
+    # Decodes one GOP of the video stream and returns ffmpeg's error output, or None if it decoded cleanly
+    cmd = [media.FFMPEG_BINARY, '-hide_banner', '-v', 'error', '-xerror', '-ss', f"{start:.3f}", '-i', path,
+           '-t', f"{max(length, 0.001):.3f}", '-map', '0:v:0', '-f', 'null', '-']
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    error = result.stderr.strip()
+    if result.returncode != 0 or error:
+        return error.splitlines()[-1] if error else f"ffmpeg exited with status {result.returncode}"
+    return None
+
+def verify_output(path, expected_duration=None, expect_audio=True, tolerance=DURATION_TOLERANCE,
+                  samples=SAMPLED_GOPS, name=None):
+    # Checks that the container opens, the expected streams are present, the duration matches the
+    # requested interval, and that a few sampled GOPs decode. path may also be a URL (outputs in
+    # object storage are probed through a presigned URL). Returns a result dict; 'reasons' is empty
+    # when the output is good.
+    result = new_result(path, expected_duration, name)
+    reasons = result['reasons']
+    if '://' not in path and (not os.path.exists(path) or os.path.getsize(path) == 0):
+        reasons.append("output is missing or empty")
+        return result
+    try:
+        info = media.probe(path)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        reasons.append(f"container could not be read: {getattr(e, 'stderr', None) or e}".strip())
+        return result
+
+    codec_types = [stream.get('codec_type') for stream in info.get('streams', [])]
+    if 'video' not in codec_types:
+        reasons.append("no video stream")
+    if expect_audio and 'audio' not in codec_types:
+        reasons.append("no audio stream")
+
+    duration = float(info.get('format', {}).get('duration') or 0)
+    result['duration'] = duration
+    if expected_duration is not None and abs(duration - expected_duration) > tolerance:
+        reasons.append(f"duration {duration:.2f}s differs from the requested {expected_duration:.2f}s "
+                       f"by more than {tolerance}s")
+
+    if 'video' in codec_types:
+        keyframes = media.read_keyframes(path)
+        if not keyframes:
+            reasons.append("video stream has no keyframes")
+        for index in sample_keyframes(keyframes, samples):
+            end = keyframes[index + 1] if index + 1 < len(keyframes) else duration
+            error = decode_gop(path, keyframes[index], end - keyframes[index])
+            if error:
+                reasons.append(f"GOP at {keyframes[index]:.2f}s does not decode: {error}")
+
+    result['ok'] = not reasons
+    return result
+
+def record_manifest(output_dir, result):
+    # One entry per output file in <output_dir>/manifest.json
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r') as file:
+                manifest = json.load(file)
+        except ValueError:
+            print(f"Replacing unreadable manifest {manifest_path}")
+    manifest[result['file']] = result
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def describe_failure(result):
+    return f"{result['file']}: {'; '.join(result['reasons'])}"
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify cut outputs with sampled probes and record them in the manifest.')
+    parser.add_argument('paths', nargs='+', help='Output files to verify')
+    parser.add_argument('-expected_duration', type=float, help='Requested duration in seconds', default=None)
+    parser.add_argument('-no_audio', action='store_true', help='Do not require an audio stream')
+    parser.add_argument('-samples', type=int, help='GOPs decoded per file', default=SAMPLED_GOPS)
+    parser.add_argument('-no_manifest', action='store_true', help='Only print the results')
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.paths:
+        result = verify_output(path, args.expected_duration, expect_audio=not args.no_audio, samples=args.samples)
+        if not args.no_manifest:
+            record_manifest(os.path.dirname(os.path.abspath(path)), result)
+        if result['ok']:
+            print(f"{path}: OK ({result['duration']:.2f}s)")
+        else:
+            failed += 1
+            print(f"{path}: FAILED - {'; '.join(result['reasons'])}")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import re
+from urllib.parse import urlparse, parse_qs
+
+VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_HOSTS = ('youtube.com', 'youtube-nocookie.com')
+PATH_PREFIXES = ('shorts', 'embed', 'live', 'v', 'e')
+
+def canonical_video_id(video_url):
+    # Resolves watch?v=, youtu.be/, /shorts/, /embed/ and /live/ URLs (with any extra
+    # parameters such as &t= or &list=) as well as bare IDs to the 11-character video ID.
+    video_url = video_url.strip()
+    if VIDEO_ID_RE.match(video_url):
+        return video_url
+    if '://' not in video_url:
+        video_url = f"https://{video_url}"
+
+    parsed = urlparse(video_url)
+    host = (parsed.hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    parts = [part for part in parsed.path.split('/') if part]
+
+    candidate = None
+    if host == 'youtu.be' and parts:
+        candidate = parts[0]
+    elif host in YOUTUBE_HOSTS:
+        query = parse_qs(parsed.query)
+        if 'v' in query:
+            candidate = query['v'][0]
+        elif len(parts) >= 2 and parts[0] in PATH_PREFIXES:
+            candidate = parts[1]
+
+    if candidate and VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+def canonical_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
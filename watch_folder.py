@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import importlib.util
+import os
+import select
+import shutil
+import sqlite3
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+import chapter_parser
+import encoder_profiles
+import planner
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.webm', '.m4v')
+APP_INTERVALS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app-intervals.py')
+STAGING_PREFIX = '.partial-'
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+_app_intervals = None
+
+def app_intervals():
+    # app-intervals.py cannot be imported by name because of the dash in it
+    global _app_intervals
+    if _app_intervals is None:
+        spec = importlib.util.spec_from_file_location('app_intervals', APP_INTERVALS_PATH)
+        _app_intervals = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_app_intervals)
+    return _app_intervals
+
+class InotifyWatcher:
+    # Wakes the scan loop when a file in the directory is closed after writing, moved in or deleted
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f'inotify_add_watch failed for {path}')
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        names = []
+        if readable:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = struct.unpack_from('iIII', data, offset)
+                names.append(data[offset + 16:offset + 16 + length].rstrip(b'\0').decode('utf-8', 'replace'))
+                offset += 16 + length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    # Fallback where inotify is not available: the directory is rescanned every interval
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return []
+
+    def close(self):
+        pass
+
+def make_watcher(path, poll):
+    if not poll:
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            print(f"inotify is not available ({e}); polling {path} instead.")
+    return PollingWatcher()
+
+class WatchState:
+    # Which video/intervals pairs have been handled. A pair is identified by the size and mtime of
+    # the video and the content of the intervals file, so a replaced file is picked up again.
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS watched_files (
+            video_path TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            status TEXT NOT NULL,
+            output_dir TEXT,
+            error TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (video_path, signature)
+        )''')
+        # A pair still marked as processing was interrupted by a restart; cut it again
+        self.conn.execute("DELETE FROM watched_files WHERE status = 'processing'")
+        self.conn.commit()
+
+    def status(self, video_path, signature):
+        row = self.conn.execute('SELECT status FROM watched_files WHERE video_path = ? AND signature = ?',
+                                (video_path, signature)).fetchone()
+        return row[0] if row else None
+
+    def set(self, video_path, signature, status, output_dir=None, error=None):
+        self.conn.execute('INSERT OR REPLACE INTO watched_files VALUES (?, ?, ?, ?, ?, ?)',
+                          (video_path, signature, status, output_dir, error, time.time()))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def file_signature(video_path, intervals_path):
+    video_stat = os.stat(video_path)
+    with open(intervals_path, 'rb') as file:
+        intervals_hash = hashlib.sha1(file.read()).hexdigest()
+    return f"{video_stat.st_size}:{video_stat.st_mtime_ns}:{intervals_hash}"
+
+def find_pairs(watch_dir):
+    # <name>.mp4 (or another video extension) next to <name>.json
+    pairs = []
+    for name in sorted(os.listdir(watch_dir)):
+        stem, extension = os.path.splitext(name)
+        if name.startswith('.') or extension.lower() not in VIDEO_EXTENSIONS:
+            continue
+        intervals_path = os.path.join(watch_dir, stem + '.json')
+        if os.path.isfile(intervals_path):
+            pairs.append((stem, os.path.join(watch_dir, name), intervals_path))
+    return pairs
+
+def cut_interval(video_path, start, end, title, staging_dir, profile_name, threads):
+    # Runs in a worker process; one interval per task so a single long video also uses every core
+    app = app_intervals()
+    output_filename = f"{app.sanitize_filename(title)}.mp4"
+    app.trim_video(video_path, start, end, output_filename, staging_dir, None,
+                   profile=encoder_profiles.get_profile(profile_name, threads))
+    return os.path.exists(os.path.join(staging_dir, output_filename))
+
+class WatchFolder:
+    def __init__(self, watch_dir, output_root, state, workers, profile_name, threads, settle_seconds):
+        self.watch_dir = watch_dir
+        self.output_root = output_root
+        self.state = state
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.profile_name = profile_name
+        self.threads = threads
+        self.settle_seconds = settle_seconds
+        self.last_seen = {}
+        self.in_flight = {}
+
+    def is_settled(self, video_path, signature):
+        # A pair is ready once neither file has changed for settle_seconds
+        now = time.monotonic()
+        seen_signature, since = self.last_seen.get(video_path, (None, None))
+        if seen_signature != signature:
+            self.last_seen[video_path] = (signature, now)
+            return False
+        return now - since >= self.settle_seconds
+
+    def scan(self):
+        for stem, video_path, intervals_path in find_pairs(self.watch_dir):
+            if video_path in self.in_flight:
+                continue
+            try:
+                signature = file_signature(video_path, intervals_path)
+            except OSError:
+                continue
+            if self.state.status(video_path, signature) or not self.is_settled(video_path, signature):
+                continue
+            self.submit(stem, video_path, intervals_path, signature)
+
+    def submit(self, stem, video_path, intervals_path, signature):
+        try:
+            # load_intervals already normalizes to milliseconds; the cuts are re-encoded, so starts stay exact
+            intervals, issues = planner.validate_intervals(planner.load_intervals(intervals_path), None)
+        except (OSError, ValueError, TypeError, IndexError) as e:
+            print(f"Invalid intervals file {intervals_path}: {e}")
+            self.state.set(video_path, signature, 'failed', error=str(e))
+            return
+        for issue in issues:
+            print(f"Interval issue in '{stem}': {issue}")
+        if not intervals:
+            print(f"No valid intervals in {intervals_path}. Skipping.")
+            self.state.set(video_path, signature, 'failed', error='no valid intervals')
+            return
+
+        # Keyed by the file name, since talk.mp4 and talk.mkv can both pair with talk.json
+        staging_dir = os.path.join(self.output_root, f"{STAGING_PREFIX}{os.path.basename(video_path)}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        futures = [self.executor.submit(cut_interval, video_path, start, end, title, staging_dir,
+                                        self.profile_name, self.threads)
+                   for start, end, title in chapter_parser.chapters_to_intervals(intervals, open_end=None)]
+        self.in_flight[video_path] = (stem, signature, staging_dir, futures)
+        self.state.set(video_path, signature, 'processing')
+        print(f"Cutting {len(futures)} intervals from {video_path}")
+
+    def collect(self):
+        for video_path, (stem, signature, staging_dir, futures) in list(self.in_flight.items()):
+            if not all(future.done() for future in futures):
+                continue
+            del self.in_flight[video_path]
+            failed = sum(1 for future in futures if future.exception() or not future.result())
+            if failed:
+                print(f"{failed} of {len(futures)} cuts failed for {video_path}")
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                self.state.set(video_path, signature, 'failed', error=f'{failed} cuts failed')
+                continue
+            # The outputs appear under their final name all at once: the name is reserved through
+            # setup_output_directory and the finished staging directory is renamed onto it
+            output_directory = app_intervals().setup_output_directory(stem, output_root=self.output_root)
+            os.replace(staging_dir, output_directory)
+            self.state.set(video_path, signature, 'done', output_dir=output_directory)
+            print(f"Finished {video_path}: {output_directory}")
+
+    def run(self, watcher, once=False):
+        while True:
+            self.scan()
+            self.collect()
+            if once and not self.in_flight and not self.pending():
+                return
+            watcher.wait(min(1.0, self.settle_seconds) if self.in_flight or self.pending() else 5.0)
+
+    def pending(self):
+        # Pairs seen but not yet settled, for -once runs
+        return [path for path, (signature, _) in self.last_seen.items()
+                if os.path.exists(path) and path not in self.in_flight and not self.state.status(path, signature)]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch a directory for videos with intervals JSON files and cut them.')
+    parser.add_argument('-watch_dir', type=str, help='Directory receiving <name>.mp4 and <name>.json pairs', required=True)
+    parser.add_argument('-output_root', type=str, help='Directory the output directories are created in', default=None)
+    parser.add_argument('-state_db', type=str, help='SQLite file recording handled pairs (default: .watch_state.sqlite in -watch_dir)', default=None)
+    parser.add_argument('-workers', type=int, help='Cuts running at the same time', default=os.cpu_count() or 1)
+    parser.add_argument('-settle', type=float, help='Seconds a pair must stay unchanged before it is cut', default=2.0)
+    parser.add_argument('-poll', action='store_true', help='Poll the directory instead of using inotify')
+    parser.add_argument('-once', action='store_true', help='Process what is in the directory and exit')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile trading speed against quality and size')
+    parser.add_argument('-threads', type=int, default=1, help='Encoder threads per cut (the pool already runs one cut per core)')
+    args = parser.parse_args()
+
+    watch_dir = os.path.abspath(args.watch_dir)
+    output_root = os.path.abspath(args.output_root or os.getcwd())
+    os.makedirs(output_root, exist_ok=True)
+    state = WatchState(args.state_db or os.path.join(watch_dir, '.watch_state.sqlite'))
+    watcher = make_watcher(watch_dir, args.poll)
+    daemon = WatchFolder(watch_dir, output_root, state, args.workers, args.profile, args.threads, args.settle)
+    print(f"Watching {watch_dir} with {args.workers} workers")
+    try:
+        daemon.run(watcher, once=args.once)
+    except KeyboardInterrupt:
+        print("Stopping; waiting for running cuts.")
+    finally:
+        daemon.shutdown()
+        watcher.close()
+        state.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
 
-import requests
 import os
+import sys
 import argparse
 import json
 import re
-import psycopg2
-from moviepy.editor import VideoFileClip
-from pytube import YouTube
-from pytube.exceptions import AgeRestrictedError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from video_ids import canonical_video_id, canonical_url
+import captions
+import chapter_parser
+import downloaders
+import encoder_profiles
+import media
+import planner
+import verify
+import youtube_api
 
 def add_video(youtube_url, title, total_duration):
+    # One row per canonical video ID, whatever URL form the video was submitted under
+    youtube_id = canonical_video_id(youtube_url)
+    import psycopg2
     conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO Video (YouTubeURL, Title, TotalDuration) VALUES (%s, %s, %s) RETURNING VideoID', 
-                   (youtube_url, title, total_duration))
+    cursor.execute('''INSERT INTO Video (YouTubeID, YouTubeURL, Title, TotalDuration) VALUES (%s, %s, %s, %s)
+                      ON CONFLICT (YouTubeID) DO UPDATE SET Title = EXCLUDED.Title RETURNING VideoID''',
+                   (youtube_id, canonical_url(youtube_id), title, total_duration))
     video_id = cursor.fetchone()[0]
     conn.commit()
     cursor.close()
@@ -22,10 +33,56 @@ def add_video(youtube_url, title, total_duration):
     return video_id
 
 def add_chapter(video_id, chapter_title, start_time, end_time):
+    import psycopg2
     conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO Chapter (VideoID, ChapterTitle, StartTime, EndTime) VALUES (%s, %s, %s, %s)', 
+    cursor.execute('''INSERT INTO Chapter (VideoID, ChapterTitle, StartTime, EndTime) VALUES (%s, %s, %s, %s)
+                      ON CONFLICT (VideoID, StartTime, EndTime) DO UPDATE SET ChapterTitle = EXCLUDED.ChapterTitle
+                      RETURNING ChapterID''',
                    (video_id, chapter_title, start_time, end_time))
+    chapter_id = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return chapter_id
+
+def add_caption_segments(video_id, chapter_ids, passages):
+    # passages from captions.align_captions; chapter_ids[i] is the Chapter row of chapter position i
+    import psycopg2
+    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM CaptionSegment WHERE VideoID = %s', (video_id,))
+    cursor.executemany('INSERT INTO CaptionSegment (VideoID, ChapterID, StartMs, EndMs, Text) VALUES (%s, %s, %s, %s, %s)',
+                       [(video_id, chapter_ids[position] if position is not None else None, start_ms, end_ms, text)
+                        for position, start_ms, end_ms, text in passages])
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def search_captions(phrase, limit=20):
+    # Returns [(youtube_id, chapter title, start_ms, headline)], best matches first
+    import psycopg2
+    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    cursor = conn.cursor()
+    cursor.execute('''SELECT v.YouTubeID, c.ChapterTitle, s.StartMs, ts_headline('english', s.Text, q)
+                      FROM CaptionSegment s CROSS JOIN phraseto_tsquery('english', %s) q
+                      JOIN Video v ON v.VideoID = s.VideoID
+                      LEFT JOIN Chapter c ON c.ChapterID = s.ChapterID
+                      WHERE s.TextSearch @@ q
+                      ORDER BY ts_rank(s.TextSearch, q) DESC LIMIT %s''', (phrase, limit))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
+
+def add_output_check(video_id, result):
+    import psycopg2
+    conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASS)
+    cursor = conn.cursor()
+    cursor.execute('''INSERT INTO OutputCheck (VideoID, FileName, Ok, Duration, ExpectedDuration, Reasons)
+                      VALUES (%s, %s, %s, %s, %s, %s)''',
+                   (video_id, result['file'], result['ok'], result['duration'], result['expected_duration'],
+                    '; '.join(result['reasons']) or None))
     conn.commit()
     cursor.close()
     conn.close()
@@ -35,133 +92,130 @@ def sanitize_filename(name):
 
 
 def get_video_description(api_key, video_url):
-    video_id = video_url.split("=")[-1]
-    url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet&id={video_id}&key={api_key}"
-    response = requests.get(url)
+    import requests
+    video_id = canonical_video_id(video_url)
+    url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails&id={video_id}&key={api_key}"
+    response = requests.get(url, timeout=youtube_api.REQUEST_TIMEOUT)
     response_json = response.json()
 
     if "items" in response_json and response_json["items"]:
         video_description = response_json["items"][0]["snippet"]["description"]
         video_title = response_json["items"][0]["snippet"]["title"]
-        return video_description, video_title
+        video_duration = youtube_api.manually_parse_duration(response_json["items"][0]["contentDetails"]["duration"])
+        return video_description, video_title, video_duration
     else:
         print("No items found in API response.")
-        return None, None
-
-
-def download_video(url, resolution=None, output_dir='.'):
-    print(f"Starting to download video from {url}")
-
-    try:
-        yt = YouTube(url)
-        if resolution:
-            stream = yt.streams.filter(progressive=True, res=resolution).first()
-            if not stream:
-                print(f"Requested resolution {resolution} not available. Attempting default resolution.")
-        if not resolution or not stream:
-            stream = yt.streams.filter(progressive=True, res='720p').first()
-            if not stream:
-                print("720p resolution not available, falling back to 480p.")
-                stream = yt.streams.filter(progressive=True, res='480p').first()
-            if not stream:
-                raise Exception("Neither 720p nor 480p resolutions are available.")
-        output_path = os.path.join(output_dir, 'downloaded_video.mp4')
-        stream.download(filename=output_path)
-        print(f"Video downloaded successfully at resolution {stream.resolution}.")
-        return output_path
-    except AgeRestrictedError:
-        print(f"Video {url} is age restricted, skipping.")
-        return None
-    except Exception as e:
-        print(f"Error in downloading video: {e}")
-        raise
+        return None, None, None
 
 
-def trim_video(source_file, start_time, end_time, output_filename, output_dir):
+def trim_video(source_file, start_time, end_time, output_filename, output_dir, profile=None):
+    # Returns the verification result of the output
     output_path = os.path.join(output_dir, output_filename)
 
     # Check if file already exists
     if os.path.exists(output_path):
-        print(f"File '{output_path}' already exists. Skipping.")
-        return
+        # Held to the interval's duration and the source's streams, like a fresh cut
+        start_ms, end_ms = planner.parse_time_ms(start_time), planner.parse_time_ms(end_time)
+        end_seconds = end_ms / 1000.0 if end_ms is not None else media.get_duration(source_file)
+        result = verify.verify_output(output_path, end_seconds - start_ms / 1000.0,
+                                      expect_audio=media.stream_signature(source_file)['audio'] is not None)
+        if result['ok']:
+            print(f"File '{output_path}' already exists. Skipping.")
+            return result
+        print(f"Existing output failed verification ({verify.describe_failure(result)}); cutting it again.")
+        os.remove(output_path)
 
     # Proceed with trimming if the file does not exist
     try:
+        from moviepy.editor import VideoFileClip
         with VideoFileClip(source_file) as video:
             trimmed_video = video.subclip(start_time, end_time)
-            trimmed_video.write_videofile(output_path)
-        print(f"Video trimmed successfully: {output_filename}")
+            expected_duration = trimmed_video.duration
+            has_audio = video.audio is not None
+            trimmed_video.write_videofile(output_path, **encoder_profiles.moviepy_kwargs(profile or encoder_profiles.get_profile()))
     except Exception as e:
         print(f"Error in trimming video: {e}")
+        return verify.failed_result(output_path, f"trimming failed: {e}")
 
+    result = verify.verify_output(output_path, expected_duration, expect_audio=has_audio)
+    if result['ok']:
+        print(f"Video trimmed successfully: {output_filename}")
+    else:
+        print(f"Output failed verification: {verify.describe_failure(result)}")
+    return result
 
-def process_videos(source, intervals, resolution, output_dir, use_local=False, titles=None):
-    source_file = source if use_local else download_video(source, resolution, output_dir)
+
+def process_videos(source, intervals, resolution, output_dir, use_local=False, titles=None, profile=None,
+                   db_video_id=None):
+    source_file = source if use_local else downloaders.download(source, output_dir, resolution=resolution)
+    failures = []
     for i, interval in enumerate(intervals):
         start, end = interval[:2]
         title = titles[i] if titles else f'trimmed_video_{i}'
         output_filename = f"{sanitize_filename(title)}.mp4"
-        trim_video(source_file, start, end, output_filename, output_dir)
+        result = trim_video(source_file, start, end, output_filename, output_dir, profile=profile)
+        verify.record_manifest(output_dir, result)
+        if db_video_id is not None:
+            add_output_check(db_video_id, result)
+        if not result['ok']:
+            failures.append(verify.describe_failure(result))
     if not use_local:
         print(f"Removing original downloaded file: {source_file}")
         os.remove(source_file)
+    if failures:
+        raise verify.VerificationError('; '.join(failures))
 
 
 def extract_segments(api_key, url):
-    description, video_title = get_video_description(api_key, url)
+    description, video_title, video_duration = get_video_description(api_key, url)
     
     if not description:
         print("No description available for video.")
         return None, None, None
 
-    pattern = re.compile(r'(\d{1,2}:\d{2})\s*-?\s*(.*?)\s*(?=\d{1,2}:\d{2}|\Z)')
-    matches = pattern.findall(description)
+    # With the duration, timestamps at or past the end of the video are dropped
+    chapters = chapter_parser.parse_chapters(description, video_duration)
 
-    if not matches:
+    if not chapters:
         print("No segments found in the description.")
         return None, None, None
 
-    timestamps = [match[0] for match in matches]
-    titles = [match[1] for match in matches]
-
-    intervals = []
-    video_duration = None
+    titles = [title for _, _, title in chapters]
 
-    for i in range(len(timestamps)):
-        start_time = timestamps[i]
-        end_time = timestamps[i + 1] if i + 1 < len(timestamps) else None
-        title = titles[i]
+    # The last segment ends at the duration, or runs to the end of the video when it is unknown
+    intervals = chapter_parser.chapters_to_intervals(chapters, open_end=None)
 
-        if end_time is None and video_duration is not None:
-            # Use the video duration as the end time for the last segment
-            end_time = f"{int(video_duration//60):02}:{int(video_duration%60):02}"
-        
-        intervals.append((start_time, end_time, title))
-    
     return intervals, titles, video_title
 
 def main():
     parser = argparse.ArgumentParser(description='Download and trim YouTube videos.')
-    parser.add_argument('-url', type=str, help='URL of the YouTube video', required=True)
-    parser.add_argument('-api_key', type=str, help='YouTube Data API key', required=True)
+    parser.add_argument('-url', type=str, help='URL of the YouTube video')
+    parser.add_argument('-api_key', type=str, help='YouTube Data API key')
+    parser.add_argument('-captions', action='store_true', help='Fetch the captions and store them by chapter in the CaptionSegment table')
+    parser.add_argument('-search', type=str, help='Print the chapters whose captions mention this phrase and exit')
     parser.add_argument('-resolution', type=str, default=None, help='Resolution of the video (e.g., 720p, 1080p). If not specified, defaults to 720p, then 480p.')
     parser.add_argument('-extract_segments', action='store_true', help='Extract video segments from the video description and use them as intervals.')
+    parser.add_argument('-profile', type=str, choices=sorted(encoder_profiles.PROFILES), default=encoder_profiles.DEFAULT_PROFILE, help='Encoder profile trading speed against quality and size')
+    parser.add_argument('-threads', type=int, default=None, help='Encoder threads (defaults to the profile setting)')
     args = parser.parse_args()
 
+    if args.search:
+        for youtube_id, chapter_title, start_ms, headline in search_captions(args.search):
+            print(f"{youtube_id} '{chapter_title}' at {chapter_parser.format_ms(start_ms)}: {headline}")
+        return
+    if not args.url or not args.api_key:
+        parser.error("-url and -api_key are required unless -search is given")
+
     # Create the database and tables
     create_database()
 
-    description, video_title = get_video_description(args.api_key, args.url)
+    description, video_title, total_duration = get_video_description(args.api_key, args.url)
     if not description:
         print("No description available for video.")
         return
 
-    # Assuming you have a way to fetch the total duration of the video
-    # total_duration = get_video_total_duration(args.api_key, args.url)  # Implement this function
-    total_duration = 0  # Placeholder, replace with actual duration
-
     # Store video information and get the generated video ID
-    video_id = add_video(args.url, video_title, total_duration)
+    video_id = add_video(args.url, video_title, total_duration or 0)
 
     if args.extract_segments:
         intervals, titles, _ = extract_segments(args.api_key, args.url)
@@ -170,8 +224,16 @@ def main():
             return
 
         # Store chapter information
-        for i, (start_time, end_time, title) in enumerate(intervals):
-            add_chapter(video_id, title, start_time, end_time)
+        chapter_ids = [add_chapter(video_id, title, start_time, end_time)
+                       for start_time, end_time, title in intervals]
+        if args.captions:
+            try:
+                cues = captions.fetch_captions(args.url)
+                chapters = [(planner.parse_time_ms(start_time), planner.parse_time_ms(end_time), title)
+                            for start_time, end_time, title in intervals]
+                add_caption_segments(video_id, chapter_ids, captions.align_captions(cues, chapters))
+            except Exception as e:
+                print(f"Error indexing captions: {e}")
     else:
         print("Chapter extraction not enabled. Exiting.")
         return
@@ -181,7 +243,8 @@ def main():
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    process_videos(args.url, intervals, args.resolution, output_directory, titles=titles)
+    process_videos(args.url, intervals, args.resolution, output_directory, titles=titles, profile=encoder_profiles.get_profile(args.profile, args.threads),
+                   db_video_id=video_id)
 
 if __name__ == "__main__":
     main()
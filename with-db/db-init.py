@@ -12,6 +12,7 @@ def create_tables():
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS Video (
         VideoID SERIAL PRIMARY KEY,
+        YouTubeID TEXT UNIQUE,
         YouTubeURL TEXT NOT NULL,
         Title TEXT NOT NULL,
         TotalDuration INTEGER NOT NULL
@@ -25,6 +26,48 @@ def create_tables():
         EndTime TEXT NOT NULL,
         FOREIGN KEY (VideoID) REFERENCES Video (VideoID)
     )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS OutputCheck (
+        CheckID SERIAL PRIMARY KEY,
+        VideoID INTEGER NOT NULL,
+        FileName TEXT NOT NULL,
+        Ok BOOLEAN NOT NULL,
+        Duration REAL,
+        ExpectedDuration REAL,
+        Reasons TEXT,
+        CheckedAt TIMESTAMP NOT NULL DEFAULT NOW(),
+        FOREIGN KEY (VideoID) REFERENCES Video (VideoID)
+    )''')
+    # Caption passages aligned to chapters; the generated tsvector column and its GIN index make
+    # phrase lookups (phraseto_tsquery) an index scan
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS CaptionSegment (
+        SegmentID SERIAL PRIMARY KEY,
+        VideoID INTEGER NOT NULL,
+        ChapterID INTEGER,
+        StartMs INTEGER NOT NULL,
+        EndMs INTEGER NOT NULL,
+        Text TEXT NOT NULL,
+        TextSearch tsvector GENERATED ALWAYS AS (to_tsvector('english', Text)) STORED,
+        FOREIGN KEY (VideoID) REFERENCES Video (VideoID),
+        FOREIGN KEY (ChapterID) REFERENCES Chapter (ChapterID)
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS caption_segment_search_idx ON CaptionSegment USING GIN (TextSearch)')
+    # Also applied to databases created before video IDs were canonicalized
+    cursor.execute('ALTER TABLE Video ADD COLUMN IF NOT EXISTS YouTubeID TEXT UNIQUE')
+    # Databases filled before the index may hold the same chapter more than once; the lowest
+    # ChapterID of each interval is kept and caption passages are moved onto it
+    cursor.execute('''
+    UPDATE CaptionSegment SET ChapterID = kept.ChapterID
+    FROM Chapter AS duplicate, (SELECT VideoID, StartTime, EndTime, MIN(ChapterID) AS ChapterID
+                                FROM Chapter GROUP BY VideoID, StartTime, EndTime) AS kept
+    WHERE CaptionSegment.ChapterID = duplicate.ChapterID AND duplicate.VideoID = kept.VideoID
+      AND duplicate.StartTime = kept.StartTime AND duplicate.EndTime = kept.EndTime
+      AND duplicate.ChapterID <> kept.ChapterID''')
+    cursor.execute('''
+    DELETE FROM Chapter WHERE ChapterID NOT IN (
+        SELECT MIN(ChapterID) FROM Chapter GROUP BY VideoID, StartTime, EndTime)''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS chapter_interval_idx ON Chapter (VideoID, StartTime, EndTime)')
     conn.commit()
     cursor.close()
     conn.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os
+import re
+from urllib.parse import urlparse, parse_qs
+
+# Overridable so the ingestion can be pointed at a local fake of the Data API
+API_BASE = os.environ.get('YOUTUBE_API_BASE', 'https://www.googleapis.com/youtube/v3')
+MAX_RESULTS = 50
+# Seconds to wait for a connection or a response, so a stalled request is retried instead of hanging
+REQUEST_TIMEOUT = 30
+
+_session = None
+
+def get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+def api_get(api_key, resource, params):
+    params = dict(params, key=api_key)
+    response = get_session().get(f"{API_BASE}/{resource}", params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+def manually_parse_duration(duration_str):
+    try:
+        match = re.match(r'P(?:(\d+)D)?T?(\d+H)?(\d+M)?(\d+S)?', duration_str)
+        days = int(match.group(1)) if match.group(1) else 0
+        hours, minutes, seconds = 0, 0, 0
+        if match.group(2):
+            hours = int(match.group(2)[:-1])
+        if match.group(3):
+            minutes = int(match.group(3)[:-1])
+        if match.group(4):
+            seconds = int(match.group(4)[:-1])
+        return days * 86400 + hours * 3600 + minutes * 60 + seconds
+    except Exception as e:
+        print(f"Error in manually parsing duration: {e}")
+        return None
+
+def parse_playlist_id(playlist):
+    # Accepts a bare playlist ID or any URL carrying a list= parameter
+    query = parse_qs(urlparse(playlist).query)
+    if 'list' in query:
+        return query['list'][0]
+    return playlist
+
+def get_uploads_playlist_id(api_key, channel):
+    # Accepts a channel ID (UC...), an @handle, or a /channel/ or /@handle URL
+    path = urlparse(channel).path if '://' in channel else channel
+    name = path.rstrip('/').split('/')[-1]
+    params = {'part': 'contentDetails'}
+    if name.startswith('@'):
+        params['forHandle'] = name
+    else:
+        params['id'] = name
+    response_json = api_get(api_key, 'channels', params)
+    if not response_json.get('items'):
+        print(f"Channel not found: {channel}")
+        return None
+    return response_json['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+
+def iter_playlist_pages(api_key, playlist_id):
+    page_token = None
+    while True:
+        params = {'part': 'contentDetails', 'playlistId': playlist_id, 'maxResults': MAX_RESULTS}
+        if page_token:
+            params['pageToken'] = page_token
+        response_json = api_get(api_key, 'playlistItems', params)
+        yield [item['contentDetails']['videoId'] for item in response_json.get('items', [])]
+        page_token = response_json.get('nextPageToken')
+        if not page_token:
+            break
+
+def get_videos_details(api_key, video_ids):
+    # One videos.list call per batch of up to 50 IDs; returns {video_id: (description, title, duration)}
+    details = {}
+    for i in range(0, len(video_ids), MAX_RESULTS):
+        batch = video_ids[i:i + MAX_RESULTS]
+        response_json = api_get(api_key, 'videos', {'part': 'snippet,contentDetails', 'id': ','.join(batch),
+                                                    'maxResults': MAX_RESULTS})
+        for item in response_json.get('items', []):
+            details[item['id']] = (item['snippet']['description'], item['snippet']['title'],
+                                   manually_parse_duration(item['contentDetails']['duration']))
+    return details
+
+def iter_playlist_videos(api_key, playlist_id):
+    # Yields (url, description, title, duration) page by page, so callers can start
+    # processing the first videos while the rest of the listing is still being fetched.
+    for video_ids in iter_playlist_pages(api_key, playlist_id):
+        details = get_videos_details(api_key, video_ids)
+        for video_id in video_ids:
+            if video_id not in details:
+                print(f"Skipping unavailable video {video_id}")
+                continue
+            description, title, duration = details[video_id]
+            yield f"https://www.youtube.com/watch?v={video_id}", description, title, duration
+
+def iter_channel_videos(api_key, channel):
+    uploads_playlist_id = get_uploads_playlist_id(api_key, channel)
+    if uploads_playlist_id:
+        yield from iter_playlist_videos(api_key, uploads_playlist_id)